@@ -27,6 +27,10 @@ st.set_page_config(
 
 # Import auth module
 from utils.auth import authenticate, register_user, is_admin
+from utils.instrumentation import begin_run, render_metrics_panel
+
+# Start per-run API/latency metrics (shown to admins in the sidebar)
+begin_run("Beranda")
 
 # Load custom CSS
 def load_css():
@@ -343,7 +347,7 @@ def show_main_app():
         access_info = """
         <div style="padding: 15px; background: rgba(39, 174, 96, 0.15); border-radius: 12px; border-left: 4px solid #27AE60; margin-bottom: 20px;">
             <p style="color: #27AE60; margin: 0;"><strong>🔑 Akses Admin</strong></p>
-            <p style="color: #BDC3C7; margin: 5px 0 0 0; font-size: 0.9em;">Anda memiliki akses penuh: Lihat, Edit, Tambah, Hapus, dan Export data.</p>
+            <p style="color: #BDC3C7; margin: 5px 0 0 0; font-size: 0.9em;">Anda memiliki akses penuh: Lihat, Edit, Tambah, Hapus, Export, dan Import data.</p>
         </div>
         """
     else:
@@ -408,5 +412,6 @@ def show_main_app():
 # Main app logic
 if st.session_state.logged_in:
     show_main_app()
+    render_metrics_panel(st.session_state.role)
 else:
     show_login_page()
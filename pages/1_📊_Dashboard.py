@@ -15,8 +15,9 @@ sys.path.insert(0, str(Path(__file__).parent.parent))
 
 from utils.data_loader import (
     load_all_data, get_statistics, get_kecamatan_list, 
-    get_data_by_kecamatan, load_camat_mukim_geuchik
+    get_data_by_kecamatan, load_camat_mukim_geuchik, query_table
 )
+from utils.instrumentation import begin_run, render_metrics_panel
 
 # Page config
 st.set_page_config(
@@ -31,6 +32,9 @@ if 'logged_in' not in st.session_state or not st.session_state.logged_in:
     st.markdown("[🔐 Kembali ke Halaman Login](/)")
     st.stop()
 
+# Start per-run API/latency metrics (shown to admins in the sidebar)
+begin_run("Dashboard")
+
 # Load custom CSS
 def load_css():
     css_file = Path(__file__).parent.parent / "style.css"
@@ -141,7 +145,7 @@ with col_filter1:
 
 # Show filtered data
 if selected_kecamatan != 'Semua':
-    filtered_df = df_main[df_main['KECAMATAN'] == selected_kecamatan]
+    filtered_df = query_table('camat_mukim_geuchik', {'KECAMATAN': selected_kecamatan})
 else:
     filtered_df = df_main
 
@@ -169,6 +173,9 @@ if selected_kecamatan != 'Semua':
 else:
     st.info(f"📊 Total {len(filtered_df)} gampong di Kota Langsa")
 
+# Admin-only instrumentation panel
+render_metrics_panel(st.session_state.get('role'))
+
 # Footer
 st.markdown("---")
 st.markdown("""
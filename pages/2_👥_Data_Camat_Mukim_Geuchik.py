@@ -13,13 +13,15 @@ sys.path.insert(0, str(Path(__file__).parent.parent))
 
 from utils.data_loader import (
     load_camat_mukim_geuchik, get_kecamatan_list, 
-    get_kemukiman_list, get_gampong_list
+    get_kemukiman_list, get_gampong_list, query_table
 )
 from utils.data_manager import (
-    update_geuchik_name, update_camat_name, update_mukim_name,
+    update_camat_name, update_mukim_name,
     add_gampong, delete_gampong
 )
 from utils.auth import is_admin
+from utils.edit_session import stage_edit, staged_edit, render_edit_queue
+from utils.instrumentation import begin_run, render_metrics_panel
 
 # Page config
 st.set_page_config(
@@ -37,6 +39,9 @@ if 'logged_in' not in st.session_state or not st.session_state.logged_in:
 # Check if user is admin
 user_is_admin = is_admin(st.session_state.get('role'))
 
+# Start per-run API/latency metrics (shown to admins in the sidebar)
+begin_run("Data Camat Mukim Geuchik")
+
 # Load custom CSS
 def load_css():
     css_file = Path(__file__).parent.parent / "style.css"
@@ -85,21 +90,16 @@ with tab_view:
     with col_f3:
         search_text = st.text_input("🔍 Cari (Nama Geuchik/Gampong)", key="search_view")
     
-    # Apply filters
-    filtered_df = df.copy()
-    
-    if filter_kecamatan != 'Semua':
-        filtered_df = filtered_df[filtered_df['KECAMATAN'] == filter_kecamatan]
-    
-    if filter_kemukiman != 'Semua':
-        filtered_df = filtered_df[filtered_df['KEMUKIMAN'] == filter_kemukiman]
-    
-    if search_text:
-        mask = (
-            filtered_df['NAMA GEUCHIK'].str.contains(search_text, case=False, na=False) |
-            filtered_df['GAMPONG'].str.contains(search_text, case=False, na=False)
-        )
-        filtered_df = filtered_df[mask]
+    # Apply filters (indexed query on the SQLite store)
+    filtered_df = query_table(
+        'camat_mukim_geuchik',
+        {
+            'KECAMATAN': filter_kecamatan if filter_kecamatan != 'Semua' else None,
+            'KEMUKIMAN': filter_kemukiman if filter_kemukiman != 'Semua' else None,
+        },
+        search=search_text,
+        search_columns=['NAMA GEUCHIK', 'GAMPONG']
+    )
     
     # Display data
     st.dataframe(
@@ -151,23 +151,18 @@ if user_is_admin:
                     if not current_data.empty:
                         current_name = current_data.iloc[0]['NAMA GEUCHIK']
                         st.info(f"Nama Geuchik saat ini: **{current_name}**")
+                    pending_name = staged_edit('geuchik_name', selected_gampong)
+                    if pending_name:
+                        st.caption(f"⏳ Tertunda: **{pending_name}** (belum disimpan)")
             
             with col_e2:
                 new_name = st.text_input("Nama Geuchik Baru", key="new_geuchik_name")
             
-            if st.button("💾 Simpan Perubahan Geuchik", type="primary"):
+            # Staged in the session queue, written with the sidebar "Simpan"
+            if st.button("➕ Tambahkan ke Perubahan Tertunda", type="primary"):
                 if selected_gampong and new_name:
-                    result = update_geuchik_name(selected_gampong, current_name, new_name)
-                    
-                    success_count = sum(1 for r in result.values() if r.get('updated'))
-                    if success_count > 0:
-                        st.success(f"✅ Berhasil update data di {success_count} file!")
-                        for file_key, res in result.items():
-                            if res.get('updated'):
-                                st.write(f"  - {file_key}: {res['rows']} baris diupdate")
-                        st.rerun()
-                    else:
-                        st.warning("⚠️ Tidak ada data yang diupdate")
+                    stage_edit('geuchik_name', selected_gampong, new_name)
+                    st.rerun()
                 else:
                     st.error("❌ Mohon lengkapi semua field")
         
@@ -265,6 +260,10 @@ if user_is_admin:
             else:
                 st.error("❌ Mohon lengkapi semua field")
 
+# Admin-only pending edits and instrumentation panel
+render_edit_queue(st.session_state.get('role'))
+render_metrics_panel(st.session_state.get('role'))
+
 # Footer
 st.markdown("---")
 st.markdown("""
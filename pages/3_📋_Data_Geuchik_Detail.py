@@ -11,9 +11,13 @@ import sys
 # Add parent directory to path
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
-from utils.data_loader import load_geuchik_detail, get_kecamatan_list
-from utils.data_manager import update_geuchik_detail_all
+from utils.data_loader import (
+    load_geuchik_detail, get_kecamatan_list, query_table,
+    get_distinct_values, get_table_summary
+)
 from utils.auth import is_admin
+from utils.edit_session import stage_edit, staged_edit, form_stamp, render_edit_queue
+from utils.instrumentation import begin_run, render_metrics_panel
 
 # Page config
 st.set_page_config(
@@ -31,6 +35,9 @@ if 'logged_in' not in st.session_state or not st.session_state.logged_in:
 # Check if user is admin
 user_is_admin = is_admin(st.session_state.get('role'))
 
+# Start per-run API/latency metrics (shown to admins in the sidebar)
+begin_run("Data Geuchik Detail")
+
 # Load custom CSS
 def load_css():
     css_file = Path(__file__).parent.parent / "style.css"
@@ -64,15 +71,15 @@ if not df.empty:
         st.subheader("📋 Data Lengkap Geuchik Kota Langsa")
         
         # Display summary
+        summary = get_table_summary('geuchik_detail', ['KECAMATAN'])
         col1, col2, col3 = st.columns(3)
         with col1:
-            st.metric("Total Data", len(df))
+            st.metric("Total Data", summary['rows'])
         with col2:
-            kec_count = df['KECAMATAN'].nunique()
-            st.metric("Kecamatan", kec_count)
+            st.metric("Kecamatan", summary['KECAMATAN'])
         with col3:
-            jabatan_count = df['JABATAN'].value_counts()
-            st.metric("Kepala Desa Definitif", jabatan_count.get('KEPALA DESA', 0))
+            kepala_desa = get_table_summary('geuchik_detail', filters={'JABATAN': 'KEPALA DESA'})
+            st.metric("Kepala Desa Definitif", kepala_desa['rows'])
         
         st.markdown("---")
         
@@ -92,31 +99,26 @@ if not df.empty:
         col_f1, col_f2, col_f3 = st.columns(3)
         
         with col_f1:
-            kecamatan_options = ['Semua'] + sorted([str(x) for x in df['KECAMATAN'].dropna().unique().tolist()])
+            kecamatan_options = ['Semua'] + get_distinct_values('geuchik_detail', 'KECAMATAN')
             selected_kec = st.selectbox("Kecamatan", kecamatan_options)
         
         with col_f2:
-            jabatan_options = ['Semua'] + sorted([str(x) for x in df['JABATAN'].dropna().unique().tolist()])
+            jabatan_options = ['Semua'] + get_distinct_values('geuchik_detail', 'JABATAN')
             selected_jabatan = st.selectbox("Jabatan", jabatan_options)
         
         with col_f3:
             search = st.text_input("🔍 Cari Nama/Desa")
         
-        # Apply filters
-        filtered_df = df.copy()
-        
-        if selected_kec != 'Semua':
-            filtered_df = filtered_df[filtered_df['KECAMATAN'].astype(str) == selected_kec]
-        
-        if selected_jabatan != 'Semua':
-            filtered_df = filtered_df[filtered_df['JABATAN'].astype(str) == selected_jabatan]
-        
-        if search:
-            mask = (
-                filtered_df['NAMA_LENGKAP'].str.contains(search, case=False, na=False) |
-                filtered_df['DESA'].str.contains(search, case=False, na=False)
-            )
-            filtered_df = filtered_df[mask]
+        # Apply filters (indexed query on the SQLite store)
+        filtered_df = query_table(
+            'geuchik_detail',
+            {
+                'KECAMATAN': selected_kec if selected_kec != 'Semua' else None,
+                'JABATAN': selected_jabatan if selected_jabatan != 'Semua' else None,
+            },
+            search=search,
+            search_columns=['NAMA_LENGKAP', 'DESA']
+        )
         
         # Display filtered data
         display_filtered = filtered_df[['KECAMATAN', 'DESA', 'NAMA_LENGKAP', 'JABATAN', 'NO_HP']].copy()
@@ -147,8 +149,19 @@ if not df.empty:
                 if not current_data.empty:
                     row = current_data.iloc[0]
                     
+                    # Prefill with the pending (not yet saved) edit of this desa
+                    pending = staged_edit('geuchik_detail', selected_desa)
+                    if pending:
+                        row = row.copy()
+                        for field, value in pending.items():
+                            if value is not None:
+                                row[field] = value
+                        st.caption("⏳ Form berisi perubahan tertunda yang belum disimpan")
+                    
                     # Use unique key prefix based on selected desa to force refresh
                     key_prefix = f"edit_{selected_desa.replace(' ', '_')}"
+                    # Stamp of the data the form shows, checked when the edit is saved
+                    form_stamp('geuchik_detail', selected_desa, key_prefix)
                     
                     st.markdown("---")
                     st.markdown("### 📝 Form Edit Data")
@@ -246,8 +259,8 @@ if not df.empty:
                     
                     st.markdown("---")
                     
-                    # Save button
-                    if st.button("💾 Simpan Semua Perubahan", type="primary", use_container_width=True):
+                    # Staged in the session queue, written with the sidebar "Simpan"
+                    if st.button("➕ Tambahkan ke Perubahan Tertunda", type="primary", use_container_width=True):
                         # Prepare data dict - format dates with zero padding if provided
                         tgl_formatted = None
                         bln_formatted = None
@@ -282,16 +295,16 @@ if not df.empty:
                             'NO_HP': edit_hp if edit_hp else None
                         }
                         
-                        result = update_geuchik_detail_all(selected_desa, update_data)
-                        if result.get('success'):
-                            st.success("✅ Semua data berhasil diupdate!")
-                            st.rerun()
-                        else:
-                            st.error(f"❌ Gagal: {result.get('error', result.get('message'))}")
+                        stage_edit('geuchik_detail', selected_desa, update_data)
+                        st.rerun()
 
 else:
     st.warning("⚠️ Tidak dapat memuat data. Pastikan file Excel tersedia.")
 
+# Admin-only pending edits and instrumentation panel
+render_edit_queue(st.session_state.get('role'))
+render_metrics_panel(st.session_state.get('role'))
+
 # Footer
 st.markdown("---")
 st.markdown("""
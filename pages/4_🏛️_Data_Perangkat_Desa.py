@@ -11,9 +11,13 @@ import sys
 # Add parent directory to path
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
-from utils.data_loader import load_perangkat_desa
-from utils.data_manager import update_perangkat_desa_all, add_kadus, delete_kadus
+from utils.data_loader import load_perangkat_desa, query_table, get_distinct_values, get_table_summary
+from utils.data_manager import add_kadus, delete_kadus
 from utils.auth import is_admin
+from utils.edit_session import stage_edit, staged_edit, form_stamp, render_edit_queue
+from utils.write_queue import submit_write
+from utils.row_index import normalize_number
+from utils.instrumentation import begin_run, render_metrics_panel
 
 # Page config
 st.set_page_config(
@@ -31,6 +35,9 @@ if 'logged_in' not in st.session_state or not st.session_state.logged_in:
 # Check if user is admin
 user_is_admin = is_admin(st.session_state.get('role'))
 
+# Start per-run API/latency metrics (shown to admins in the sidebar)
+begin_run("Data Perangkat Desa")
+
 # Load custom CSS
 def load_css():
     css_file = Path(__file__).parent.parent / "style.css"
@@ -69,18 +76,16 @@ if not df.empty:
         st.subheader("📋 Data Kepala Desa & Perangkat Desa")
         
         # Summary stats
+        summary = get_table_summary('perangkat_desa', ['KECAMATAN', 'DESA', 'JABATAN'])
         col1, col2, col3, col4 = st.columns(4)
         with col1:
-            st.metric("Total Data", len(df))
+            st.metric("Total Data", summary['rows'])
         with col2:
-            kec_count = df['KECAMATAN'].nunique()
-            st.metric("Kecamatan", kec_count)
+            st.metric("Kecamatan", summary['KECAMATAN'])
         with col3:
-            desa_count = df['DESA'].nunique()
-            st.metric("Desa", desa_count)
+            st.metric("Desa", summary['DESA'])
         with col4:
-            jabatan_count = df['JABATAN'].nunique()
-            st.metric("Jenis Jabatan", jabatan_count)
+            st.metric("Jenis Jabatan", summary['JABATAN'])
         
         st.markdown("---")
         
@@ -88,43 +93,39 @@ if not df.empty:
         col_f1, col_f2, col_f3 = st.columns(3)
         
         with col_f1:
-            kecamatan_options = ['Semua'] + sorted([str(x) for x in df['KECAMATAN'].dropna().unique().tolist()])
+            kecamatan_options = ['Semua'] + get_distinct_values('perangkat_desa', 'KECAMATAN')
             selected_kec = st.selectbox("Filter Kecamatan", kecamatan_options, key="view_kec")
         
         with col_f2:
-            if selected_kec != 'Semua':
-                desa_options = ['Semua'] + sorted([str(x) for x in df[df['KECAMATAN'].astype(str) == selected_kec]['DESA'].dropna().unique().tolist()])
-            else:
-                desa_options = ['Semua'] + sorted([str(x) for x in df['DESA'].dropna().unique().tolist()])
+            kec_filter = {'KECAMATAN': selected_kec if selected_kec != 'Semua' else None}
+            desa_options = ['Semua'] + get_distinct_values('perangkat_desa', 'DESA', kec_filter)
             selected_desa = st.selectbox("Filter Desa", desa_options, key="view_desa")
         
         with col_f3:
-            jabatan_options = ['Semua'] + sorted([str(x) for x in df['JABATAN'].dropna().unique().tolist()])
+            jabatan_options = ['Semua'] + get_distinct_values('perangkat_desa', 'JABATAN')
             selected_jabatan = st.selectbox("Filter Jabatan", jabatan_options, key="view_jabatan")
         
-        # Apply filters
-        filtered_df = df.copy()
-        
-        if selected_kec != 'Semua':
-            filtered_df = filtered_df[filtered_df['KECAMATAN'].astype(str) == selected_kec]
-        
-        if selected_desa != 'Semua':
-            filtered_df = filtered_df[filtered_df['DESA'].astype(str) == selected_desa]
-        
-        if selected_jabatan != 'Semua':
-            filtered_df = filtered_df[filtered_df['JABATAN'].astype(str) == selected_jabatan]
-        
         # Search
         search = st.text_input("🔍 Cari Nama", key="search_view")
-        if search:
-            filtered_df = filtered_df[filtered_df['NAMA_LENGKAP'].str.contains(search, case=False, na=False)]
+        
+        # Apply filters (indexed query on the SQLite store)
+        filtered_df = query_table(
+            'perangkat_desa',
+            {
+                'KECAMATAN': selected_kec if selected_kec != 'Semua' else None,
+                'DESA': selected_desa if selected_desa != 'Semua' else None,
+                'JABATAN': selected_jabatan if selected_jabatan != 'Semua' else None,
+            },
+            search=search,
+            search_columns=['NAMA_LENGKAP']
+        )
         
         # Display data
         display_df = filtered_df[['KECAMATAN', 'DESA', 'NO_URUT', 'NAMA_LENGKAP', 'JABATAN', 'NO_HP']].copy()
         display_df.columns = ['Kecamatan', 'Desa', 'No', 'Nama Lengkap', 'Jabatan', 'No HP']
         
         st.dataframe(display_df, use_container_width=True, hide_index=True)
-        st.info(f"📊 Menampilkan {len(filtered_df)} dari {len(df)} data")
+        st.info(f"📊 Menampilkan {len(filtered_df)} dari {summary['rows']} data")
     
     # Edit, Add, Delete tabs only for admin
     if user_is_admin:
@@ -153,6 +154,8 @@ if not df.empty:
                 desa_df = desa_df.sort_values('NO_URUT')
                 
                 key_prefix = f"edit_{edit_desa.replace(' ', '_')}"
+                # Stamp of the data the form shows, checked when the edit is saved
+                form_stamp('perangkat_desa', edit_desa, key_prefix)
                 
                 st.markdown("---")
                 st.markdown(f"### 📝 Data Perangkat Desa: **{edit_desa}**")
@@ -160,6 +163,13 @@ if not df.empty:
                 # Get kode desa (NO_DESA)
                 current_kode_desa = str(desa_df.iloc[0]['NO_DESA']) if not desa_df.empty and pd.notna(desa_df.iloc[0]['NO_DESA']) else ''
                 
+                # Prefill with the pending (not yet saved) edit of this desa
+                pending = staged_edit('perangkat_desa', edit_desa)
+                pending_rows = {normalize_number(item['NO_URUT']): item for item in (pending or [])}
+                if pending:
+                    current_kode_desa = pending[0].get('NO_DESA', current_kode_desa)
+                    st.caption("⏳ Form berisi perubahan tertunda yang belum disimpan")
+                
                 # Kode Desa (editable for all)
                 st.markdown("#### 📍 Kode Desa (Kolom 7)")
                 new_kode_desa = st.text_input(
@@ -178,6 +188,11 @@ if not df.empty:
                 with st.form(key=f"edit_form_{key_prefix}"):
                     for idx, row in desa_df.iterrows():
                         no_urut = row['NO_URUT']
+                        staged_row = pending_rows.get(normalize_number(no_urut))
+                        if staged_row:
+                            row = row.copy()
+                            for field in ('NAMA_LENGKAP', 'NIK', 'JENIS_KELAMIN', 'JABATAN', 'NO_HP'):
+                                row[field] = staged_row.get(field, row[field])
                         jabatan = str(row['JABATAN']) if pd.notna(row['JABATAN']) else ''
                         nama = str(row['NAMA_LENGKAP']) if pd.notna(row['NAMA_LENGKAP']) else ''
                         nik = str(row['NIK']) if pd.notna(row['NIK']) else ''
@@ -237,16 +252,12 @@ if not df.empty:
                     
                     st.markdown("---")
                     
-                    # Save button inside form
-                    submitted = st.form_submit_button("💾 Simpan Semua Perubahan", type="primary", use_container_width=True)
+                    # Staged in the session queue, written with the sidebar "Simpan"
+                    submitted = st.form_submit_button("➕ Tambahkan ke Perubahan Tertunda", type="primary", use_container_width=True)
                     
                     if submitted:
-                        result = update_perangkat_desa_all(edit_desa, edited_data)
-                        if result.get('success'):
-                            st.success("✅ Semua data berhasil diupdate!")
-                            st.rerun()
-                        else:
-                            st.error(f"❌ Gagal: {result.get('error', result.get('message'))}")
+                        stage_edit('perangkat_desa', edit_desa, edited_data)
+                        st.rerun()
 
     # Indent ADD and DELETE tabs to be under user_is_admin check
     if user_is_admin:
@@ -305,12 +316,10 @@ if not df.empty:
                             'JABATAN': add_jabatan,
                             'NO_HP': add_hp
                         }
-                        result = add_kadus(kadus_data)
-                        if result.get('success'):
-                            st.success("✅ KADUS berhasil ditambahkan!")
-                            st.rerun()
-                        else:
-                            st.error(f"❌ Gagal: {result.get('error', result.get('message'))}")
+                        # Saved by the background write queue, progress in the sidebar
+                        submit_write(f"Tambah KADUS {add_nama} ({add_desa})", add_kadus, kadus_data,
+                                     key=('add_kadus', add_desa, add_nama, add_jabatan))
+                        st.rerun()
                     else:
                         st.error("❌ Nama dan Jabatan wajib diisi")
         
@@ -353,18 +362,19 @@ if not df.empty:
                             
                             if confirm:
                                 if st.button(f"🗑️ Hapus {nama}", type="primary", key=f"btn_del_{del_desa}_{no_urut}"):
-                                    result = delete_kadus(del_desa, no_urut)
-                                    if result.get('success'):
-                                        st.success("✅ KADUS berhasil dihapus!")
-                                        st.rerun()
-                                    else:
-                                        st.error(f"❌ Gagal: {result.get('error', result.get('message'))}")
+                                    submit_write(f"Hapus KADUS {nama} ({del_desa})", delete_kadus, del_desa, no_urut,
+                                                 key=('delete_kadus', del_desa, str(no_urut)))
+                                    st.rerun()
                 else:
                     st.info("ℹ️ Tidak ada KADUS di desa ini")
 
 else:
     st.warning("⚠️ Tidak dapat memuat data. Pastikan file Excel tersedia.")
 
+# Admin-only pending edits and instrumentation panel
+render_edit_queue(st.session_state.get('role'))
+render_metrics_panel(st.session_state.get('role'))
+
 # Footer
 st.markdown("---")
 st.markdown("""
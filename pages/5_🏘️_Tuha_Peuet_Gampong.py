@@ -11,9 +11,12 @@ import sys
 # Add parent directory to path
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
-from utils.data_loader import load_tuha_peuet
-from utils.data_manager import update_tuha_peuet_all, add_tuha_peuet, delete_tuha_peuet
+from utils.data_loader import load_tuha_peuet, query_table, get_distinct_values, get_table_summary
+from utils.data_manager import add_tuha_peuet, delete_tuha_peuet
 from utils.auth import is_admin
+from utils.edit_session import stage_edit, staged_edit, form_stamp, render_edit_queue
+from utils.row_index import normalize_number
+from utils.instrumentation import begin_run, render_metrics_panel
 
 # Page config
 st.set_page_config(
@@ -31,6 +34,9 @@ if 'logged_in' not in st.session_state or not st.session_state.logged_in:
 # Check if user is admin
 user_is_admin = is_admin(st.session_state.get('role'))
 
+# Start per-run API/latency metrics (shown to admins in the sidebar)
+begin_run("Tuha Peuet Gampong")
+
 # Load custom CSS
 def load_css():
     css_file = Path(__file__).parent.parent / "style.css"
@@ -67,15 +73,14 @@ if not df.empty:
         st.subheader("📋 Data Anggota Tuha Peuet Gampong")
         
         # Summary stats
+        summary = get_table_summary('tuha_peuet', ['KECAMATAN', 'GAMPONG'])
         col1, col2, col3 = st.columns(3)
         with col1:
-            st.metric("Total Anggota", len(df))
+            st.metric("Total Anggota", summary['rows'])
         with col2:
-            kec_count = df['KECAMATAN'].nunique()
-            st.metric("Kecamatan", kec_count)
+            st.metric("Kecamatan", summary['KECAMATAN'])
         with col3:
-            gampong_count = df['GAMPONG'].nunique()
-            st.metric("Gampong", gampong_count)
+            st.metric("Gampong", summary['GAMPONG'])
         
         st.markdown("---")
         
@@ -83,49 +88,43 @@ if not df.empty:
         col_f1, col_f2, col_f3 = st.columns(3)
         
         with col_f1:
-            kecamatan_options = ['Semua'] + sorted([str(x) for x in df['KECAMATAN'].dropna().unique().tolist()])
+            kecamatan_options = ['Semua'] + get_distinct_values('tuha_peuet', 'KECAMATAN')
             selected_kec = st.selectbox("Filter Kecamatan", kecamatan_options, key="view_kec")
         
         with col_f2:
-            if selected_kec != 'Semua':
-                kemukiman_options = ['Semua'] + sorted([str(x) for x in df[df['KECAMATAN'].astype(str) == selected_kec]['KEMUKIMAN'].dropna().unique().tolist()])
-            else:
-                kemukiman_options = ['Semua'] + sorted([str(x) for x in df['KEMUKIMAN'].dropna().unique().tolist()])
+            kec_filter = {'KECAMATAN': selected_kec if selected_kec != 'Semua' else None}
+            kemukiman_options = ['Semua'] + get_distinct_values('tuha_peuet', 'KEMUKIMAN', kec_filter)
             selected_kem = st.selectbox("Filter Kemukiman", kemukiman_options, key="view_kem")
         
         with col_f3:
             if selected_kec != 'Semua':
-                filtered_for_gampong = df[df['KECAMATAN'].astype(str) == selected_kec]
-                if selected_kem != 'Semua':
-                    filtered_for_gampong = filtered_for_gampong[filtered_for_gampong['KEMUKIMAN'].astype(str) == selected_kem]
-                gampong_options = ['Semua'] + sorted([str(x) for x in filtered_for_gampong['GAMPONG'].dropna().unique().tolist()])
+                gampong_filter = dict(kec_filter, KEMUKIMAN=selected_kem if selected_kem != 'Semua' else None)
             else:
-                gampong_options = ['Semua'] + sorted([str(x) for x in df['GAMPONG'].dropna().unique().tolist()])
+                gampong_filter = None
+            gampong_options = ['Semua'] + get_distinct_values('tuha_peuet', 'GAMPONG', gampong_filter)
             selected_gampong = st.selectbox("Filter Gampong", gampong_options, key="view_gampong")
         
-        # Apply filters
-        filtered_df = df.copy()
-        
-        if selected_kec != 'Semua':
-            filtered_df = filtered_df[filtered_df['KECAMATAN'].astype(str) == selected_kec]
-        
-        if selected_kem != 'Semua':
-            filtered_df = filtered_df[filtered_df['KEMUKIMAN'].astype(str) == selected_kem]
-        
-        if selected_gampong != 'Semua':
-            filtered_df = filtered_df[filtered_df['GAMPONG'].astype(str) == selected_gampong]
-        
         # Search
         search = st.text_input("🔍 Cari Nama Anggota", key="search_view")
-        if search:
-            filtered_df = filtered_df[filtered_df['NAMA_ANGGOTA'].str.contains(search, case=False, na=False)]
+        
+        # Apply filters (indexed query on the SQLite store)
+        filtered_df = query_table(
+            'tuha_peuet',
+            {
+                'KECAMATAN': selected_kec if selected_kec != 'Semua' else None,
+                'KEMUKIMAN': selected_kem if selected_kem != 'Semua' else None,
+                'GAMPONG': selected_gampong if selected_gampong != 'Semua' else None,
+            },
+            search=search,
+            search_columns=['NAMA_ANGGOTA']
+        )
         
         # Display data - include JABATAN and SEKRETARIS_TPG to show Sekretaris TPG info
         display_df = filtered_df[['KECAMATAN', 'KEMUKIMAN', 'GAMPONG', 'NO_ANGGOTA', 'NAMA_ANGGOTA', 'JABATAN', 'SEKRETARIS_TPG']].copy()
         display_df.columns = ['Kecamatan', 'Kemukiman', 'Gampong', 'No', 'Nama Anggota', 'Jabatan', 'Sekretaris TPG']
         
         st.dataframe(display_df, use_container_width=True, hide_index=True)
-        st.info(f"📊 Menampilkan {len(filtered_df)} dari {len(df)} data")
+        st.info(f"📊 Menampilkan {len(filtered_df)} dari {summary['rows']} data")
     
     # Admin-only tabs
     if user_is_admin:
@@ -152,8 +151,16 @@ if not df.empty:
                 gampong_df = gampong_df.sort_values('NO_ANGGOTA')
                 
                 key_prefix = f"edit_{edit_gampong.replace(' ', '_')}"
+                # Stamp of the data the form shows, checked when the edit is saved
+                form_stamp('tuha_peuet', edit_gampong, key_prefix)
                 
                 st.markdown(f"### 📝 Data Tuha Peuet: **{edit_gampong}**")
+                
+                # Prefill with the pending (not yet saved) edit of this gampong
+                pending = staged_edit('tuha_peuet', edit_gampong)
+                pending_rows = {normalize_number(item['NO_ANGGOTA']): item for item in (pending or [])}
+                if pending:
+                    st.caption("⏳ Form berisi perubahan tertunda yang belum disimpan")
                 st.markdown("---")
                 
                 edited_data = []
@@ -175,6 +182,12 @@ if not df.empty:
                     
                     keterangan = str(row.get('KETERANGAN', '')) if pd.notna(row.get('KETERANGAN', '')) else ''
                     
+                    staged_row = pending_rows.get(normalize_number(no_anggota))
+                    if staged_row:
+                        nama = staged_row.get('NAMA_ANGGOTA', nama)
+                        current_jk = staged_row.get('JENIS_KELAMIN', current_jk)
+                        keterangan = staged_row.get('KETERANGAN', keterangan)
+                    
                     row_key = f"{key_prefix}_{idx}_{no_anggota}"
                     
                     with st.expander(f"**{no_anggota}. {nama}**", expanded=False):
@@ -201,13 +214,10 @@ if not df.empty:
                 
                 st.markdown("---")
                 
-                if st.button("💾 Simpan Semua Perubahan", type="primary", use_container_width=True):
-                    result = update_tuha_peuet_all(edit_gampong, edited_data)
-                    if result.get('success'):
-                        st.success("✅ Semua data berhasil diupdate!")
-                        st.rerun()
-                    else:
-                        st.error(f"❌ Gagal: {result.get('error', result.get('message'))}")
+                # Staged in the session queue, written with the sidebar "Simpan"
+                if st.button("➕ Tambahkan ke Perubahan Tertunda", type="primary", use_container_width=True):
+                    stage_edit('tuha_peuet', edit_gampong, edited_data)
+                    st.rerun()
         
         with tab_edit_sek:
             st.subheader("📝 Edit Sekretaris TPG")
@@ -386,6 +396,10 @@ if not df.empty:
 else:
     st.warning("⚠️ Tidak dapat memuat data. Pastikan file Excel tersedia.")
 
+# Admin-only pending edits and instrumentation panel
+render_edit_queue(st.session_state.get('role'))
+render_metrics_panel(st.session_state.get('role'))
+
 # Footer
 st.markdown("---")
 st.markdown("""
@@ -7,13 +7,17 @@ import streamlit as st
 import pandas as pd
 from pathlib import Path
 import sys
+import time
 from io import BytesIO
 import zipfile
 
 # Add parent directory to path
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
-from utils.data_loader import load_all_data
+from utils.data_loader import STORE_TABLES
+from utils.export_cache import cached_export
+from utils.write_queue import DONE, get_export_executor, report_progress, submit_session_job
+from utils.instrumentation import begin_run, render_metrics_panel
 
 # Page config
 st.set_page_config(
@@ -22,6 +26,9 @@ st.set_page_config(
     layout="wide"
 )
 
+# Start per-run API/latency metrics (shown to admins in the sidebar)
+begin_run("Export Data")
+
 # Load custom CSS
 def load_css():
     css_file = Path(__file__).parent.parent / "style.css"
@@ -75,20 +82,113 @@ from utils.excel_exporter import ExcelExporter
 # Initialize exporter with current directory as base path (where templates are)
 exporter = ExcelExporter(Path(__file__).parent.parent)
 
-def get_excel_download(key, df):
-    """Get Excel file as bytes using template exporter"""
-    try:
-        if key == 'camat_mukim_geuchik':
-            return exporter.export_camat_mukim_geuchik(df)
-        elif key == 'geuchik_detail':
-            return exporter.export_geuchik_detail(df)
-        elif key == 'perangkat_desa':
-            return exporter.export_perangkat_desa(df)
-        elif key == 'tuha_peuet':
-            return exporter.export_tuha_peuet(df)
-    except Exception as e:
-        st.error(f"Error exporting {key}: {e}")
-        return None
+def build_excel(key, df):
+    """Build Excel file as bytes using template exporter"""
+    if key == 'camat_mukim_geuchik':
+        return exporter.export_camat_mukim_geuchik(df)
+    elif key == 'geuchik_detail':
+        return exporter.export_geuchik_detail(df)
+    elif key == 'perangkat_desa':
+        return exporter.export_perangkat_desa(df)
+    elif key == 'tuha_peuet':
+        return exporter.export_tuha_peuet(df)
+
+def load_dataset(key):
+    """Load the current data of a dataset (DataFrame, possibly empty)"""
+    return STORE_TABLES[key][1]()
+
+def prepare_file(key):
+    """Export job: build one Excel file, reused until its source sheet changes"""
+    report_progress(0.1, "Memuat data")
+    df = load_dataset(key)
+    if df is None or df.empty:
+        return {'success': False, 'message': 'Data tidak tersedia'}
+    report_progress(0.4, "Membuat file Excel")
+    data = cached_export(key, [key], lambda: build_excel(key, df))
+    return {'success': True, 'data': data}
+
+def create_zip_archive():
+    """Create ZIP archive containing all Excel files (None if no data is available)"""
+    zip_buffer = BytesIO()
+    written = 0
+    
+    with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
+        for i, (key, info) in enumerate(file_info.items()):
+            report_progress(i / len(file_info), f"Menyiapkan {info['title']}")
+            df = load_dataset(key)
+            if df is not None and not df.empty:
+                # Create Excel in memory
+                excel_buffer = BytesIO()
+                with pd.ExcelWriter(excel_buffer, engine='openpyxl') as writer:
+                    df.to_excel(writer, index=False, sheet_name='Sheet1')
+                
+                # Write to zip
+                zip_file.writestr(info['filename'], excel_buffer.getvalue())
+                written += 1
+    
+    zip_buffer.seek(0)
+    return zip_buffer.getvalue() if written else None
+
+def prepare_zip():
+    """Export job: build the ZIP of all files"""
+    data = cached_export('all_zip', list(file_info), create_zip_archive)
+    if not data:
+        return {'success': False, 'message': 'Data tidak tersedia'}
+    return {'success': True, 'data': data}
+
+# Prepared files of this session: artifact -> (bytes, prepared at),
+# running export jobs: artifact -> job id
+FILES_KEY = "_export_files"
+JOBS_KEY = "_export_jobs"
+prepared = st.session_state.setdefault(FILES_KEY, {})
+export_jobs = st.session_state.setdefault(JOBS_KEY, {})
+executor = get_export_executor()
+
+def collect_exports():
+    """Move finished export jobs of this session into the prepared files"""
+    for artifact, job_id in list(export_jobs.items()):
+        job = executor.get(job_id)
+        if job is None:
+            del export_jobs[artifact]
+        elif job.done:
+            del export_jobs[artifact]
+            executor.forget(job_id)
+            if job.status == DONE:
+                prepared[artifact] = (job.result['data'], time.strftime("%H:%M:%S"))
+            else:
+                st.error(f"❌ Gagal menyiapkan {job.label}: {job.message()}")
+
+@st.fragment(run_every=1.0)
+def export_progress(artifact):
+    """Polls the export job of an artifact; reruns the page once it is done"""
+    job = executor.get(export_jobs.get(artifact))
+    if job is None or job.done:
+        st.rerun(scope="app")
+    st.progress(job.progress, text=f"⏳ {job.progress_text or 'Menunggu antrean'}...")
+
+def export_controls(artifact, label, filename, mime, prepare, *args):
+    """Siapkan → Unduh: queue the export job on request, then offer the prepared bytes"""
+    if artifact in export_jobs:
+        export_progress(artifact)
+        return
+    if artifact in prepared:
+        data, prepared_at = prepared[artifact]
+        st.download_button(
+            label=f"⬇️ Unduh {label}",
+            data=data,
+            file_name=filename,
+            mime=mime,
+            key=f"download_{artifact}"
+        )
+        st.caption(f"Disiapkan pukul {prepared_at}")
+        refresh = st.button("🔄 Siapkan Ulang", key=f"prepare_{artifact}")
+    else:
+        refresh = st.button(f"⚙️ Siapkan {label}", key=f"prepare_{artifact}")
+    if refresh:
+        export_jobs[artifact] = submit_session_job(executor, filename, prepare, *args, key=artifact)
+        st.rerun()
+
+collect_exports()
 
 # Export section
 st.subheader("📂 Pilih File untuk Diunduh")
@@ -96,16 +196,13 @@ st.subheader("📂 Pilih File untuk Diunduh")
 st.markdown("""
 <div style="padding: 15px; background: rgba(52, 152, 219, 0.1); border-radius: 8px; border-left: 3px solid #3498DB; margin-bottom: 20px;">
     <p style="color: #E0E0E0; margin: 0;"><strong>ℹ️ Format Asli</strong><br>
-    <span style="color: #BDC3C7;">File yang diunduh menggunakan format Excel asli desa.</span></p>
+    <span style="color: #BDC3C7;">File yang diunduh menggunakan format Excel asli desa. Klik "Siapkan" untuk membuat file dari data terbaru, lalu "Unduh".</span></p>
 </div>
 """, unsafe_allow_html=True)
 
 # Create download cards in 2 columns
 col1, col2 = st.columns(2)
 
-# Load data once
-all_data = load_all_data()
-
 for i, (key, info) in enumerate(file_info.items()):
     with col1 if i % 2 == 0 else col2:
         st.markdown(f"""
@@ -115,64 +212,22 @@ for i, (key, info) in enumerate(file_info.items()):
         </div>
         """, unsafe_allow_html=True)
         
-        df = all_data.get(key)
-        
-        if df is not None and not df.empty:
-            # Generate download button
-            # We need to process the export on click or pre-calculate?
-            # Streamlit download button requires data to be ready.
-            # Calculating on the fly might be slow if data is large but it ensures fresh data.
-            # Let's generate it.
-            
-            excel_data = get_excel_download(key, df)
-            
-            if excel_data:
-                st.download_button(
-                    label=f"⬇️ Unduh Excel",
-                    data=excel_data,
-                    file_name=info['filename'],
-                    mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-                    key=f"download_{key}"
-                )
-        else:
-            st.warning(f"⚠️ Data tidak tersedia")
+        # Nothing is loaded or generated until the file is requested
+        export_controls(
+            key, "Excel", info['filename'],
+            "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+            prepare_file, key
+        )
 
 st.markdown("---")
 
 # Download all section
 st.subheader("📦 Unduh Semua File")
 
-def create_zip_archive(data_dict):
-    """Create ZIP archive containing all Excel files"""
-    zip_buffer = BytesIO()
-    
-    with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-        for key, info in file_info.items():
-            df = data_dict.get(key)
-            if df is not None and not df.empty:
-                # Create Excel in memory
-                excel_buffer = BytesIO()
-                with pd.ExcelWriter(excel_buffer, engine='openpyxl') as writer:
-                    df.to_excel(writer, index=False, sheet_name='Sheet1')
-                
-                # Write to zip
-                zip_file.writestr(info['filename'], excel_buffer.getvalue())
-    
-    zip_buffer.seek(0)
-    return zip_buffer.getvalue()
+export_controls("all_zip", "Semua File (ZIP)", "Data_Gampong_Kota_Langsa.zip", "application/zip", prepare_zip)
 
-try:
-    if any(df is not None and not df.empty for df in all_data.values()):
-        zip_data = create_zip_archive(all_data)
-        st.download_button(
-            label="📦 Unduh Semua File (ZIP)",
-            data=zip_data,
-            file_name="Data_Gampong_Kota_Langsa.zip",
-            mime="application/zip",
-            key="download_all"
-        )
-except Exception as e:
-    st.error(f"❌ Gagal membuat arsip: {e}")
+# Admin-only instrumentation panel
+render_metrics_panel(st.session_state.get('role'))
 
 # Footer
 st.markdown("---")
@@ -0,0 +1,148 @@
+"""
+Import Data Page
+Sistem Manajemen Data Gampong - DPMG Langsa
+"""
+
+import streamlit as st
+import pandas as pd
+from pathlib import Path
+import sys
+
+# Add parent directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from utils.data_manager import preview_import, apply_import
+from utils.excel_importer import IMPORT_LAYOUTS, parse_import_workbook
+from utils.auth import is_admin
+from utils.edit_session import render_edit_queue
+from utils.write_queue import submit_write
+from utils.instrumentation import begin_run, render_metrics_panel
+
+# Page config
+st.set_page_config(
+    page_title="Import Data - DPMG Langsa",
+    page_icon="📤",
+    layout="wide"
+)
+
+# Check authentication
+if 'logged_in' not in st.session_state or not st.session_state.logged_in:
+    st.warning("⚠️ Anda harus login terlebih dahulu untuk mengakses halaman ini.")
+    st.markdown("[🔐 Kembali ke Halaman Login](/)")
+    st.stop()
+
+# Import changes data, admin only
+if not is_admin(st.session_state.get('role')):
+    st.warning("⚠️ Halaman ini hanya untuk admin.")
+    st.stop()
+
+# Start per-run API/latency metrics (shown to admins in the sidebar)
+begin_run("Import Data")
+
+# Load custom CSS
+def load_css():
+    css_file = Path(__file__).parent.parent / "style.css"
+    if css_file.exists():
+        with open(css_file) as f:
+            st.markdown(f"<style>{f.read()}</style>", unsafe_allow_html=True)
+
+load_css()
+
+# Title
+st.markdown("""
+<div style="text-align: center; padding: 20px 0;">
+    <h1 style="color: #3498DB;">📤 Import Data dari Excel</h1>
+    <p style="color: #BDC3C7;">Terapkan file Excel perbaikan dari desa sekaligus, tanpa mengetik ulang</p>
+</div>
+""", unsafe_allow_html=True)
+
+st.markdown("---")
+
+st.markdown("""
+<div style="padding: 15px; background: rgba(52, 152, 219, 0.1); border-radius: 8px; border-left: 3px solid #3498DB; margin-bottom: 20px;">
+    <p style="color: #E0E0E0; margin: 0;"><strong>ℹ️ Format File</strong><br>
+    <span style="color: #BDC3C7;">Gunakan format Excel asli desa atau file hasil menu Export Data. Baris dicocokkan per Desa/Gampong dan nomor urut; perubahan ditampilkan dulu sebelum diterapkan.</span></p>
+</div>
+""", unsafe_allow_html=True)
+
+kind = st.radio(
+    "📂 Jenis Data",
+    options=list(IMPORT_LAYOUTS),
+    format_func=lambda k: IMPORT_LAYOUTS[k]['title'],
+    horizontal=True,
+    key="import_kind"
+)
+uploaded = st.file_uploader("📎 Pilih file Excel (.xlsx)", type=["xlsx"], key="import_file")
+delete_missing = st.checkbox(
+    "🗑️ Hapus anggota yang tidak ada di file (hanya untuk Desa/Gampong yang ada di file)",
+    value=False, key="import_delete_missing"
+)
+
+def parsed_upload(uploaded, kind):
+    """Parse the upload once per file and data type"""
+    cache_key = (uploaded.file_id, kind)
+    cached = st.session_state.get('_import_parsed')
+    if cached is None or cached[0] != cache_key:
+        cached = (cache_key, parse_import_workbook(uploaded, kind))
+        st.session_state['_import_parsed'] = cached
+    return cached[1]
+
+if uploaded is not None:
+    try:
+        blocks = parsed_upload(uploaded, kind)
+        diff = preview_import(kind, blocks, delete_missing)
+    except (ValueError, LookupError) as e:
+        st.error(f"❌ {e}")
+        st.stop()
+
+    st.subheader("🔎 Pratinjau Perubahan")
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("Baris Berubah", len(diff['changed']))
+    col2.metric("Baris Baru", len(diff['added']))
+    col3.metric("Baris Dihapus", len(diff['deleted']))
+    col4.metric("Desa/Gampong di File", len(blocks))
+
+    if diff['unknown_blocks']:
+        st.warning(f"⚠️ Tidak ditemukan di database (dilewati): {', '.join(diff['unknown_blocks'])}")
+
+    if diff['changed']:
+        with st.expander(f"✏️ Baris berubah ({len(diff['changed'])})", expanded=True):
+            st.dataframe(pd.DataFrame([
+                {'Desa/Gampong': item['block'], 'No': item['number'], 'Kolom': field, 'Lama': old, 'Baru': new}
+                for item in diff['changed']
+                for field, (old, new) in item['changes'].items()
+            ]), use_container_width=True, hide_index=True)
+
+    if diff['added']:
+        with st.expander(f"➕ Baris baru ({len(diff['added'])})", expanded=True):
+            st.dataframe(pd.DataFrame([
+                {'Desa/Gampong': item['block'], 'No': item['number'], **item['fields']}
+                for item in diff['added']
+            ]), use_container_width=True, hide_index=True)
+
+    if diff['deleted']:
+        with st.expander(f"🗑️ Baris dihapus ({len(diff['deleted'])})", expanded=True):
+            st.dataframe(pd.DataFrame([
+                {'Desa/Gampong': item['block'], 'No': item['number'], 'Nama': item['label']}
+                for item in diff['deleted']
+            ]), use_container_width=True, hide_index=True)
+
+    if not (diff['changed'] or diff['added'] or diff['deleted']):
+        st.success("✅ Data di file sama dengan data saat ini, tidak ada yang perlu diterapkan.")
+    elif st.button("✅ Terapkan Impor", type="primary", key="import_apply"):
+        # Saved by the background write queue, progress in the sidebar
+        submit_write(f"Impor {IMPORT_LAYOUTS[kind]['title']}", apply_import, kind, blocks, delete_missing,
+                     key=('import', uploaded.file_id, kind, delete_missing))
+        st.rerun()
+
+# Admin-only write status and instrumentation panel
+render_edit_queue(st.session_state.get('role'))
+render_metrics_panel(st.session_state.get('role'))
+
+# Footer
+st.markdown("---")
+st.markdown("""
+<div style="text-align: center; padding: 10px;">
+    <p style="color: #7F8C8D; font-size: 0.8em;">Import Data - Sistem Manajemen Data Gampong DPMG Langsa</p>
+</div>
+""", unsafe_allow_html=True)
@@ -0,0 +1,181 @@
+"""QuotaHTTPClient retry policy, tested against a local fake Sheets server"""
+
+import json
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+from gspread.exceptions import APIError
+from gspread.urls import (
+    SPREADSHEET_BATCH_UPDATE_URL, SPREADSHEET_VALUES_APPEND_URL,
+    SPREADSHEET_VALUES_BATCH_UPDATE_URL, SPREADSHEET_VALUES_URL,
+)
+from gspread.utils import quote
+
+from utils.api_quota import ApiQuota, QuotaHTTPClient
+from utils.write_queue import FAILED, WriteExecutor
+
+GOOGLE_BASE = "https://sheets.googleapis.com"
+SLOW_SECONDS = 0.5
+
+
+class FakeSheets(ThreadingHTTPServer):
+    """
+    Answers each request with the next scripted status (200 once the script
+    runs out); "slow" answers 200 after SLOW_SECONDS
+    """
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), FakeHandler)
+        self.script = []
+        self.requests = []
+
+    @property
+    def base(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+
+class FakeHandler(BaseHTTPRequestHandler):
+    def _reply(self):
+        server = self.server
+        length = int(self.headers.get("Content-Length") or 0)
+        if length:
+            self.rfile.read(length)
+        server.requests.append((self.command, self.path))
+        status = server.script.pop(0) if server.script else 200
+        if status == "slow":
+            time.sleep(SLOW_SECONDS)
+            status = 200
+        if status == 200:
+            body = {"spreadsheetId": "sid", "updates": {"updatedRows": 1}}
+        else:
+            body = {"error": {"code": status, "message": "scripted failure", "status": "UNAVAILABLE"}}
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    do_GET = do_POST = do_PUT = _reply
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    fake = FakeSheets()
+    thread = threading.Thread(target=fake.serve_forever, daemon=True)
+    thread.start()
+    yield fake
+    fake.shutdown()
+    fake.server_close()
+
+
+@pytest.fixture
+def client():
+    quota = ApiQuota(reads_per_minute=6000, writes_per_minute=6000, max_retries=3,
+                     backoff_base=0.001, backoff_max=0.002)
+    return QuotaHTTPClient.with_quota(quota)(auth=None, session=requests.Session())
+
+
+def local(server, url):
+    return url.replace(GOOGLE_BASE, server.base)
+
+
+def test_get_is_retried_on_server_error(server, client):
+    server.script = [503, 500]
+    url = local(server, SPREADSHEET_VALUES_URL % ("sid", quote("'Users'!A1:C9")))
+    response = client.request("get", url)
+    assert response.status_code == 200
+    assert len(server.requests) == 3
+    assert client.quota.stats()['retries'] == 2
+
+
+def test_values_update_and_batch_update_are_retried(server, client):
+    server.script = [502]
+    client.request("put", local(server, SPREADSHEET_VALUES_URL % ("sid", quote("'Users'!B2"))), json={})
+    server.script = [500]
+    client.request("post", local(server, SPREADSHEET_VALUES_BATCH_UPDATE_URL % "sid"), json={})
+    assert [method for method, _ in server.requests] == ["PUT", "PUT", "POST", "POST"]
+
+
+@pytest.mark.parametrize("url", [
+    SPREADSHEET_VALUES_APPEND_URL % ("sid", quote("'Users'!A1")),
+    SPREADSHEET_BATCH_UPDATE_URL % "sid",
+])
+def test_append_and_insert_surface_server_errors(server, client, url):
+    # The server may have applied the row before failing: never sent twice
+    server.script = [503]
+    with pytest.raises(APIError) as excinfo:
+        client.request("post", local(server, url), json={})
+    assert excinfo.value.code == 503
+    assert len(server.requests) == 1
+    assert client.quota.stats()['failures'] == 1
+
+
+def test_rate_limited_append_is_retried(server, client):
+    # 429 is rejected before anything is applied
+    server.script = [429]
+    url = local(server, SPREADSHEET_VALUES_APPEND_URL % ("sid", quote("'Users'!A1")))
+    assert client.request("post", url, json={}).status_code == 200
+    assert len(server.requests) == 2
+
+
+def test_get_is_retried_after_a_timeout(server, client):
+    client.set_timeout(0.1)
+    server.script = ["slow"]
+    response = client.request("get", local(server, SPREADSHEET_VALUES_URL % ("sid", "A1")))
+    assert response.status_code == 200
+    assert len(server.requests) == 2
+    assert client.quota.stats()['retries'] == 1
+
+
+def test_timed_out_append_is_not_retried(server, client):
+    client.set_timeout(0.1)
+    server.script = ["slow"]
+    with pytest.raises(requests.exceptions.Timeout):
+        client.request("post", local(server, SPREADSHEET_VALUES_APPEND_URL % ("sid", quote("'Users'!A1"))), json={})
+    assert len(server.requests) == 1
+
+
+def test_connection_errors_are_retried_for_reads_only(client):
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        closed = f"http://127.0.0.1:{sock.getsockname()[1]}"
+    with pytest.raises(requests.exceptions.ConnectionError):
+        client.request("get", SPREADSHEET_VALUES_URL.replace(GOOGLE_BASE, closed) % ("sid", "A1"))
+    assert client.quota.stats()['retries'] == client.quota.max_retries
+    with pytest.raises(requests.exceptions.ConnectionError):
+        client.request("post", (SPREADSHEET_BATCH_UPDATE_URL % "sid").replace(GOOGLE_BASE, closed), json={})
+    assert client.quota.stats()['retries'] == client.quota.max_retries
+
+
+def test_retries_are_bounded(server, client):
+    server.script = [503] * 10
+    with pytest.raises(APIError):
+        client.request("get", local(server, SPREADSHEET_VALUES_URL % ("sid", "A1")))
+    assert len(server.requests) == client.quota.max_retries + 1
+
+
+def test_write_job_is_not_rerun_after_the_client_retried(server, client):
+    server.script = [503] * 10
+    url = local(server, SPREADSHEET_VALUES_BATCH_UPDATE_URL % "sid")
+
+    def save():
+        try:
+            client.request("post", url, json={})
+            return {'success': True}
+        except Exception as e:
+            return {'success': False, 'error': str(e)}
+
+    executor = WriteExecutor(max_attempts=3, retry_delay=0)
+    job_id = executor.submit("save", save, idempotent=True)
+    executor._queue.join()
+    job = executor.get(job_id)
+    assert job.status == FAILED and job.attempts == 1
+    assert len(server.requests) == client.quota.max_retries + 1
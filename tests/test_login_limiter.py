@@ -0,0 +1,27 @@
+"""LoginLimiter: failures for a username only hold back the client making them"""
+
+from utils.login_limiter import LoginLimiter
+
+
+def test_guessing_from_one_client_does_not_lock_out_others():
+    limiter = LoginLimiter(user_limit=3, client_limit=20)
+    waits = [limiter.attempt("admin", "10.0.0.9") for _ in range(4)]
+    assert waits[:3] == [0.0, 0.0, 0.0] and waits[3] > 0
+    assert limiter.attempt("Admin", "10.0.0.1") == 0.0
+
+
+def test_client_limit_covers_all_usernames():
+    limiter = LoginLimiter(user_limit=3, client_limit=5)
+    waits = [limiter.attempt(f"user{i}", "10.0.0.9") for i in range(6)]
+    assert waits[5] > 0
+    assert limiter.attempt("user0", "10.0.0.1") == 0.0
+
+
+def test_success_clears_only_that_client():
+    limiter = LoginLimiter(user_limit=2, client_limit=20)
+    for client in ("10.0.0.1", "10.0.0.9"):
+        limiter.attempt("admin", client)
+        limiter.attempt("admin", client)
+    limiter.succeeded("admin", "10.0.0.1")
+    assert limiter.attempt("admin", "10.0.0.1") == 0.0
+    assert limiter.attempt("admin", "10.0.0.9") > 0
@@ -0,0 +1,32 @@
+"""SheetCache: a failed revision probe falls back to a time limit instead of refetching every view"""
+
+import time
+
+from utils.sheet_cache import SheetCache
+
+
+def failing_probe():
+    raise ConnectionError("drive unavailable")
+
+
+def test_unknown_revision_serves_recent_entries():
+    cache = SheetCache(failing_probe, probe_interval=0, fallback_ttl=60)
+    cache.put("Tuha_Peuet", [["a"]], cache.current_revision())
+    assert cache.current_revision() is None
+    assert cache.get("Tuha_Peuet") == [["a"]]
+    assert cache.snapshot("Tuha_Peuet") == ([["a"]], 1)
+    assert cache.stats()['fallback_hits'] == 2
+
+
+def test_unknown_revision_expires_entries_after_fallback_ttl():
+    cache = SheetCache(failing_probe, probe_interval=0, fallback_ttl=0.05)
+    cache.put("Tuha_Peuet", [["a"]], None)
+    time.sleep(0.1)
+    assert cache.get("Tuha_Peuet") is None
+
+
+def test_known_revision_still_decides():
+    revisions = iter(["1", "2"])
+    cache = SheetCache(lambda: next(revisions), probe_interval=0, fallback_ttl=60)
+    cache.put("Tuha_Peuet", [["a"]], cache.current_revision())
+    assert cache.get("Tuha_Peuet") is None
@@ -0,0 +1,100 @@
+"""SingleFlight under concurrent callers, with a fake backend that counts loads"""
+
+import threading
+import time
+
+from utils.concurrency import SingleFlight
+
+THREADS = 16
+
+
+class FakeBackend:
+    """Slow sheet loads, held until the test releases them"""
+
+    def __init__(self):
+        self.loads = []
+        self.release = threading.Event()
+        self._lock = threading.Lock()
+
+    def load(self, key):
+        with self._lock:
+            self.loads.append(key)
+        assert self.release.wait(timeout=10)
+        # A fresh object per load: callers sharing it got the same load
+        return [[key, len(self.loads)]]
+
+
+def wait_until(condition, timeout=10):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.005)
+
+
+def run_threads(target):
+    results, errors = [None] * THREADS, []
+
+    def call(i):
+        try:
+            results[i] = target()
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=call, args=(i,)) for i in range(THREADS)]
+    for thread in threads:
+        thread.start()
+    return threads, results, errors
+
+
+def test_cold_key_is_loaded_once():
+    flights, backend = SingleFlight(), FakeBackend()
+    threads, results, errors = run_threads(lambda: flights.do("Tuha_Peuet", lambda: backend.load("Tuha_Peuet")))
+
+    # Release the load only once every other caller is waiting on it
+    wait_until(lambda: flights.stats()['coalesced'] == THREADS - 1)
+    backend.release.set()
+    for thread in threads:
+        thread.join(timeout=10)
+
+    assert errors == []
+    assert backend.loads == ["Tuha_Peuet"]
+    assert all(result is results[0] for result in results)
+    assert results[0] == [["Tuha_Peuet", 1]]
+    assert flights.stats() == {'leaders': 1, 'coalesced': THREADS - 1, 'in_flight': []}
+
+
+def test_batch_callers_share_loads_per_key():
+    flights, backend = SingleFlight(), FakeBackend()
+
+    def fetch(keys):
+        return {key: backend.load(key) for key in keys}
+
+    threads, results, errors = run_threads(lambda: flights.do_many(["Users", "Tuha_Peuet"], fetch))
+    wait_until(lambda: flights.stats()['coalesced'] == 2 * (THREADS - 1))
+    backend.release.set()
+    for thread in threads:
+        thread.join(timeout=10)
+
+    assert errors == []
+    assert sorted(backend.loads) == ["Tuha_Peuet", "Users"]
+    assert all(result == results[0] for result in results)
+
+
+def test_error_reaches_every_waiter_and_is_not_remembered():
+    flights, backend = SingleFlight(), FakeBackend()
+
+    def failing():
+        backend.load("Users")
+        raise RuntimeError("quota exceeded")
+
+    threads, results, errors = run_threads(lambda: flights.do("Users", failing))
+    wait_until(lambda: flights.stats()['coalesced'] == THREADS - 1)
+    backend.release.set()
+    for thread in threads:
+        thread.join(timeout=10)
+
+    assert len(errors) == THREADS
+    assert all(str(e) == "quota exceeded" for e in errors)
+    assert backend.loads == ["Users"]
+    # The failed flight is gone: the next caller loads again
+    assert flights.do("Users", lambda: backend.load("Users")) == [["Users", 2]]
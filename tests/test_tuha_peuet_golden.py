@@ -0,0 +1,39 @@
+"""
+Golden-output test for load_tuha_peuet: the vectorized loader must produce
+exactly the frame the original row-by-row loader built from the shipped
+data_(tuha peuet gampong).xlsx (tests/golden/tuha_peuet.json).
+"""
+
+import inspect
+import json
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+import utils.data_loader as data_loader
+from utils.storage import ExcelBackend
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+GOLDEN = Path(__file__).resolve().parent / "golden" / "tuha_peuet.json"
+
+
+@pytest.fixture
+def tuha_peuet(monkeypatch):
+    """load_tuha_peuet without the caches, on the raw grid of the shipped workbook"""
+    values = ExcelBackend(REPO_DIR).get_all_values("Tuha_Peuet")
+    monkeypatch.setattr(data_loader, "load_raw_data_from_sheet", lambda sheet_name: pd.DataFrame(values))
+    return inspect.unwrap(data_loader.load_tuha_peuet)()
+
+
+def test_matches_baseline_loader(tuha_peuet):
+    with open(GOLDEN, encoding="utf-8") as f:
+        golden = json.load(f)
+    assert len(tuha_peuet) == 440
+    assert list(tuha_peuet.columns) == golden["columns"]
+    assert dict(tuha_peuet.dtypes.astype(str)) == golden["dtypes"]
+    assert json.loads(tuha_peuet.to_json(orient="split")) == {
+        "columns": golden["columns"],
+        "index": golden["index"],
+        "data": golden["data"],
+    }
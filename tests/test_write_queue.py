@@ -0,0 +1,43 @@
+"""WriteExecutor status store: finished jobs are kept until their session reports them"""
+
+import time
+
+from utils.write_queue import FAILED, WriteExecutor
+
+
+def wait_done(executor, job_ids, timeout=10):
+    deadline = time.monotonic() + timeout
+    while not all(executor.get(job_id) is None or executor.get(job_id).done for job_id in job_ids):
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def test_failed_session_job_survives_pruning_until_forgotten():
+    executor = WriteExecutor(keep=5)
+    failed = executor.submit("1 perubahan", lambda: {'success': False, 'error': 'disk full'}, session_id="s1")
+    others = [executor.submit(f"job {i}", lambda: {'success': True}) for i in range(30)]
+    wait_done(executor, [failed] + others)
+    executor.submit("last", lambda: {'success': True})
+
+    job = executor.get(failed)
+    assert job is not None and job.status == FAILED
+    assert sum(executor.stats()['jobs'].values()) <= 5 + 2
+
+    executor.forget(failed)
+    assert executor.get(failed) is None
+
+
+def test_unclaimed_session_jobs_expire():
+    executor = WriteExecutor(keep=1, unclaimed_ttl=0.05)
+    job_ids = [executor.submit("job", lambda: {'success': False, 'error': 'x'}, session_id="gone") for _ in range(3)]
+    wait_done(executor, job_ids)
+    time.sleep(0.1)
+    executor.submit("next", lambda: {'success': True})
+    assert [executor.get(job_id) for job_id in job_ids[:2]] == [None, None]
+
+
+def test_idempotent_job_is_retried_on_other_errors():
+    executor = WriteExecutor(max_attempts=3, retry_delay=0)
+    job_id = executor.submit("save", lambda: {'success': False, 'error': 'file locked'}, idempotent=True)
+    wait_done(executor, [job_id])
+    assert executor.get(job_id).attempts == 3
@@ -0,0 +1,260 @@
+"""
+API Quota Module
+Sistem Manajemen Data Gampong - Dinas Pemberdayaan Kota Langsa
+
+HTTP client gspread yang mematuhi kuota per menit Google Sheets API:
+token bucket terpisah untuk baca dan tulis, retry dengan exponential
+backoff (jitter) untuk 429/5xx, dan prioritas untuk permintaan interaktif
+di atas refresh latar belakang. Timeout, koneksi terputus dan 5xx hanya
+dicoba ulang untuk permintaan idempoten (baca, values.update, values.batchUpdate); append dan
+sisip baris tidak diulang agar baris tidak tergandakan.
+"""
+
+import contextlib
+import contextvars
+import random
+import re
+import threading
+import time
+from http import HTTPStatus
+import requests
+from gspread.exceptions import APIError
+from gspread.http_client import HTTPClient
+from utils.instrumentation import record
+
+INTERACTIVE = "interactive"
+BACKGROUND = "background"
+
+# Priority of the requests made by the current thread/context
+_priority = contextvars.ContextVar("api_priority", default=INTERACTIVE)
+
+# Requests of the current context that failed for good (see track_api_failures)
+_failures = contextvars.ContextVar("api_failures", default=None)
+
+# Error codes worth retrying: rate limit, timeout and server errors
+RETRY_CODES = (HTTPStatus.REQUEST_TIMEOUT, HTTPStatus.TOO_MANY_REQUESTS)
+
+# Writes that set cells to given values, so sending them twice is harmless
+# (append and spreadsheets:batchUpdate, used for row inserts, are not)
+IDEMPOTENT_WRITES = ("PUT values", "POST values:batchUpdate", "POST values:clear", "POST values:batchClear")
+
+
+@contextlib.contextmanager
+def background_requests():
+    """Mark the API calls made inside the block as background (lower priority)"""
+    token = _priority.set(BACKGROUND)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def current_priority():
+    """Get the priority of API calls made from the current context"""
+    return _priority.get()
+
+
+@contextlib.contextmanager
+def track_api_failures():
+    """
+    Collect the requests made inside the block that failed after the retry
+    loop of QuotaHTTPClient, as 'METHOD op code' strings, so callers do not
+    retry them a second time.
+    """
+    failures = []
+    token = _failures.set(failures)
+    try:
+        yield failures
+    finally:
+        _failures.reset(token)
+
+
+def _note_failure(method, endpoint, code):
+    failures = _failures.get()
+    if failures is not None:
+        failures.append(f"{_api_label(method, endpoint)} {code}")
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket refilled at per_minute tokens per minute.
+    Background callers leave `reserve` tokens for interactive callers.
+    """
+
+    def __init__(self, per_minute, burst=None, reserve=0.2):
+        self.rate = per_minute / 60.0
+        self.capacity = float(burst if burst is not None else per_minute)
+        self.reserve = self.capacity * reserve
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._cond = threading.Condition()
+        self._interactive_waiting = 0
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, priority=INTERACTIVE):
+        """Take one token, blocking until available. Returns seconds waited."""
+        started = time.monotonic()
+        interactive = priority != BACKGROUND
+        with self._cond:
+            if interactive:
+                self._interactive_waiting += 1
+            try:
+                while True:
+                    self._refill()
+                    # Background requests yield to waiting interactive ones
+                    # and never dig into the interactive reserve
+                    floor = 1.0 if interactive else 1.0 + self.reserve
+                    if self._tokens >= floor and (interactive or not self._interactive_waiting):
+                        self._tokens -= 1.0
+                        break
+                    missing = max(floor - self._tokens, 0.0)
+                    self._cond.wait(timeout=max(missing / self.rate, 0.05))
+            finally:
+                if interactive:
+                    self._interactive_waiting -= 1
+                self._cond.notify_all()
+        return time.monotonic() - started
+
+
+class ApiQuota:
+    """Read/write buckets, retry policy and throttling metrics shared by all clients"""
+
+    def __init__(self, reads_per_minute=60, writes_per_minute=60, max_retries=5,
+                 backoff_base=1.0, backoff_max=32.0):
+        self.buckets = {
+            'read': TokenBucket(reads_per_minute),
+            'write': TokenBucket(writes_per_minute),
+        }
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._lock = threading.Lock()
+        self._metrics = {
+            'requests': {'read': 0, 'write': 0},
+            'retries': 0,
+            'failures': 0,
+            'throttled_seconds': {INTERACTIVE: 0.0, BACKGROUND: 0.0},
+            'backoff_seconds': 0.0,
+        }
+
+    def backoff(self, attempt):
+        """Jittered exponential backoff delay for a retry attempt (0-based)"""
+        ceiling = min(self.backoff_max, self.backoff_base * (2 ** attempt))
+        return random.uniform(ceiling / 2, ceiling)
+
+    def record(self, key, value=1, sub=None):
+        with self._lock:
+            if sub is None:
+                self._metrics[key] += value
+            else:
+                self._metrics[key][sub] += value
+
+    def stats(self):
+        """Get request/retry counters and time spent throttled"""
+        with self._lock:
+            return {
+                'requests': dict(self._metrics['requests']),
+                'retries': self._metrics['retries'],
+                'failures': self._metrics['failures'],
+                'throttled_seconds': {k: round(v, 3) for k, v in self._metrics['throttled_seconds'].items()},
+                'backoff_seconds': round(self._metrics['backoff_seconds'], 3),
+            }
+
+
+def _api_label(method, endpoint):
+    """Short operation name for metrics, e.g. 'GET values:batchGet'"""
+    path = re.sub(r"^https?://[^/]+", "", endpoint).split("?")[0]
+    if "drive" in endpoint:
+        op = "drive.files"
+    elif ":" in path.rsplit("/", 1)[-1]:
+        op = path.rsplit("/", 1)[-1].split(":", 1)[1]
+        op = f"values:{op}" if "/values" in path else op
+    elif "/values/" in path:
+        op = "values"
+    else:
+        op = "spreadsheets"
+    return f"{method.upper()} {op}"
+
+
+def is_idempotent(method, endpoint):
+    """True for reads and for writes that can be sent again without changing the result"""
+    return method.lower() == 'get' or _api_label(method, endpoint) in IDEMPOTENT_WRITES
+
+
+def _should_retry(error, idempotent=True):
+    """
+    Rate limits are rejected before anything is applied and are always
+    retried. A timeout or server error may come after the request took
+    effect, so those are only retried for idempotent requests.
+    """
+    code = error.code
+    if code == HTTPStatus.TOO_MANY_REQUESTS:
+        return True
+    # Drive API reports rate limits as 403 with domain usageLimits
+    details = error.error.get("errors") if isinstance(error.error, dict) else None
+    if code == HTTPStatus.FORBIDDEN and bool(details) and details[0].get("domain") == "usageLimits":
+        return True
+    return idempotent and (code in RETRY_CODES or code >= HTTPStatus.INTERNAL_SERVER_ERROR)
+
+
+class QuotaHTTPClient(HTTPClient):
+    """
+    gspread HTTPClient that waits for quota before each request and retries
+    rate-limited requests, and failed idempotent ones, with jittered
+    exponential backoff.
+    Use QuotaHTTPClient.with_quota(quota) as the http_client of gspread.authorize.
+    """
+
+    quota = ApiQuota()
+
+    @classmethod
+    def with_quota(cls, quota):
+        """Get a client class bound to a shared ApiQuota"""
+        return type(cls.__name__, (cls,), {'quota': quota})
+
+    def request(self, method, endpoint, *args, **kwargs):
+        quota = self.quota
+        kind = 'read' if method.lower() == 'get' else 'write'
+        priority = current_priority()
+        idempotent = is_idempotent(method, endpoint)
+
+        attempt = 0
+        while True:
+            waited = quota.buckets[kind].acquire(priority)
+            quota.record('throttled_seconds', waited, priority)
+            quota.record('requests', 1, kind)
+            started = time.perf_counter()
+            try:
+                response = super().request(method, endpoint, *args, **kwargs)
+                record('api', _api_label(method, endpoint), len(response.content or b''),
+                       time.perf_counter() - started)
+                return response
+            except APIError as e:
+                record('api', _api_label(method, endpoint), 0, time.perf_counter() - started, error=True)
+                if attempt >= quota.max_retries or not _should_retry(e, idempotent):
+                    quota.record('failures')
+                    _note_failure(method, endpoint, e.code)
+                    raise
+                self._back_off(attempt, f"Sheets API {e.code} on {method.upper()} {endpoint}")
+                attempt += 1
+            except requests.exceptions.RequestException as e:
+                # Timeout or dropped connection: the request may have been applied
+                record('api', _api_label(method, endpoint), 0, time.perf_counter() - started, error=True)
+                if attempt >= quota.max_retries or not idempotent:
+                    quota.record('failures')
+                    _note_failure(method, endpoint, type(e).__name__)
+                    raise
+                self._back_off(attempt, f"{type(e).__name__} on {method.upper()} {endpoint}")
+                attempt += 1
+
+    def _back_off(self, attempt, reason):
+        """Sleep the backoff delay of a retry attempt"""
+        delay = self.quota.backoff(attempt)
+        self.quota.record('retries')
+        self.quota.record('backoff_seconds', delay)
+        print(f"{reason}, retrying in {delay:.1f}s")
+        time.sleep(delay)
@@ -1,47 +1,242 @@
 """
 Authentication Module for Sistem Manajemen Data Gampong
 Handles user authentication, registration, and role management via Google Sheets
+(or a local users.json file, setting auth_backend = "json")
 """
 
 import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+from pathlib import Path
 import streamlit as st
 import pandas as pd
-from utils.data_loader import get_gspread_client, SPREADSHEET_NAME
+from utils.config import get_setting
+from utils.data_loader import (
+    get_storage_backend, get_sheet_cache, load_raw_data_from_sheet, probe_revision,
+    write_through_cache, write_through_rows, LOCAL_DATA_DIR, SEED_DATA_DIR,
+)
+from utils.instrumentation import log_event
+from utils.login_limiter import get_login_limiter, current_client
+
+USERS_SHEET = "Users"
+
+# Header of the Users sheet, in this order if the header row is missing
+USER_COLUMNS = ['username', 'password', 'role']
 
 def hash_password(password: str) -> str:
     """Hash password using SHA-256"""
     return hashlib.sha256(password.encode()).hexdigest()
 
+
+class UserDirectory:
+    """
+    username -> {'password', 'role', 'row'} built from the cached Users grid
+    of one generation; row is the 1-based sheet row, so writes need no find().
+    """
+
+    def __init__(self, values, generation=None):
+        self.generation = generation
+        self._users = {}
+        header = [str(h).strip().lower() for h in values[0]] if values else []
+        cols = {name: header.index(name) if name in header else i for i, name in enumerate(USER_COLUMNS)}
+        for row, row_values in enumerate(values[1:], start=2):
+            def cell(name):
+                return str(row_values[cols[name]]).strip() if len(row_values) > cols[name] else ''
+            username = cell('username')
+            if username:
+                self._users[username] = {'password': cell('password'), 'role': cell('role'), 'row': row}
+        self.next_row = len(values) + 1
+
+    def get(self, username):
+        """User record of username, or None"""
+        return self._users.get(str(username))
+
+    def __contains__(self, username):
+        return str(username) in self._users
+
+    def users(self):
+        """{username: {'password', 'role'}} as load_users returned it"""
+        return {name: {'password': u['password'], 'role': u['role']} for name, u in self._users.items()}
+
+    def set_password(self, username, new_hash):
+        """Write a password hash to the user's row (column 2)"""
+        user = self.get(username)
+        if user:
+            cell_updates = {USERS_SHEET: [(user['row'], 2, new_hash)]}
+            base_revision = probe_revision()
+            get_storage_backend().batch_update(cell_updates)
+            write_through_cache(cell_updates, base_revision=base_revision)
+
+    def add(self, username, password_hash, role):
+        """Append a user row"""
+        # Header: username, password, role
+        new_row = [username, password_hash, role]
+        base_revision = probe_revision()
+        get_users_worksheet().append_row(new_row)
+        # Appended below the last row: patch the cached grid, the directory
+        # is rebuilt from it without reading the sheet again
+        write_through_rows(USERS_SHEET, self.next_row, 1, new_row, base_revision=base_revision)
+
+    def remove(self, username):
+        """Delete the user's row"""
+        row = self.get(username)['row']
+        base_revision = probe_revision()
+        get_users_worksheet().delete_rows(row)
+        write_through_rows(USERS_SHEET, row, -1, base_revision=base_revision)
+
+
+class JsonUserDirectory:
+    """
+    Users kept in a local JSON file ({username: {'password', 'role'}}, the
+    shape of users.json). The file is read once and again only when its
+    mtime changes; changes are written to a temporary file and renamed over
+    it, so readers never see a half-written file. A missing file is first
+    copied from seed_path (the shipped users.json), if given.
+    """
+
+    def __init__(self, path, seed_path=None):
+        self.path = Path(path)
+        self.seed_path = Path(seed_path) if seed_path else None
+        self._lock = threading.RLock()
+        self._users = {}
+        self._mtime = None
+
+    def refresh(self):
+        """Reload the file if it changed since it was read"""
+        with self._lock:
+            self._seed()
+            try:
+                mtime = self.path.stat().st_mtime_ns
+            except FileNotFoundError:
+                mtime = None
+            if mtime != self._mtime:
+                users = {}
+                if mtime is not None:
+                    with open(self.path, encoding='utf-8') as f:
+                        users = json.load(f)
+                self._users = {
+                    str(name): {'password': str(u.get('password', '')), 'role': str(u.get('role', ''))}
+                    for name, u in users.items()
+                }
+                self._mtime = mtime
+            return self
+
+    def _seed(self):
+        """Copy the seed file to path if path does not exist yet"""
+        if self.seed_path is None or self.path.exists() or not self.seed_path.exists():
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        shutil.copy2(self.seed_path, self.path)
+
+    def get(self, username):
+        """User record of username, or None"""
+        return self._users.get(str(username))
+
+    def __contains__(self, username):
+        return str(username) in self._users
+
+    def users(self):
+        """{username: {'password', 'role'}} as load_users returned it"""
+        return {name: dict(u) for name, u in self._users.items()}
+
+    def _save(self, users):
+        """Write users atomically (temporary file in the same directory, then rename)"""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.path.parent, suffix='.json.tmp')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(users, f, indent=2)
+            os.replace(tmp_path, self.path)
+        except Exception:
+            os.unlink(tmp_path)
+            raise
+        self._users = users
+        self._mtime = self.path.stat().st_mtime_ns
+
+    def _change(self, fn):
+        # Re-read first so a change made by another process is not overwritten
+        with self._lock:
+            self.refresh()
+            users = self.users()
+            fn(users)
+            self._save(users)
+
+    def set_password(self, username, new_hash):
+        """Store a new password hash"""
+        if username in self:
+            self._change(lambda users: users[username].update(password=new_hash))
+
+    def add(self, username, password_hash, role):
+        """Add a user"""
+        self._change(lambda users: users.__setitem__(username, {'password': password_hash, 'role': role}))
+
+    def remove(self, username):
+        """Delete a user"""
+        self._change(lambda users: users.pop(username, None))
+
+
+def use_json_users():
+    """True if users are kept in the local users.json instead of the Users sheet"""
+    return str(get_setting("auth_backend", "sheet")).lower() == "json"
+
+
+@st.cache_resource
+def get_json_user_directory():
+    """
+    Get the shared file-backed user directory (setting users_file, default
+    users.json in the untracked local data dir, seeded from the shipped one)
+    """
+    default = Path(get_setting("local_data_dir", LOCAL_DATA_DIR)) / "users.json"
+    return JsonUserDirectory(get_setting("users_file", default), seed_path=SEED_DATA_DIR / "users.json")
+
+
+@st.cache_resource
+def _get_directory_holder():
+    """Shared slot for the directory of the current Users grid"""
+    return {'directory': None}
+
+def get_user_directory(fresh=False) -> UserDirectory:
+    """
+    Get the in-memory user directory. It is rebuilt only when the cached
+    Users grid changed (revision-checked by the shared sheet cache), so a
+    login is answered from memory. fresh=True probes the revision first,
+    for writes that need current row numbers. With auth_backend = "json"
+    the file-backed directory is returned instead.
+    """
+    if use_json_users():
+        return get_json_user_directory().refresh()
+    if fresh:
+        probe_revision()
+    cache = get_sheet_cache()
+    snapshot = cache.snapshot(USERS_SHEET)
+    if snapshot is None:
+        load_raw_data_from_sheet(USERS_SHEET)
+        snapshot = cache.snapshot(USERS_SHEET)
+        if snapshot is None:
+            return UserDirectory([])
+    values, generation = snapshot
+
+    holder = _get_directory_holder()
+    directory = holder['directory']
+    if directory is None or directory.generation != generation:
+        directory = holder['directory'] = UserDirectory(values, generation)
+    return directory
+
 def get_users_worksheet():
-    """Helper to get Users worksheet"""
-    client = get_gspread_client()
-    if not client:
-        return None
+    """Helper to get Users worksheet from the configured storage backend"""
     try:
-        sh = client.open(SPREADSHEET_NAME)
-        return sh.worksheet("Users")
+        return get_storage_backend().worksheet("Users")
     except Exception as e:
         print(f"Error accessing Users sheet: {e}")
         return None
 
 def load_users() -> dict:
-    """Load users from Google Sheets and return as dict"""
-    ws = get_users_worksheet()
-    if not ws:
-        return {}
-    
+    """Load users from the cached user directory and return as dict"""
     try:
-        records = ws.get_all_records()
-        users = {}
-        for record in records:
-            # Check if record has necessary keys (handle potential empty rows or bad data)
-            if 'username' in record and record['username']:
-                uname = str(record['username'])
-                users[uname] = {
-                    'password': str(record['password']),
-                    'role': str(record['role'])
-                }
-        return users
+        return get_user_directory().users()
     except Exception as e:
         print(f"Error loading users: {e}")
         return {}
@@ -50,13 +245,25 @@ def authenticate(username: str, password: str) -> dict:
     """
     Authenticate user with username and password
     Returns: {'success': bool, 'role': str, 'message': str}
+    Attempts over the per-(username, client)/per-client limit are rejected
+    before the user directory (or the backend) is touched.
     """
-    users = load_users()
+    limiter = get_login_limiter()
+    client = current_client()
+    wait = limiter.attempt(username, client)
+    if wait > 0:
+        log_event('login_rate_limited', username=str(username), client=client, retry_after=round(wait))
+        return {
+            'success': False, 'role': None, 'rate_limited': True,
+            'message': f'Terlalu banyak percobaan login. Coba lagi dalam {max(1, round(wait))} detik'
+        }
+
+    user = get_user_directory().get(username)
     
-    if username not in users:
+    if user is None:
         return {'success': False, 'role': None, 'message': 'Username tidak ditemukan'}
     
-    stored_hash = users[username]['password']
+    stored_hash = user['password']
     
     # Check if stored password is hashed (simple length check for sha256 hex digest = 64 chars)
     # If legacy plain text (from manual entry), hash comparison won't work directly but we want to fail secure?
@@ -88,21 +295,18 @@ def authenticate(username: str, password: str) -> dict:
             pass # Non-blocking update
 
     if match:
+        limiter.succeeded(username, client)
         return {
             'success': True, 
-            'role': users[username]['role'],
+            'role': user['role'],
             'message': 'Login berhasil'
         }
     else:
         return {'success': False, 'role': None, 'message': 'Password salah'}
 
 def update_user_password(username, new_hash):
-    """Helper to update password hash in DB"""
-    ws = get_users_worksheet()
-    cell = ws.find(username)
-    if cell:
-        # Password is column 2
-        ws.update_cell(cell.row, 2, new_hash)
+    """Helper to update password hash in DB (row taken from the user directory)"""
+    get_user_directory(fresh=True).set_password(username, new_hash)
 
 def register_user(username: str, password: str, confirm_password: str) -> dict:
     """
@@ -122,10 +326,10 @@ def register_user(username: str, password: str, confirm_password: str) -> dict:
     if password != confirm_password:
         return {'success': False, 'message': 'Password tidak cocok'}
     
-    users = load_users()
+    directory = get_user_directory(fresh=True)
     
     # Check if username exists
-    if username in users:
+    if username in directory:
         return {'success': False, 'message': 'Username sudah digunakan'}
     
     # Check if username starts with 'admin' (reserved)
@@ -133,24 +337,17 @@ def register_user(username: str, password: str, confirm_password: str) -> dict:
         return {'success': False, 'message': 'Username tidak boleh dimulai dengan "admin"'}
     
     try:
-        ws = get_users_worksheet()
         # Append new user
-        # Header: username, password, role
-        hashed_pw = hash_password(password)
-        ws.append_row([username, hashed_pw, 'viewer'])
-        
-        # Clear cache in data_loader if it caches users? Not currently caching users in data_loader.
-        # But we might need to clear any auth cache if we added it.
-        
+        directory.add(username, hash_password(password), 'viewer')
         return {'success': True, 'message': 'Registrasi berhasil! Silakan login.'}
     except Exception as e:
         return {'success': False, 'message': f'Gagal menyimpan data: {e}'}
 
 def get_user_role(username: str) -> str:
     """Get user role by username"""
-    users = load_users()
-    if username in users:
-        return users[username].get('role', 'viewer')
+    user = get_user_directory().get(username)
+    if user is not None:
+        return user['role']
     return None
 
 def is_admin(role: str) -> bool:
@@ -167,20 +364,17 @@ def get_all_users() -> dict:
 
 def delete_user(username: str) -> dict:
     """Delete a user (admin only, cannot delete other admins)"""
-    users = load_users()
+    directory = get_user_directory(fresh=True)
+    user = directory.get(username)
     
-    if username not in users:
+    if user is None:
         return {'success': False, 'message': 'User tidak ditemukan'}
     
-    if users[username]['role'] == 'admin':
+    if user['role'] == 'admin':
         return {'success': False, 'message': 'Tidak dapat menghapus akun admin'}
     
     try:
-        ws = get_users_worksheet()
-        cell = ws.find(username)
-        if cell and cell.col == 1: # Confirm it's in username column
-             ws.delete_rows(cell.row)
-             return {'success': True, 'message': 'User berhasil dihapus'}
-        return {'success': False, 'message': 'User tidak ditemukan di database'}
+        directory.remove(username)
+        return {'success': True, 'message': 'User berhasil dihapus'}
     except Exception as e:
         return {'success': False, 'message': f'Gagal menghapus user: {e}'}
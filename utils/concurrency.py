@@ -0,0 +1,150 @@
+"""
+Concurrency Module
+Sistem Manajemen Data Gampong - Dinas Pemberdayaan Kota Langsa
+
+Alat bantu koordinasi thread: SingleFlight menggabungkan pengambilan yang
+sama dari beberapa session sekaligus menjadi satu permintaan, CheckWorker
+menjalankan pemeriksaan di satu thread latar belakang dengan antrean yang
+dibatasi.
+"""
+
+import threading
+
+
+class _Flight:
+    """One in-flight call and its outcome"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+    def wait(self):
+        self.done.wait()
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+class SingleFlight:
+    """
+    Coalesce concurrent calls for the same key: the first caller runs the
+    function, callers arriving while it runs wait for its result. Errors are
+    passed to every waiter and nothing is remembered once the call finished.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights = {}  # key -> _Flight
+        self.leaders = 0
+        self.coalesced = 0
+
+    def _claim(self, keys):
+        """Split keys into flights this caller leads and flights to wait on"""
+        led, waiting = {}, {}
+        with self._lock:
+            for key in keys:
+                flight = self._flights.get(key)
+                if flight is None:
+                    flight = self._flights[key] = _Flight()
+                    led[key] = flight
+                    self.leaders += 1
+                else:
+                    waiting[key] = flight
+                    self.coalesced += 1
+        return led, waiting
+
+    def _finish(self, led, results=None, error=None):
+        with self._lock:
+            for key in led:
+                self._flights.pop(key, None)
+        for key, flight in led.items():
+            flight.error = error
+            flight.result = None if results is None else results.get(key)
+            flight.done.set()
+
+    def do(self, key, fn):
+        """Run fn() once for all concurrent callers with the same key"""
+        return self.do_many([key], lambda keys: {key: fn()})[key]
+
+    def do_many(self, keys, fn):
+        """
+        Batch variant: fn(led_keys) -> {key: result} runs for the keys nobody
+        is fetching yet, keys already in flight are waited on.
+        Returns {key: result} for all keys.
+        """
+        led, waiting = self._claim(keys)
+        results = {}
+        if led:
+            try:
+                results = fn(list(led)) or {}
+            except BaseException as e:
+                self._finish(led, error=e)
+                raise
+            self._finish(led, results)
+        for key, flight in waiting.items():
+            results[key] = flight.wait()
+        return {key: results.get(key) for key in keys}
+
+    def stats(self):
+        """Get leader/coalesced call counters"""
+        with self._lock:
+            return {
+                'leaders': self.leaders,
+                'coalesced': self.coalesced,
+                'in_flight': sorted(self._flights.keys()),
+            }
+
+
+class CheckWorker:
+    """
+    One background thread running check({key: item}) on everything pending.
+    A key submitted again while pending keeps only the newest item; at most
+    max_pending keys wait, further submissions are dropped (and counted).
+    """
+
+    def __init__(self, check, max_pending=32):
+        self._check = check
+        self.max_pending = max_pending
+        self._cond = threading.Condition()
+        self._pending = {}
+        self.submitted = 0
+        self.dropped = 0
+        self.runs = 0
+        threading.Thread(target=self._work, name="check-worker", daemon=True).start()
+
+    def submit(self, items):
+        """Queue {key: item}; returns the keys that were dropped"""
+        dropped = []
+        with self._cond:
+            for key, item in items.items():
+                if key not in self._pending and len(self._pending) >= self.max_pending:
+                    dropped.append(key)
+                    continue
+                self._pending[key] = item
+            self.submitted += len(items) - len(dropped)
+            self.dropped += len(dropped)
+            self._cond.notify()
+        return dropped
+
+    def _work(self):
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+                batch, self._pending = self._pending, {}
+                self.runs += 1
+            try:
+                self._check(batch)
+            except Exception as e:
+                print(f"Error in background check: {e}")
+
+    def stats(self):
+        """Get submitted/dropped/run counters"""
+        with self._cond:
+            return {
+                'submitted': self.submitted,
+                'dropped': self.dropped,
+                'runs': self.runs,
+                'pending': len(self._pending),
+            }
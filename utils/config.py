@@ -0,0 +1,36 @@
+"""
+Config Module
+Sistem Manajemen Data Gampong - Dinas Pemberdayaan Kota Langsa
+
+Pengaturan aplikasi dibaca dari environment variable (DPMG_<NAMA>) atau
+dari Streamlit Secrets (secrets.toml / Streamlit Cloud).
+"""
+
+import os
+import streamlit as st
+
+
+def get_setting(name, default=None):
+    """
+    Read a setting, e.g. get_setting("storage_backend", "gsheets").
+    Environment variable DPMG_STORAGE_BACKEND wins over st.secrets["storage_backend"].
+    """
+    env_value = os.environ.get(f"DPMG_{name.upper()}")
+    if env_value is not None:
+        return env_value
+
+    try:
+        if name in st.secrets:
+            return st.secrets[name]
+    except Exception:
+        # No secrets.toml configured (local development)
+        pass
+    return default
+
+
+def get_float_setting(name, default):
+    """Read a numeric setting, falling back to default on bad values"""
+    try:
+        return float(get_setting(name, default))
+    except (TypeError, ValueError):
+        return default
@@ -5,11 +5,25 @@ Sistem Manajemen Data Gampong - Dinas Pemberdayaan Kota Langsa
 Module untuk memuat dan menormalisasi data dari Google Sheets.
 """
 
+import functools
+import hashlib
+import json
+import random
+import time
 import pandas as pd
 import streamlit as st
 import gspread
 from pathlib import Path
 from google.oauth2.service_account import Credentials
+from utils.api_quota import ApiQuota, QuotaHTTPClient, background_requests
+from utils.config import get_setting, get_float_setting
+from utils.instrumentation import instrumented, log_event
+from utils.row_index import RowIndexes, normalize_number
+from utils.concurrency import CheckWorker, SingleFlight
+from utils.sheet_cache import SheetCache, FrameCache
+from utils.sheet_registry import SheetRegistry
+from utils.sqlite_store import NormalizedStore
+from utils.storage import SheetsBackend, ExcelBackend
 
 # Constants
 SCOPES = [
@@ -18,25 +32,52 @@ SCOPES = [
 ]
 SPREADSHEET_NAME = "Database_DPMG_Langsa"
 
+# Worksheets holding the gampong data (Users is handled by utils.auth)
+DATA_SHEETS = ["Camat_Mukim_Geuchik", "Geuchik_Detail", "Perangkat_Desa", "Tuha_Peuet"]
+
+# Minimum seconds between two Drive revision probes (shared by all sessions).
+# Cached sheets are re-downloaded only when the revision has changed.
+REVISION_PROBE_INTERVAL = 5
+
 # Path to credentials file (for local development)
 CREDENTIALS_FILE = Path(__file__).parent.parent / "credentials.json"
 
+# Workbooks shipped with the app, copied into LOCAL_DATA_DIR on first use
+SEED_DATA_DIR = Path(__file__).parent.parent
+
+# Writable folder holding the local workbooks used by the "excel" storage
+# backend (untracked; local_data_dir setting)
+LOCAL_DATA_DIR = SEED_DATA_DIR / "local_data"
+
+@st.cache_resource
+def get_api_quota():
+    """
+    Get the shared Sheets API quota (read/write token buckets, retry policy).
+    Limits follow the per-user Sheets quota and can be lowered via
+    sheets_reads_per_minute / sheets_writes_per_minute.
+    """
+    return ApiQuota(
+        reads_per_minute=get_float_setting("sheets_reads_per_minute", 60),
+        writes_per_minute=get_float_setting("sheets_writes_per_minute", 60),
+    )
+
 @st.cache_resource
 def get_gspread_client():
-    """Get authenticated gspread client"""
+    """Get authenticated gspread client (quota-aware, see utils.api_quota)"""
+    http_client = QuotaHTTPClient.with_quota(get_api_quota())
     try:
         if CREDENTIALS_FILE.exists():
             creds = Credentials.from_service_account_file(
                 str(CREDENTIALS_FILE), scopes=SCOPES
             )
-            return gspread.authorize(creds)
+            return gspread.authorize(creds, http_client=http_client)
         
         # Support for Streamlit Cloud Secrets (Production)
         elif "gcp_service_account" in st.secrets:
             creds = Credentials.from_service_account_info(
                 dict(st.secrets["gcp_service_account"]), scopes=SCOPES
             )
-            return gspread.authorize(creds)
+            return gspread.authorize(creds, http_client=http_client)
             
         else:
             st.error("File credentials.json tidak ditemukan dan Secrets tidak terkonfigurasi!")
@@ -45,27 +86,164 @@ def get_gspread_client():
         st.error(f"Error authenticating to Google Sheets: {e}")
         return None
 
-@st.cache_data(ttl=60)
-def load_raw_data_from_sheet(sheet_name):
+@st.cache_resource
+def get_sheet_registry():
+    """Get the shared registry of opened Spreadsheet/Worksheet handles"""
+    return SheetRegistry(get_gspread_client, SPREADSHEET_NAME)
+
+@st.cache_resource
+def get_storage_backend():
     """
-    Load raw data from a specific worksheet in Google Sheets.
-    Returns a DataFrame representing the sheet content (header=None style).
-    Cached for 60 seconds to prevent API rate limits.
+    Get the configured storage backend.
+    storage_backend = "gsheets" (default) or "excel" (local .xlsx files in
+    local_data_dir, seeded from the shipped workbooks), set via
+    DPMG_STORAGE_BACKEND or st.secrets.
     """
-    client = get_gspread_client()
-    if not client:
-        return pd.DataFrame()
-    
+    backend_name = str(get_setting("storage_backend", "gsheets")).lower()
+    if backend_name == "excel":
+        return ExcelBackend(get_setting("local_data_dir", LOCAL_DATA_DIR), seed_path=SEED_DATA_DIR)
+    return SheetsBackend(get_sheet_registry())
+
+@st.cache_resource
+def get_sheet_cache():
+    """Get the shared, revision-checked cache of raw worksheet values"""
+    return SheetCache(
+        get_storage_backend().revision,
+        probe_interval=REVISION_PROBE_INTERVAL,
+        fallback_ttl=get_float_setting("revision_fallback_ttl", 60.0),
+    )
+
+@st.cache_resource
+def get_fetch_flights():
+    """Get the shared single-flight group for raw sheet fetches"""
+    return SingleFlight()
+
+@st.cache_resource
+def get_write_checks():
+    """Get the background worker checking written sheets against the revision"""
+    return CheckWorker(_verify_cached_sheets, max_pending=int(get_float_setting("write_check_max_pending", 32)))
+
+def _fetch_sheet_values(sheet_name):
+    """Fetch all values of one worksheet from the storage backend"""
+    return get_storage_backend().get_all_values(sheet_name)
+
+def _fetch_into_cache(sheet_names):
+    """
+    Fetch sheets (one batchGet for several) and store them in the sheet cache.
+    Sheets another caller stored in the meantime are not fetched again.
+    """
+    cache = get_sheet_cache()
+    results = {}
+    to_fetch = []
+    for name in sheet_names:
+        values = cache.get(name)
+        if values is None:
+            to_fetch.append(name)
+        else:
+            results[name] = values
+    if not to_fetch:
+        return results
+
+    revision = cache.current_revision()
+    if len(to_fetch) == 1:
+        fetched = {to_fetch[0]: _fetch_sheet_values(to_fetch[0])}
+    else:
+        fetched = get_storage_backend().batch_get(to_fetch)
+    for name, values in fetched.items():
+        if values is not None:
+            cache.put(name, values, revision)
+    results.update(fetched)
+    return results
+
+def prefetch_sheets(sheet_names=DATA_SHEETS):
+    """
+    Fill the raw sheet cache for all given sheets that are not cached yet,
+    using one batchGet round-trip instead of one request per sheet.
+    """
+    cache = get_sheet_cache()
+    to_fetch = cache.missing(sheet_names)
+    backend = get_storage_backend()
+    if not to_fetch or not backend.available():
+        return
+
     try:
-        sh = client.open(SPREADSHEET_NAME)
-        ws = sh.worksheet(sheet_name)
-        data = ws.get_all_values()
-        return pd.DataFrame(data)
+        # Sheets another session is already fetching are waited on, not refetched
+        get_fetch_flights().do_many(to_fetch, _fetch_into_cache)
     except Exception as e:
-        print(f"Error loading sheet {sheet_name}: {e}")
-        return pd.DataFrame()
+        # Fall back to per-sheet loading in load_raw_data_from_sheet
+        print(f"Error batch loading sheets {to_fetch}: {e}")
 
+def load_raw_data_from_sheet(sheet_name):
+    """
+    Load raw data from a specific worksheet (Google Sheets or local backend).
+    Returns a DataFrame representing the sheet content (header=None style).
+    Served from the shared sheet cache, which re-downloads the values only
+    when the spreadsheet revision changed, to prevent API rate limits.
+    Concurrent sessions missing the same sheet share one fetch.
+    """
+    cache = get_sheet_cache()
+    values = cache.get(sheet_name)
+
+    if values is None:
+        if not get_storage_backend().available():
+            return pd.DataFrame()
+
+        try:
+            values = get_fetch_flights().do_many([sheet_name], _fetch_into_cache)[sheet_name]
+        except Exception as e:
+            print(f"Error loading sheet {sheet_name}: {e}")
+            return pd.DataFrame()
+        if values is None:
+            return pd.DataFrame()
+
+    return pd.DataFrame(values)
+
+
+@st.cache_resource
+def get_frame_cache():
+    """Get the shared cache of normalized frames returned by the load_* functions"""
+    return FrameCache()
+
+
+def sheet_token(sheet_name):
+    """
+    Make sure the raw grid of a sheet is current and return a token identifying
+    its content, or None if the sheet could not be loaded.
+    """
+    cache = get_sheet_cache()
+    if cache.get(sheet_name) is None:
+        load_raw_data_from_sheet(sheet_name)
+        if cache.get(sheet_name) is None:
+            return None
+    return (id(cache), cache.generation(sheet_name))
 
+
+def normalized_frame(sheet_name):
+    """
+    Memoize a load_* function on the content of its source sheet, so the
+    normalization runs once per data change instead of on every rerun.
+    Callers get their own copy of the frame.
+    """
+    def decorator(loader):
+        @instrumented('load', loader.__name__)
+        @functools.wraps(loader)
+        def wrapper():
+            token = sheet_token(sheet_name)
+            if token is None:
+                return loader()
+
+            frames = get_frame_cache()
+            df = frames.get(loader.__name__, token)
+            if df is None:
+                started = time.perf_counter()
+                df = loader()
+                frames.put(loader.__name__, token, df, time.perf_counter() - started)
+            return df
+        return wrapper
+    return decorator
+
+
+@normalized_frame("Camat_Mukim_Geuchik")
 def load_camat_mukim_geuchik():
     """Load data Camat, Mukim, dan Geuchik"""
     df = load_raw_data_from_sheet("Camat_Mukim_Geuchik")
@@ -87,6 +265,7 @@ def load_camat_mukim_geuchik():
     return df
 
 
+@normalized_frame("Geuchik_Detail")
 def load_geuchik_detail():
     """Load data detail Geuchik Kota Langsa"""
     # Logic copied from original: read header=None equivalent
@@ -140,6 +319,7 @@ def load_geuchik_detail():
         return pd.DataFrame()
 
 
+@normalized_frame("Perangkat_Desa")
 def load_perangkat_desa():
     """Load data Kepala Desa dan Perangkat Desa"""
     df = load_raw_data_from_sheet("Perangkat_Desa")
@@ -202,6 +382,7 @@ def load_perangkat_desa():
         return pd.DataFrame()
 
 
+@normalized_frame("Tuha_Peuet")
 def load_tuha_peuet():
     """Load data Tuha Peuet Gampong"""
     df = load_raw_data_from_sheet("Tuha_Peuet")
@@ -231,82 +412,47 @@ def load_tuha_peuet():
         df_data = df_data[df_data['NO_ANGGOTA'].notna()].copy()
         df_data = df_data.reset_index(drop=True)
         
-        # Get list of valid gampong names
-        valid_gampong_rows = df_data[(df_data['GAMPONG'].notna()) & (df_data['KECAMATAN'].notna())]
-        valid_gampong_names = set(valid_gampong_rows['GAMPONG'].dropna().unique())
-        
-        # Secretary Detection Logic (Preserved from original)
-        sekretaris_info = {}
-        current_gampong_name = None
-        
-        # Note: In pure dataframe form from CSV/Sheets, row indices are reset.
-        # But here we are iterating over df_data which is sliced.
-        # Original logic iterated over `range(len(df_data))`
-        
-        for i in range(len(df_data)):
-            gampong_val = df_data.iloc[i]['GAMPONG']
-            
-            if pd.notna(gampong_val):
-                val_str = str(gampong_val).strip()
-                if val_str.isupper() and len(val_str) > 3 and "SEKRETARIS" not in val_str.upper():
-                    current_gampong_name = val_str
-                    
-                    # Look ahead logic
-                    if i + 3 < len(df_data):
-                        possible_name = df_data.iloc[i + 3]['GAMPONG']
-                        possible_jabatan = df_data.iloc[i + 2]['GAMPONG']
-                        
-                        if pd.notna(possible_name):
-                            name_str = str(possible_name).strip()
-                            jabatan_str = str(possible_jabatan).strip() if pd.notna(possible_jabatan) else "Sekretaris TPG"
-                            
-                            if not name_str.isupper():
-                                sekretaris_info[current_gampong_name] = (name_str, jabatan_str)
+        # Gampong header rows: upper-case names longer than 3 characters,
+        # excluding the "SEKRETARIS ..." labels in the same column
+        gampong = df_data['GAMPONG'].str.strip()
+        is_upper = gampong.str.isupper().fillna(False).astype(bool)
+        is_long = gampong.str.len().fillna(0) > 3
+        is_header = is_upper & is_long & ~gampong.str.upper().str.contains("SEKRETARIS", regex=False).fillna(False).astype(bool)
+        
+        # Secretary Detection Logic (Preserved from original):
+        # the jabatan sits 2 rows and the name 3 rows below a gampong header;
+        # a later header with the same name wins
+        possible_jabatan = gampong.shift(-2)
+        possible_name = gampong.shift(-3)
+        has_sekretaris = is_header & possible_name.notna() & ~possible_name.str.isupper().fillna(False).astype(bool)
+        sekretaris_info = pd.DataFrame({
+            'GAMPONG': gampong[has_sekretaris],
+            'NAMA': possible_name[has_sekretaris],
+            'JABATAN': possible_jabatan[has_sekretaris].fillna("Sekretaris TPG"),
+        }).drop_duplicates('GAMPONG', keep='last').set_index('GAMPONG')
         
         # Create columns
         df_data['JABATAN'] = 'Anggota'
-        df_data['SEKRETARIS_TPG'] = None
-        df_data['SEKRETARIS_JABATAN'] = None
-        
-        # Fill/Map Gampong for mapping
-        temp_gampong_series = df_data['GAMPONG'].copy()
-        for i in range(len(df_data)):
-            val = df_data.iloc[i]['GAMPONG']
-            if pd.notna(val):
-                val_str = str(val).strip()
-                if not (val_str.isupper() and "SEKRETARIS" not in val_str.upper() and len(val_str) > 3):
-                     temp_gampong_series.iloc[i] = None 
-        
-        temp_gampong_series = temp_gampong_series.ffill()
-        
-        for i in range(len(df_data)):
-            gampong_name = temp_gampong_series.iloc[i]
-            if pd.notna(gampong_name):
-                gampong_name = str(gampong_name).strip()
-                if gampong_name in sekretaris_info:
-                    sek_name, sek_jab = sekretaris_info[gampong_name]
-                    df_data.at[i, 'SEKRETARIS_TPG'] = sek_name
-                    df_data.at[i, 'SEKRETARIS_JABATAN'] = sek_jab
-
-        # Clean GAMPONG 
-        def clean_gampong(val):
-            if pd.isna(val): return val
-            if val in valid_gampong_names: return val
-            val_str = str(val).strip()
-            if val_str.isupper() and len(val_str) > 3: return val
-            return None
-        
-        df_data['GAMPONG'] = df_data['GAMPONG'].apply(clean_gampong)
         
-        # Clean KEMUKIMAN
-        valid_kemukiman = set(df_data[(df_data['KEMUKIMAN'].notna()) & (df_data['KECAMATAN'].notna())]['KEMUKIMAN'].dropna().unique())
-        def clean_kemukiman(val):
-            if pd.isna(val): return val
-            if val in valid_kemukiman: return val
-            val_str = str(val).strip()
-            if val_str.isupper() and len(val_str) > 3: return val
-            return None
-        df_data['KEMUKIMAN'] = df_data['KEMUKIMAN'].apply(clean_kemukiman)
+        # Map every row to the gampong header above it
+        row_gampong = gampong.where(is_header).ffill()
+        for col, source in (('SEKRETARIS_TPG', 'NAMA'), ('SEKRETARIS_JABATAN', 'JABATAN')):
+            mapped = row_gampong.map(sekretaris_info[source]).astype(object)
+            df_data[col] = mapped.where(mapped.notna(), None)
+        
+        # Clean GAMPONG / KEMUKIMAN: keep names that appear on a kecamatan row
+        # or look like a header (upper case, longer than 3 characters)
+        has_kecamatan = df_data['KECAMATAN'].notna()
+        for col in ('GAMPONG', 'KEMUKIMAN'):
+            values = df_data[col]
+            stripped = values.str.strip()
+            valid_names = set(values[values.notna() & has_kecamatan].unique())
+            keep = (
+                values.isna()
+                | values.isin(valid_names)
+                | (stripped.str.isupper().fillna(False).astype(bool) & (stripped.str.len().fillna(0) > 3))
+            )
+            df_data[col] = values.where(keep, None)
         
         # Fill merged
         merge_columns = ['NO', 'KECAMATAN', 'NO_KEMUKIMAN', 'KEMUKIMAN', 'NO_GAMPONG', 'GAMPONG']
@@ -326,6 +472,8 @@ def load_tuha_peuet():
 
 def load_all_data():
     """Load semua data dari semua file"""
+    # One batchGet for every sheet not cached yet; loaders below read the cache
+    prefetch_sheets(DATA_SHEETS)
     return {
         'camat_mukim_geuchik': load_camat_mukim_geuchik(),
         'geuchik_detail': load_geuchik_detail(),
@@ -334,51 +482,95 @@ def load_all_data():
     }
 
 
+# Normalized tables mirrored into the SQLite store: table -> (source sheet, loader)
+STORE_TABLES = {
+    'camat_mukim_geuchik': ("Camat_Mukim_Geuchik", load_camat_mukim_geuchik),
+    'geuchik_detail': ("Geuchik_Detail", load_geuchik_detail),
+    'perangkat_desa': ("Perangkat_Desa", load_perangkat_desa),
+    'tuha_peuet': ("Tuha_Peuet", load_tuha_peuet),
+}
+
+
+@st.cache_resource
+def get_normalized_store():
+    """
+    Get the shared SQLite store of normalized tables.
+    In memory by default; set sqlite_path to keep it in a file.
+    """
+    return NormalizedStore(get_setting("sqlite_path", ":memory:"))
+
+
+def sync_store(tables=None):
+    """
+    Make sure the SQLite tables match the current sheet contents.
+    The raw sheet cache is revision-checked first; a table is re-imported only
+    when the generation of its source sheet changed since the last import.
+    """
+    tables = list(STORE_TABLES) if tables is None else list(tables)
+    prefetch_sheets([STORE_TABLES[table][0] for table in tables])
+
+    store = get_normalized_store()
+    for table in tables:
+        sheet_name, loader = STORE_TABLES[table]
+        token = sheet_token(sheet_name)
+        if store.token(table) == token:
+            continue
+        try:
+            store.replace_table(table, loader(), token)
+        except Exception as e:
+            print(f"Error importing {table} into SQLite store: {e}")
+    return store
+
+
+def query_table(table, filters=None, search=None, search_columns=()):
+    """
+    Get rows of a normalized table from the SQLite store.
+    filters: {column: value} equality filters (None = no filter);
+    search: case-insensitive text matched against search_columns.
+    """
+    return sync_store([table]).query(table, filters, search, search_columns)
+
+
+def get_distinct_values(table, column, filters=None):
+    """Get sorted distinct values of a column, opsional filter"""
+    return sync_store([table]).distinct(table, column, filters)
+
+
+def get_table_summary(table, distinct_columns=(), filters=None):
+    """Get jumlah baris dan jumlah nilai unik per kolom"""
+    return sync_store([table]).summary(table, distinct_columns, filters)
+
+
 def get_kecamatan_list():
     """Get daftar kecamatan unik"""
-    df = load_camat_mukim_geuchik()
-    if not df.empty:
-        return sorted(df['KECAMATAN'].unique().tolist())
-    return []
+    return get_distinct_values('camat_mukim_geuchik', 'KECAMATAN')
 
 
 def get_kemukiman_list(kecamatan=None):
     """Get daftar kemukiman, opsional filter by kecamatan"""
-    df = load_camat_mukim_geuchik()
-    if not df.empty:
-        if kecamatan:
-            df = df[df['KECAMATAN'] == kecamatan]
-        return sorted(df['KEMUKIMAN'].dropna().unique().tolist())
-    return []
+    return get_distinct_values('camat_mukim_geuchik', 'KEMUKIMAN', {'KECAMATAN': kecamatan or None})
 
 
 def get_gampong_list(kecamatan=None, kemukiman=None):
     """Get daftar gampong, opsional filter by kecamatan atau kemukiman"""
-    df = load_camat_mukim_geuchik()
-    if not df.empty:
-        if kecamatan:
-            df = df[df['KECAMATAN'] == kecamatan]
-        if kemukiman:
-            df = df[df['KEMUKIMAN'] == kemukiman]
-        return sorted(df['GAMPONG'].unique().tolist())
-    return []
+    return get_distinct_values(
+        'camat_mukim_geuchik', 'GAMPONG',
+        {'KECAMATAN': kecamatan or None, 'KEMUKIMAN': kemukiman or None}
+    )
 
 
 def get_statistics():
     """Get statistik ringkasan data"""
-    data = load_all_data()
-    
-    df1 = data['camat_mukim_geuchik']
-    df3 = data['perangkat_desa']
-    df4 = data['tuha_peuet']
+    sync_store()
+    main = get_table_summary('camat_mukim_geuchik', ['KECAMATAN', 'KEMUKIMAN', 'GAMPONG'])
     
     stats = {
-        'total_kecamatan': df1['KECAMATAN'].nunique() if not df1.empty else 0,
-        'total_kemukiman': df1['KEMUKIMAN'].nunique() if not df1.empty else 0,
-        'total_gampong': df1['GAMPONG'].nunique() if not df1.empty else 0,
-        'total_geuchik': len(df1) if not df1.empty else 0,
-        'total_perangkat': len(df3) if not df3.empty else 0,
-        'total_tuha_peuet': len(df4) if not df4.empty else 0
+        'total_kecamatan': main['KECAMATAN'],
+        'total_kemukiman': main['KEMUKIMAN'],
+        'total_gampong': main['GAMPONG'],
+        'total_geuchik': main['rows'],
+        'total_perangkat': get_table_summary('perangkat_desa')['rows'],
+        'total_tuha_peuet': get_table_summary('tuha_peuet')['rows']
     }
     
     return stats
@@ -386,29 +578,218 @@ def get_statistics():
 
 def get_data_by_kecamatan(kecamatan):
     """Get semua data untuk kecamatan tertentu"""
-    data = load_all_data()
+    sync_store()
     result = {}
     
-    df1 = data['camat_mukim_geuchik']
-    if not df1.empty:
-        result['camat_mukim_geuchik'] = df1[df1['KECAMATAN'] == kecamatan]
-    
-    df2 = data['geuchik_detail']
-    if not df2.empty:
-        result['geuchik_detail'] = df2[df2['KECAMATAN'] == kecamatan]
-    
-    df3 = data['perangkat_desa']
-    if not df3.empty:
-        result['perangkat_desa'] = df3[df3['KECAMATAN'] == kecamatan]
-    
-    df4 = data['tuha_peuet']
-    if not df4.empty:
-        result['tuha_peuet'] = df4[df4['KECAMATAN'] == kecamatan]
+    for table in STORE_TABLES:
+        if get_table_summary(table)['rows']:
+            result[table] = query_table(table, {'KECAMATAN': kecamatan})
     
     return result
 
 
-def invalidate_data_cache():
-    """Force clear all data caches"""
-    load_raw_data_from_sheet.clear()
-    st.cache_data.clear()
+@st.cache_resource
+def get_row_indexes():
+    """Get the shared row-location indexes of the Perangkat_Desa/Tuha_Peuet blocks"""
+    return RowIndexes()
+
+
+def get_cached_grids(sheet_names):
+    """
+    Get {sheet_name: values} from the revision-checked sheet cache, fetching
+    missing sheets with one batchGet. Sheets that could not be cached are
+    read straight from the backend.
+    """
+    prefetch_sheets(sheet_names)
+    cache = get_sheet_cache()
+    grids = {name: cache.get(name) for name in sheet_names}
+    missing = [name for name, values in grids.items() if values is None]
+    if missing:
+        grids.update(get_storage_backend().batch_get(missing))
+    return grids
+
+
+def get_sheet_versions(sheet_names):
+    """
+    Get (revision, {sheet_name: generation}) of the cached grids, the stamp a
+    planned write is checked against with sheet_versions_current().
+    The sheets are fetched first so the stamp is not outdated by our own fetch.
+    """
+    prefetch_sheets(sheet_names)
+    cache = get_sheet_cache()
+    return cache.current_revision(), {name: cache.generation(name) for name in sheet_names}
+
+
+def sheet_versions_current(versions, revision=None):
+    """
+    Check a stamp from get_sheet_versions against a fresh revision probe
+    (one small metadata request, or the revision just probed) and the
+    generations of the shared cache.
+    False means another session or process wrote since the stamp was taken.
+    """
+    stamped, generations = versions
+    cache = get_sheet_cache()
+    if revision is None:
+        revision = cache.current_revision(force=True)
+    if revision != stamped:
+        return False
+    return all(cache.generation(name) == generation for name, generation in generations.items())
+
+
+def probe_revision():
+    """
+    Probe the spreadsheet revision now, so outdated cached grids are refetched
+    on next use. Called right before a write, the result is the base_revision
+    for the write-through functions below.
+    """
+    return get_sheet_cache().begin_write()
+
+
+def get_row_index(sheet_name):
+    """
+    Get (RowIndex, values) for a worksheet, built from its cached raw grid
+    and reused until the grid changes. Returns (None, None) if the sheet
+    could not be loaded.
+    """
+    cache = get_sheet_cache()
+    snapshot = cache.snapshot(sheet_name)
+    if snapshot is None:
+        load_raw_data_from_sheet(sheet_name)
+        snapshot = cache.snapshot(sheet_name)
+        if snapshot is None:
+            return None, None
+    values, generation = snapshot
+    return get_row_indexes().get(sheet_name, values, generation), values
+
+
+def invalidate_data_cache(sheet_names=None, base_revision=None):
+    """
+    Drop cached data for the given worksheets after they were written.
+    Without sheet_names all cached sheets are dropped. Other cached
+    artifacts (st.cache_data, client, registry) are left alone; the other
+    cached sheets stay valid only with the base_revision probed before the
+    write (see probe_revision).
+    """
+    cache = get_sheet_cache()
+    if sheet_names is None:
+        cache.invalidate()
+    else:
+        cache.invalidate_after_write(list(sheet_names), base_revision)
+
+
+def write_through_cache(cell_updates, invalidated=(), base_revision=None):
+    """
+    Write-through after a successful write.
+    cell_updates: {sheet_name: [(row, col, value), ...]} is applied to the
+    cached raw grids in the order it was sent, so the post-save rerun renders
+    from memory; sheets in invalidated are dropped. base_revision is the
+    revision probed right before the write (probe_revision); without it the
+    other cached sheets are refetched on next use. The patched sheets are
+    then checked in the background (see _verify_cached_sheets).
+    """
+    cache = get_sheet_cache()
+    patched = cache.apply_write(cell_updates, invalidated, base_revision)
+    _schedule_checks({name: (cache.generation(name), cell_updates[name]) for name in patched})
+
+
+def write_through_rows(sheet_name, row, delta, values=None, block=None, number=None, base_revision=None):
+    """
+    Write-through after a successful row insert (delta=+1, with the new row's
+    values and its block/number) or delete (delta=-1) at 1-based row: the
+    cached grid and its row index are shifted instead of dropped, then the
+    sheet is checked in the background like write_through_cache.
+    """
+    write_through_row_changes(sheet_name, [(row, delta, values, block, number)], base_revision)
+
+
+def write_through_row_changes(sheet_name, changes, base_revision=None):
+    """
+    write_through_rows for several changes [(row, delta, values, block,
+    number), ...] applied in order (one batch_change_rows call): the grid
+    and its row index are patched once.
+    """
+    cache = get_sheet_cache()
+    generations = cache.apply_row_changes(
+        sheet_name, [(row, delta, values) for row, delta, values, _, _ in changes], base_revision)
+    if generations is None:
+        get_row_indexes().invalidate(sheet_name)
+        return
+    get_row_indexes().shift_rows(
+        sheet_name, *generations, [(row, delta, block, number) for row, delta, _, block, number in changes])
+    _schedule_checks({sheet_name: (generations[1], None)})
+
+
+def _schedule_checks(written):
+    """
+    Queue the background check of patched sheets {sheet_name: (generation,
+    cells written or None)}. Optionally a sample of the writes
+    (write_verify_rate, 0..1, default 0 = off) is re-read and compared cell
+    by cell; the others are only re-read if the revision shows a change that
+    is not ours.
+    """
+    if not written:
+        return
+    rate = get_float_setting("write_verify_rate", 0)
+    sampled = rate > 0 and random.random() < rate
+    get_write_checks().submit({
+        name: (generation, (cells or []) if sampled else None)
+        for name, (generation, cells) in written.items()
+    })
+
+
+def _cells_checksum(values_list):
+    """Checksum of cell values as compared after a write ('.0' and whitespace ignored)"""
+    payload = json.dumps([normalize_number(v) for v in values_list], ensure_ascii=False)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+
+def _check_written_cells(sheet_name, values, expected):
+    """Compare written cells [(row, col, value), ...] with re-read values, logging a mismatch"""
+    def actual(row, col):
+        return values[row - 1][col - 1] if row <= len(values) and col <= len(values[row - 1]) else ''
+
+    if _cells_checksum([v for _, _, v in expected]) == _cells_checksum([actual(r, c) for r, c, _ in expected]):
+        return True
+    mismatches = [
+        {'row': r, 'col': c, 'expected': v, 'actual': actual(r, c)}
+        for r, c, v in expected if normalize_number(v) != normalize_number(actual(r, c))
+    ]
+    log_event('write_verify_mismatch', sheet=sheet_name, cells=len(expected), mismatches=mismatches[:10])
+    return False
+
+
+def _verify_cached_sheets(checks):
+    """
+    Check patched grids {sheet_name: (generation, expected)} (background
+    worker). One revision probe tells whether each grid is still current: a
+    grid carried to the revision our write produced is kept, one left behind
+    (another change landed around the write) is re-read. Sampled sheets
+    (expected is a list of the cells written, [(row, col, value), ...]) are
+    always re-read and compared with what was written. All re-reads go out
+    as one batchGet.
+    """
+    cache = get_sheet_cache()
+    try:
+        # Refresh traffic must not delay interactive reads
+        with background_requests():
+            revision = cache.current_revision(force=True)
+            stale = [
+                name for name, (_, expected) in checks.items()
+                if expected is not None or cache.revision_of(name) != revision
+            ]
+            if not stale:
+                return
+            fetched = get_storage_backend().batch_get(stale)
+    except Exception as e:
+        # Patched values stay until the next revision change triggers a refetch
+        print(f"Error verifying cached sheets {list(checks)}: {e}")
+        return
+    for sheet_name in stale:
+        generation, expected = checks[sheet_name]
+        values = fetched.get(sheet_name)
+        if values is None:
+            continue
+        if expected:
+            _check_written_cells(sheet_name, values, expected)
+        # Skipped if another write patched the sheet in the meantime
+        cache.put(sheet_name, values, revision, if_generation=generation)
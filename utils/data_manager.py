@@ -5,102 +5,373 @@ Sistem Manajemen Data Gampong - Dinas Pemberdayaan Kota Langsa
 Module untuk operasi CRUD dan integrasi cross-file di Google Sheets.
 """
 
+import hashlib
+import json
+import threading
 import pandas as pd
 import streamlit as st
-import gspread
-from utils.data_loader import SPREADSHEET_NAME, get_gspread_client, invalidate_data_cache
+from utils.data_loader import (
+    get_storage_backend, invalidate_data_cache, write_through_cache, write_through_rows, write_through_row_changes,
+    get_cached_grids, get_row_index, get_row_indexes, query_table,
+    get_sheet_versions, sheet_versions_current, probe_revision, get_sheet_cache,
+)
+from utils.row_index import normalize_number, block_at, RowIndex, ROW_INDEX_SPECS
+from utils.instrumentation import log_event
+from utils.excel_importer import IMPORT_LAYOUTS, diff_import, import_cells, new_member_row
+
+# Serializes check-and-write of the sessions of this process; other
+# processes are caught by the revision probe in write_planned
+_write_lock = threading.RLock()
+
+
+class WriteConflict(LookupError):
+    """The rows a write was planned on were changed by another session"""
 
 # We need to manually clear cache when updating data
-def clear_cache():
-    # Call the centralized cache invalidation
-    invalidate_data_cache()
+def clear_cache(*sheet_names, base_revision=None):
+    """Invalidate only the worksheets that were written (base_revision: probed before the write)"""
+    if sheet_names:
+        invalidate_data_cache(sheet_names, base_revision)
 
 def get_worksheet(sheet_name):
-    """Helper to get worksheet object"""
-    client = get_gspread_client()
-    if not client:
-        return None
+    """Helper to get worksheet object from the configured storage backend"""
     try:
-        sh = client.open(SPREADSHEET_NAME)
-        return sh.worksheet(sheet_name)
+        return get_storage_backend().worksheet(sheet_name)
     except Exception as e:
         st.error(f"Error accessing sheet {sheet_name}: {e}")
         return None
 
 
-def _sync_geuchik_data_across_files(gampong_name, field_map):
+# Worksheets read together (one batchGet) for the cross-file Geuchik sync
+GEUCHIK_SYNC_SHEETS = ["Camat_Mukim_Geuchik", "Geuchik_Detail", "Perangkat_Desa"]
+
+KEPALA_DESA_JABATAN = ['KEPALA DESA', 'PJ. KEPALA DESA']
+
+def read_snapshot(*sheet_names):
+    """Get several worksheets from the revision-checked cache (one batchGet for the missing ones)"""
+    return get_cached_grids(list(sheet_names))
+
+def drop_row_index(sheet_name):
+    """A failed structural write may mean the sheet moved under the index: drop it with the grid"""
+    get_row_indexes().invalidate(sheet_name)
+    invalidate_data_cache([sheet_name])
+
+def locate_member(sheet_name, block, number):
+    """
+    Get (row, values) of a member of a DESA/GAMPONG block from the row index.
+    An entry that no longer matches the cached grid drops the index, which
+    is rebuilt once. row is None if the member does not exist.
+    """
+    index, values = get_row_index(sheet_name)
+    if index is None:
+        return None, None
+    row = index.locate(block, number)
+    if row and not index.matches(values, row, number):
+        get_row_indexes().invalidate(sheet_name)
+        index, values = get_row_index(sheet_name)
+        row = index.locate(block, number)
+    return row, values
+
+def snapshot_index(snapshot, sheet_name):
+    """
+    Row index of the grid of sheet_name in snapshot, so a plan resolves rows
+    on the same grid its checksums are taken from. The shared index is reused
+    if it was built from that very grid. Raises LookupError if the sheet is
+    not in the snapshot.
+    """
+    values = snapshot.get(sheet_name)
+    if values is None:
+        raise LookupError('Sheet not found')
+    cached = get_sheet_cache().snapshot(sheet_name)
+    if cached is not None and cached[0] is values:
+        return get_row_indexes().get(sheet_name, *cached)
+    return RowIndex(values, **ROW_INDEX_SPECS[sheet_name])
+
+def _find_row(values, col, query):
+    """1-based row of the first cell in column col equal to query, or None"""
+    query = str(query)
+    for i, row in enumerate(values):
+        if len(row) >= col and row[col - 1] == query:
+            return i + 1
+    return None
+
+def normalize_cell(value):
+    """Value as compared by the diff: text, stripped, without a trailing '.0' ('' for None/NaN)"""
+    if value is None or (not isinstance(value, str) and pd.isna(value)):
+        return ''
+    return normalize_number(value)
+
+def current_values(table, block_column, block, number_column=None):
+    """
+    Current normalized values of one desa/gampong from the SQLite store, as
+    {number: {column: value}} per member (or {column: value} of the first
+    row without number_column), all passed through normalize_cell.
+    """
+    records = query_table(table, {block_column: block}).to_dict('records')
+    rows = [{col: normalize_cell(value) for col, value in record.items()} for record in records]
+    if number_column is None:
+        return rows[0] if rows else {}
+    return {row[number_column]: row for row in rows}
+
+def is_unchanged(current, field, value):
+    """True if a submitted form value equals the current normalized value of field"""
+    return field in current and current[field] == normalize_cell(value)
+
+def diff_cell_updates(cell_updates, grids):
+    """
+    Keep only the cells whose value differs from the current grid, compared
+    with normalize_cell. grids: {sheet_name: values}; sheets missing from it
+    are kept as they are.
+    """
+    changed = {}
+    for name, cells in cell_updates.items():
+        values = grids.get(name)
+        if values is None:
+            changed[name] = list(cells)
+            continue
+        kept = []
+        for row, col, value in cells:
+            current = values[row - 1][col - 1] if row <= len(values) and col <= len(values[row - 1]) else ''
+            if normalize_cell(current) != normalize_cell(value):
+                kept.append((row, col, value))
+        if kept:
+            changed[name] = kept
+    return changed
+
+def apply_cell_updates(cell_updates, snapshot=None, base_revision=None):
+    """
+    Write the changed cells of {sheet_name: [(row, col, value), ...]} with
+    one batch write and patch the cached grids with the same cells.
+    Cells are diffed against snapshot (the grids the plan was made from; the
+    cached grids for sheets not in it). When nothing changed there is no
+    write and the cache is left alone. base_revision is the revision probed
+    right before (probe_revision), probed here if not given.
+    Returns {sheet_name: cells} that were written.
+    """
+    cell_updates = {name: cells for name, cells in cell_updates.items() if cells}
+    grids = dict(snapshot or {})
+    missing = [name for name in cell_updates if name not in grids]
+    if missing:
+        grids.update(read_snapshot(*missing))
+    cell_updates = diff_cell_updates(cell_updates, grids)
+    if not cell_updates:
+        return {}
+    if base_revision is None:
+        base_revision = probe_revision()
+    response = get_storage_backend().batch_update(cell_updates)
+    confirm_write(cell_updates, response)
+    write_through_cache(cell_updates, base_revision=base_revision)
+    return cell_updates
+
+def confirm_write(cell_updates, response):
+    """
+    Confirm a batch write from its response instead of reading cells back:
+    the updated cell count (per range when the response lists them) must
+    match the cells sent. Otherwise the written sheets are dropped from the
+    cache and RuntimeError is raised, so a retry re-plans on fresh data.
+    """
+    expected = sum(len(cells) for cells in cell_updates.values())
+    responses = (response or {}).get('responses')
+    if responses:
+        confirmed = sum(r.get('updatedCells', 0) for r in responses)
+    else:
+        confirmed = (response or {}).get('totalUpdatedCells', expected)
+    if confirmed != expected:
+        invalidate_data_cache(list(cell_updates))
+        log_event('write_unconfirmed', sheets=list(cell_updates), expected=expected, confirmed=confirmed)
+        raise RuntimeError(f'Penulisan tidak terkonfirmasi: {confirmed} dari {expected} sel tersimpan')
+
+def row_checksum(sheet_name, values, row):
+    """Checksum of a row's content and of the DESA/GAMPONG block it belongs to"""
+    cells = [normalize_cell(v) for v in values[row - 1]] if row <= len(values) else []
+    while cells and not cells[-1]:
+        cells.pop()
+    payload = json.dumps([block_at(sheet_name, values, row), cells], ensure_ascii=False)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()[:16]
+
+def _plan_checksums(plan, snapshot):
+    """{(sheet_name, row): checksum} of every row a plan writes to"""
+    return {
+        (name, row): row_checksum(name, snapshot[name], row)
+        for name, cells in plan.items() if name in snapshot
+        for row, _, _ in cells
+    }
+
+def _rebase(plan, checksums, rebased, fresh):
+    """
+    Accept a plan re-made on fresh data if it writes the same values to the
+    same rows, only moved (rows inserted/deleted above them), and those rows
+    still have the content the original plan saw. Raises WriteConflict otherwise.
+    """
+    if set(plan) != set(rebased):
+        raise WriteConflict('Data telah diubah oleh pengguna lain, silakan muat ulang dan ulangi.')
+    for name, cells in plan.items():
+        new_cells = rebased[name]
+        same_values = [(col, normalize_cell(v)) for _, col, v in cells] == [(col, normalize_cell(v)) for _, col, v in new_cells]
+        if not same_values:
+            raise WriteConflict('Data telah diubah oleh pengguna lain, silakan muat ulang dan ulangi.')
+        for (old_row, _, _), (new_row, _, _) in zip(cells, new_cells):
+            checksum = checksums.get((name, old_row))
+            if checksum is not None and row_checksum(name, fresh[name], new_row) != checksum:
+                raise WriteConflict(f'Baris {old_row} di {name} telah diubah oleh pengguna lain, silakan muat ulang dan ulangi.')
+    return rebased
+
+def _scope_rows(sheet_name, values, target):
+    """Rows of a sheet an edit of DESA/GAMPONG target may write to"""
+    if sheet_name in ROW_INDEX_SPECS:
+        index = RowIndex(values, **ROW_INDEX_SPECS[sheet_name])
+        rows = set(index.rows(target).values())
+        anchor = index.anchor(target)
+        return rows | {anchor} if anchor else rows
+    search_col = {"Camat_Mukim_Geuchik": 6, "Geuchik_Detail": 8}.get(sheet_name)
+    row = _find_row(values, search_col, target) if search_col else None
+    return {row} if row else set()
+
+def edit_stamp(target, sheet_names=None):
+    """
+    Stamp of the data an edit form of DESA/GAMPONG target is rendered from:
+    the sheet versions and the checksum of every row of the target the edit
+    may write to. commit_edits rejects an edit whose rows changed since.
+    """
+    sheet_names = list(sheet_names or EDIT_SHEETS)
+    versions = get_sheet_versions(sheet_names)
+    snapshot = read_snapshot(*sheet_names)
+    return {
+        'versions': versions,
+        'rows': {
+            name: sorted({row_checksum(name, values, row) for row in _scope_rows(name, values, target)})
+            for name, values in snapshot.items()
+        },
+    }
+
+def check_base(plan, snapshot, stamp):
+    """
+    Raise WriteConflict if a row the plan writes to differs from what the
+    edit was made on (stamp from edit_stamp). Rows that only moved keep
+    their checksum, so the plan is rebased onto their new position.
+    """
+    if not stamp:
+        return
+    _, generations = stamp['versions']
+    cache = get_sheet_cache()
+    if all(cache.generation(name) == generation for name, generation in generations.items()):
+        return
+    for name, cells in plan.items():
+        seen = set(stamp['rows'].get(name, ()))
+        for row in sorted({row for row, _, _ in cells}):
+            if row_checksum(name, snapshot[name], row) not in seen:
+                raise WriteConflict(f'Baris {row} di {name} telah diubah oleh pengguna lain sejak form dibuka, silakan muat ulang dan ulangi.')
+
+def write_planned(plan_fn, sheet_names):
+    """
+    Plan and write cells with optimistic concurrency control.
+    plan_fn(snapshot) -> {sheet_name: cells} is made from the cached grids of
+    sheet_names, stamped with their versions and the checksum of every row
+    it writes to. Right before the write the revision is probed again; if
+    anything changed, the rows are checked on fresh data: unchanged rows are
+    written as planned, rows that only moved are rebased onto their new
+    position, and rows whose content changed raise WriteConflict.
+    Returns {sheet_name: cells} that were written.
+    """
+    with _write_lock:
+        versions = get_sheet_versions(sheet_names)
+        snapshot = read_snapshot(*sheet_names)
+        plan = plan_fn(snapshot)
+        checksums = _plan_checksums(plan, snapshot)
+
+        base_revision = probe_revision()
+        if not sheet_versions_current(versions, base_revision):
+            fresh = read_snapshot(*sheet_names)
+            moved = any(
+                row_checksum(name, fresh[name], row) != checksum
+                for (name, row), checksum in checksums.items()
+            )
+            if moved:
+                try:
+                    rebased = plan_fn(fresh)
+                except WriteConflict:
+                    raise
+                except LookupError as e:
+                    raise WriteConflict(f'Data tidak ditemukan lagi ({e}), kemungkinan telah diubah oleh pengguna lain.') from e
+                plan = _rebase(plan, checksums, rebased, fresh)
+            snapshot = fresh
+
+        return apply_cell_updates(plan, snapshot, base_revision)
+
+def _plan_geuchik_sync(snapshot, gampong_name, field_map):
+    """
+    Compute the cells to write so that Geuchik data matches across files.
+    snapshot: {sheet_name: values} of GEUCHIK_SYNC_SHEETS.
+    Returns {sheet_name: [(row, col, value), ...]}.
+    """
+    plan = {}
+
+    # 1. Camat_Mukim_Geuchik (Only has NAMA GEUCHIK)
+    if 'NAMA_LENGKAP' in field_map:
+        row = _find_row(snapshot["Camat_Mukim_Geuchik"], 6, gampong_name)
+        if row:
+            plan["Camat_Mukim_Geuchik"] = [(row, 7, field_map['NAMA_LENGKAP'])]
+
+    # 2. Geuchik_Detail
+    # Fields: NO_DESA(7), NAMA_LENGKAP(9), JENIS_KELAMIN(13), JABATAN(17), NO_HP(18)
+    detail_cols = {'NO_DESA': 7, 'NAMA_LENGKAP': 9, 'JENIS_KELAMIN': 13, 'JABATAN': 17, 'NO_HP': 18}
+    row = _find_row(snapshot["Geuchik_Detail"], 8, gampong_name)
+    if row:
+        plan["Geuchik_Detail"] = [(row, col, field_map[f]) for f, col in detail_cols.items() if f in field_map]
+
+    # 3. Perangkat_Desa: the Kepala Desa row of this desa
+    # Fields: NO_DESA(7), NAMA_LENGKAP(12), JENIS_KELAMIN(14), JABATAN(15), NO_HP(16)
+    perangkat_cols = {'NO_DESA': 7, 'NAMA_LENGKAP': 12, 'JENIS_KELAMIN': 14, 'JABATAN': 15, 'NO_HP': 16}
+    for i, values in enumerate(snapshot["Perangkat_Desa"]):
+        if len(values) < 8 or values[7] != str(gampong_name):
+            continue
+        jabatan_val = values[14] if len(values) > 14 else ''
+        if jabatan_val and str(jabatan_val).strip().upper() in KEPALA_DESA_JABATAN:
+            plan["Perangkat_Desa"] = [(i + 1, col, field_map[f]) for f, col in perangkat_cols.items() if f in field_map]
+            break
+
+    return plan
+
+def _sync_geuchik_data_across_files(gampong_name, field_map, own_plan=None):
     """
     Internal helper to sync ANY Geuchik data across files.
     field_map: dict of {field_name: new_value}
     Supported fields: NAMA_LENGKAP, JENIS_KELAMIN, JABATAN, NO_HP, NO_DESA
+    The three sheets come from one cached snapshot and all target cells, plus
+    the caller's own cells (own_plan(snapshot)), go out in one batchUpdate.
+    Returns {sheet_name: cells} that were written.
     """
-    try:
-        # 1. Camat_Mukim_Geuchik (Only has NAMA GEUCHIK)
-        if 'NAMA_LENGKAP' in field_map:
-            new_name = field_map['NAMA_LENGKAP']
-            ws1 = get_worksheet("Camat_Mukim_Geuchik")
-            if ws1:
-                try:
-                    cell = ws1.find(gampong_name)
-                    if cell and cell.col == 6:
-                        ws1.update_cell(cell.row, 7, new_name)
-                except gspread.exceptions.CellNotFound:
-                    pass
-
-        # 2. Geuchik_Detail
-        # Fields: NO_DESA(7), NAMA_LENGKAP(9), JENIS_KELAMIN(13), JABATAN(17), NO_HP(18)
-        ws2 = get_worksheet("Geuchik_Detail")
-        if ws2:
-            try:
-                cell = ws2.find(gampong_name)
-                if cell and cell.col == 8:
-                    row = cell.row
-                    if 'NO_DESA' in field_map: ws2.update_cell(row, 7, field_map['NO_DESA'])
-                    if 'NAMA_LENGKAP' in field_map: ws2.update_cell(row, 9, field_map['NAMA_LENGKAP'])
-                    if 'JENIS_KELAMIN' in field_map: ws2.update_cell(row, 13, field_map['JENIS_KELAMIN'])
-                    if 'JABATAN' in field_map: ws2.update_cell(row, 17, field_map['JABATAN'])
-                    if 'NO_HP' in field_map: ws2.update_cell(row, 18, field_map['NO_HP'])
-            except gspread.exceptions.CellNotFound:
-                pass
-
-        # 3. Perangkat_Desa
-        # Fields: NO_DESA(7), NAMA_LENGKAP(12), JENIS_KELAMIN(14), JABATAN(15), NO_HP(16)
-        ws3 = get_worksheet("Perangkat_Desa")
-        if ws3:
-            cells = ws3.findall(gampong_name)
-            for cell in cells:
-                if cell.col == 8:
-                    # Check if this row is for Kepala Desa
-                    jabatan_val = ws3.cell(cell.row, 15).value
-                    # We check if it's currently Kepdes OR if we are updating Jabatan to/from Kepdes
-                    # Ideally we find the existing Kepdes row
-                    if jabatan_val and str(jabatan_val).strip().upper() in ['KEPALA DESA', 'PJ. KEPALA DESA']:
-                        row = cell.row
-                        if 'NO_DESA' in field_map: ws3.update_cell(row, 7, field_map['NO_DESA'])
-                        if 'NAMA_LENGKAP' in field_map: ws3.update_cell(row, 12, field_map['NAMA_LENGKAP'])
-                        if 'JENIS_KELAMIN' in field_map: ws3.update_cell(row, 14, field_map['JENIS_KELAMIN'])
-                        if 'JABATAN' in field_map: ws3.update_cell(row, 15, field_map['JABATAN'])
-                        if 'NO_HP' in field_map: ws3.update_cell(row, 16, field_map['NO_HP'])
-                        break
+    def plan(snapshot):
+        own = own_plan(snapshot) if own_plan else {}
+        return merge_cell_updates(own, _plan_geuchik_sync(snapshot, gampong_name, field_map))
+    return write_planned(plan, GEUCHIK_SYNC_SHEETS)
 
-    except Exception as e:
-        print(f"Sync error: {e}")
+def merge_cell_updates(*plans):
+    """
+    Merge {sheet_name: [(row, col, value), ...]} plans in order into one;
+    a later value for the same cell replaces the earlier one.
+    """
+    merged = {}
+    for plan in plans:
+        for name, cells in plan.items():
+            sheet = merged.setdefault(name, {})
+            for row, col, value in cells:
+                sheet[(row, col)] = value
+    return {name: [(row, col, value) for (row, col), value in cells.items()] for name, cells in merged.items()}
 
 def update_geuchik_name(gampong_name, old_name, new_name):
     """Update nama Geuchik di semua sheet (Triggered from Page 2)"""
     try:
         _sync_geuchik_data_across_files(gampong_name, {'NAMA_LENGKAP': new_name})
-        clear_cache()
         return {'file1': {'updated': True, 'rows': 1}, 'file2': {'updated': True, 'rows': 1}, 'file3': {'updated': True, 'rows': 1}}
+    except WriteConflict as e:
+         return {'error': str(e), 'conflict': True}
     except Exception as e:
          return {'error': str(e)}
 
 def update_geuchik_detail(desa, field, new_value):
     """Update satu field data detail Geuchik"""
     try:
-        ws = get_worksheet("Geuchik_Detail")
-        if not ws: return {'success': False, 'message': 'Sheet not found'}
-        
         field_col_map = {
             'NO_DESA': 7, 'NAMA_LENGKAP': 9, 'TGL_LAHIR': 10, 'BLN_LAHIR': 11,
             'THN_LAHIR': 12, 'JENIS_KELAMIN': 13, 'PENDIDIKAN': 14,
@@ -109,19 +380,23 @@ def update_geuchik_detail(desa, field, new_value):
         col = field_col_map.get(field)
         if not col: return {'success': False, 'message': 'Field invalid'}
 
-        cell = ws.find(desa)
-        if cell and cell.col == 8: 
-             ws.update_cell(cell.row, col, new_value)
-             
-             # SYNC: If updating key fields, sync to other files
-             sync_fields = ['NO_DESA', 'NAMA_LENGKAP', 'JENIS_KELAMIN', 'JABATAN', 'NO_HP']
-             if field in sync_fields:
-                 _sync_geuchik_data_across_files(desa, {field: new_value})
-                 
-             clear_cache()
-             return {'success': True, 'message': 'Updated'}
-        
-        return {'success': False, 'message': 'Desa not found'}
+        def own_plan(snapshot):
+            row = _find_row(snapshot["Geuchik_Detail"], 8, desa)
+            if not row:
+                raise LookupError('Desa not found')
+            return {"Geuchik_Detail": [(row, col, new_value)]}
+
+        # SYNC: If updating key fields, sync to other files (same batch write)
+        sync_fields = ['NO_DESA', 'NAMA_LENGKAP', 'JENIS_KELAMIN', 'JABATAN', 'NO_HP']
+        if field in sync_fields:
+            _sync_geuchik_data_across_files(desa, {field: new_value}, own_plan)
+        else:
+            write_planned(own_plan, ["Geuchik_Detail"])
+        return {'success': True, 'message': 'Updated'}
+    except WriteConflict as e:
+        return {'success': False, 'conflict': True, 'message': str(e)}
+    except LookupError as e:
+        return {'success': False, 'message': str(e)}
     except Exception as e:
         return {'success': False, 'error': str(e)}
 
@@ -130,6 +405,7 @@ def update_camat_name(kecamatan, old_name, new_name):
     try:
         ws = get_worksheet("Camat_Mukim_Geuchik")
         if not ws: return {'success': False, 'message': 'Sheet not found'}
+        base_revision = probe_revision()
         
         cells = ws.findall(kecamatan)
         count = 0
@@ -141,7 +417,7 @@ def update_camat_name(kecamatan, old_name, new_name):
                      count += 1
         
         if count > 0:
-            clear_cache()
+            clear_cache("Camat_Mukim_Geuchik", base_revision=base_revision)
             return {'success': True, 'rows': count}
         return {'success': False, 'message': 'Data not found'}
     except Exception as e:
@@ -150,6 +426,7 @@ def update_camat_name(kecamatan, old_name, new_name):
 def update_mukim_name(kemukiman, old_name, new_name):
     try:
         ws = get_worksheet("Camat_Mukim_Geuchik")
+        base_revision = probe_revision()
         cells = ws.findall(kemukiman)
         count = 0
         for cell in cells:
@@ -158,7 +435,7 @@ def update_mukim_name(kemukiman, old_name, new_name):
                     ws.update_cell(cell.row, 5, new_name)
                     count += 1
         if count > 0:
-            clear_cache()
+            clear_cache("Camat_Mukim_Geuchik", base_revision=base_revision)
             return {'success': True, 'rows': count}
         return {'success': False, 'message': 'Data not found'}
     except Exception as e:
@@ -167,6 +444,7 @@ def update_mukim_name(kemukiman, old_name, new_name):
 def add_gampong(data):
     try:
         ws = get_worksheet("Camat_Mukim_Geuchik")
+        base_revision = probe_revision()
         vals = ws.col_values(1) 
         nums = [int(x) for x in vals if str(x).isdigit()]
         new_no = max(nums) + 1 if nums else 1
@@ -177,7 +455,7 @@ def add_gampong(data):
             data['GAMPONG'], data['NAMA_GEUCHIK']
         ]
         ws.append_row(row)
-        clear_cache()
+        clear_cache("Camat_Mukim_Geuchik", base_revision=base_revision)
         return {'success': True}
     except Exception as e:
         return {'success': False, 'error': str(e)}
@@ -185,62 +463,50 @@ def add_gampong(data):
 def delete_gampong(gampong_name):
     try:
         ws = get_worksheet("Camat_Mukim_Geuchik")
-        cell = ws.find(gampong_name)
-        if cell and cell.col == 6: 
-            ws.delete_rows(cell.row)
-            clear_cache()
-            return {'success': True, 'message': 'Deleted'}
+        with _write_lock:
+            # Row taken from a revision-checked grid, not from an older snapshot
+            base_revision = probe_revision()
+            values = read_snapshot("Camat_Mukim_Geuchik")["Camat_Mukim_Geuchik"]
+            row = _find_row(values, 6, gampong_name)
+            if row:
+                ws.delete_rows(row)
+                write_through_rows("Camat_Mukim_Geuchik", row, -1, base_revision=base_revision)
+                return {'success': True, 'message': 'Deleted'}
         return {'success': False, 'message': 'Not found'}
     except Exception as e:
         return {'success': False, 'error': str(e)}
 
 def update_perangkat_desa(desa, no_urut, field, new_value):
     try:
-         ws = get_worksheet("Perangkat_Desa")
-         
-         # Manual Search with ffill logic because DESA might be merged
-         all_vals = ws.get_all_values()
-         
-         target_desa = str(desa).strip().upper()
-         target_no = str(no_urut).strip()
-         if target_no.endswith(".0"): target_no = target_no[:-2]
-
-         current_desa = None
-         
-         for i, row in enumerate(all_vals):
-             if len(row) > 7: # Ensure row has enough cols
-                 val_desa = str(row[7]).strip()
-                 if val_desa:
-                     current_desa = val_desa
-                 
-                 if current_desa and current_desa.upper() == target_desa:
-                     # Check NO_URUT (Col 10 index -> 11th col)
-                     if len(row) > 10:
-                         val_urut = str(row[10]).strip()
-                         if val_urut.endswith(".0"): val_urut = val_urut[:-2]
-                         
-                         if val_urut == target_no:
-                             # Found target row!
-                             actual_row = i + 1
-                             
-                             field_col_map = {'NO_DESA': 7, 'NAMA_LENGKAP': 12, 'NIK': 13, 'JENIS_KELAMIN': 14, 'JABATAN': 15, 'NO_HP': 16}
-                             c_idx = field_col_map.get(field)
-                             if c_idx:
-                                 ws.update_cell(actual_row, c_idx, new_value)
-                                 
-                                 # SYNC Logic
-                                 sync_fields = ['NO_DESA', 'NAMA_LENGKAP', 'JENIS_KELAMIN', 'JABATAN', 'NO_HP']
-                                 if field in sync_fields:
-                                     # Fetch Jabatan from sheet to be safe (or from row data if reliable)
-                                     # Row data index 14 is Jabatan
-                                     jabatan = str(row[14]).upper() if len(row) > 14 else ''
-                                     if jabatan and jabatan in ['KEPALA DESA', 'PJ. KEPALA DESA']:
-                                         _sync_geuchik_data_across_files(desa, {field: new_value})
-                                         
-                                 clear_cache()
-                                 return {'success': True}
-                                 
-         return {'success': False, 'message': 'Data Not Found'}
+         field_col_map = {'NO_DESA': 7, 'NAMA_LENGKAP': 12, 'NIK': 13, 'JENIS_KELAMIN': 14, 'JABATAN': 15, 'NO_HP': 16}
+         c_idx = field_col_map.get(field)
+
+         if not c_idx:
+             return {'success': False, 'message': 'Data Not Found'}
+
+         def plan(snapshot):
+             # Row located through the DESA/NO_URUT index (DESA is merged),
+             # the Geuchik sheets for the sync come from the same cached snapshot
+             actual_row, all_vals = locate_member("Perangkat_Desa", desa, no_urut)
+             if not actual_row:
+                 raise LookupError('Data Not Found')
+             own = {"Perangkat_Desa": [(actual_row, c_idx, new_value)]}
+
+             # SYNC Logic (same batch write)
+             sync_fields = ['NO_DESA', 'NAMA_LENGKAP', 'JENIS_KELAMIN', 'JABATAN', 'NO_HP']
+             # Row data index 14 is Jabatan
+             row = all_vals[actual_row - 1]
+             jabatan = str(row[14]).upper() if len(row) > 14 else ''
+             if field in sync_fields and jabatan in KEPALA_DESA_JABATAN:
+                 return merge_cell_updates(own, _plan_geuchik_sync(snapshot, desa, {field: new_value}))
+             return own
+
+         write_planned(plan, GEUCHIK_SYNC_SHEETS)
+         return {'success': True}
+    except WriteConflict as e:
+        return {'success': False, 'conflict': True, 'message': str(e)}
+    except LookupError as e:
+        return {'success': False, 'message': str(e)}
     except Exception as e:
         return {'success': False, 'error': str(e)}
 
@@ -249,45 +515,33 @@ def add_kadus(data):
     try:
         ws = get_worksheet("Perangkat_Desa")
         target_desa = str(data['DESA']).strip()
-        all_vals = ws.get_all_values()
-        
-        start_row_idx = -1
-        last_row_idx = -1
-        max_no = 0
-        
-        current_desa = None
-        
-        for i, row in enumerate(all_vals):
-            if len(row) > 7:
-                val_desa = str(row[7]).strip()
-                if val_desa:
-                     current_desa = val_desa
-                
-                if current_desa and current_desa.upper() == target_desa.upper():
-                     if start_row_idx == -1: start_row_idx = i
-                     last_row_idx = i
-                     
-                     if len(row) > 10:
-                         val_str = str(row[10]).strip()
-                         if val_str.endswith(".0"): val_str = val_str[:-2]
-                         if val_str.isdigit():
-                             max_no = max(max_no, int(val_str))
         
-        if start_row_idx == -1:
-             return {'success': False, 'message': 'Desa not found'}
-
-        insert_idx = last_row_idx + 1 
-        new_row = [''] * 16 
-        new_row[7] = target_desa 
-        new_row[10] = max_no + 1 
-        new_row[11] = data.get('NAMA_LENGKAP', '') 
-        new_row[12] = data.get('NIK', '') 
-        new_row[13] = data.get('JENIS_KELAMIN', 'L') 
-        new_row[14] = data.get('JABATAN', 'KADUS') 
-        new_row[15] = data.get('NO_HP', '') 
-        
-        ws.insert_row(new_row, index=insert_idx + 1)
-        clear_cache()
+        with _write_lock:
+            # Revision probed first, so rows moved by another session
+            # rebuild the index before the insert position is taken
+            base_revision = probe_revision()
+            index, _ = get_row_index("Perangkat_Desa")
+            last_row = index.last_row(target_desa) if index else None
+            if last_row is None:
+                 return {'success': False, 'message': 'Desa not found'}
+
+            max_no = index.max_number(target_desa)
+            insert_idx = last_row + 1
+            new_row = [''] * 16 
+            new_row[7] = target_desa 
+            new_row[10] = max_no + 1 
+            new_row[11] = data.get('NAMA_LENGKAP', '') 
+            new_row[12] = data.get('NIK', '') 
+            new_row[13] = data.get('JENIS_KELAMIN', 'L') 
+            new_row[14] = data.get('JABATAN', 'KADUS') 
+            new_row[15] = data.get('NO_HP', '') 
+            
+            try:
+                ws.insert_row(new_row, index=insert_idx)
+            except Exception:
+                drop_row_index("Perangkat_Desa")
+                raise
+            write_through_rows("Perangkat_Desa", insert_idx, 1, new_row, target_desa, max_no + 1, base_revision)
         return {'success': True, 'message': f'Added KADUS No {max_no + 1}'}
 
     except Exception as e:
@@ -297,242 +551,214 @@ def delete_kadus(desa, no_urut):
     try:
         ws = get_worksheet("Perangkat_Desa")
         
-        # Manual Search with ffill
-        all_vals = ws.get_all_values()
-        target_desa = str(desa).strip().upper()
-        target_no = str(no_urut).strip()
-        if target_no.endswith(".0"): target_no = target_no[:-2]
-        
-        current_desa = None
-        
-        for i, row in enumerate(all_vals):
-            if len(row) > 7:
-                val_desa = str(row[7]).strip()
-                if val_desa:
-                    current_desa = val_desa
-                
-                if current_desa and current_desa.upper() == target_desa:
-                    if len(row) > 10:
-                        val_urut = str(row[10]).strip()
-                        if val_urut.endswith(".0"): val_urut = val_urut[:-2]
-                        
-                        if val_urut == target_no:
-                            ws.delete_rows(i + 1)
-                            clear_cache()
-                            return {'success': True}
+        with _write_lock:
+            base_revision = probe_revision()
+            row, _ = locate_member("Perangkat_Desa", desa, no_urut)
+            if row:
+                try:
+                    ws.delete_rows(row)
+                except Exception:
+                    drop_row_index("Perangkat_Desa")
+                    raise
+                write_through_rows("Perangkat_Desa", row, -1, base_revision=base_revision)
+                return {'success': True}
 
         return {'success': False, 'message': 'Data not found'}
     except Exception as e:
         return {'success': False, 'error': str(e)}
 
+def plan_geuchik_detail_all(snapshot, desa, data):
+    """
+    Cells written by update_geuchik_detail_all: the Geuchik_Detail row and
+    the cross-file sync. Raises LookupError if the desa is not found.
+    """
+    field_col_map = {
+        'NO_DESA': 7, 'NAMA_LENGKAP': 9, 'TGL_LAHIR': 10, 'BLN_LAHIR': 11,
+        'THN_LAHIR': 12, 'JENIS_KELAMIN': 13, 'PENDIDIKAN': 14,
+        'SK_NOMOR': 15, 'SK_TANGGAL': 16, 'JABATAN': 17, 'NO_HP': 18
+    }
+    
+    row = _find_row(snapshot["Geuchik_Detail"], 8, desa)
+    if not row:
+        raise LookupError('Desa not found in Geuchik_Detail')
+
+    # Only fields that differ from the current normalized data are written and synced
+    current = current_values('geuchik_detail', 'DESA', desa)
+    data = {field: value for field, value in data.items() if not is_unchanged(current, field, value)}
+
+    written = []
+    for field, value in data.items():
+        col_idx = field_col_map.get(field)
+        if col_idx and value is not None:
+             written.append((row, col_idx, value))
+    
+    # SYNC: Sync all relevant fields
+    sync_fields = {}
+    for k in ['NO_DESA', 'NAMA_LENGKAP', 'JENIS_KELAMIN', 'JABATAN', 'NO_HP']:
+        if k in data and data[k]:
+             sync_fields[k] = data[k]
+    
+    return merge_cell_updates({"Geuchik_Detail": written}, _plan_geuchik_sync(snapshot, desa, sync_fields))
+
 def update_geuchik_detail_all(desa, data):
     """Update detail Geuchik (all fields)"""
     try:
-        ws = get_worksheet("Geuchik_Detail")
-        if not ws: return {'success': False, 'message': 'Sheet not found'}
-        
-        field_col_map = {
-            'NO_DESA': 7, 'NAMA_LENGKAP': 9, 'TGL_LAHIR': 10, 'BLN_LAHIR': 11,
-            'THN_LAHIR': 12, 'JENIS_KELAMIN': 13, 'PENDIDIKAN': 14,
-            'SK_NOMOR': 15, 'SK_TANGGAL': 16, 'JABATAN': 17, 'NO_HP': 18
-        }
+        # One cached snapshot of the edited sheet and the sync targets,
+        # detail row and sync targets go out in one batchUpdate
+        write_planned(lambda snapshot: plan_geuchik_detail_all(snapshot, desa, data), GEUCHIK_SYNC_SHEETS)
+        return {'success': True}
+    except WriteConflict as e:
+        return {'success': False, 'conflict': True, 'message': str(e)}
+    except LookupError as e:
+        return {'success': False, 'message': str(e)}
+    except Exception as e:
+        return {'success': False, 'error': str(e)}
+
+def _plan_perangkat_rows(snapshot, desa, data_list):
+    """
+    Cells written by update_perangkat_desa_all (edited rows and Kepala Desa
+    sync) and the number of rows matched, with robust matching (Merged Cells & Types)
+    """
+    field_col_map = {
+        'NO_DESA': 7, 'NO_URUT': 11, 'NAMA_LENGKAP': 12, 
+        'NIK': 13, 'JENIS_KELAMIN': 14, 'JABATAN': 15, 'NO_HP': 16
+    }
+    
+    # 1. Rows of this Desa (NO_URUT -> row) from the row index of the snapshot
+    all_vals = snapshot.get("Perangkat_Desa")
+    index = snapshot_index(snapshot, "Perangkat_Desa")
+    row_map = index.rows(desa)
+    
+    # Current normalized rows (merged NO_DESA forward filled), to send only changed fields
+    current = current_values('perangkat_desa', 'DESA', desa, 'NO_URUT')
+                        
+    updated_count = 0
+    sync_payload = {}
+    cells_to_update = []
+    
+    for item in data_list:
+        target_no = normalize_number(item.get('NO_URUT'))
+        target_row = row_map.get(target_no)
+        if not target_row and row_map and target_no and not pd.isna(item.get('NO_URUT')):
+            # The form showed this member: it was deleted or renumbered since
+            raise WriteConflict(f'Perangkat nomor {target_no} di {desa} tidak ditemukan lagi, kemungkinan telah diubah oleh pengguna lain.')
         
-        cell = ws.find(desa)
-        if cell and cell.col == 8:
-            row = cell.row
-            for field, value in data.items():
-                col_idx = field_col_map.get(field)
-                if col_idx and value is not None:
-                     ws.update_cell(row, col_idx, value)
+        if target_row:
+            current_row = current.get(target_no, {})
             
-            # SYNC: Sync all relevant fields
-            sync_fields = {}
-            for k in ['NO_DESA', 'NAMA_LENGKAP', 'JENIS_KELAMIN', 'JABATAN', 'NO_HP']:
-                if k in data and data[k]:
-                     sync_fields[k] = data[k]
+            # Need to read JABATAN for sync check (from the cached grid, no API call)
+            current_jabatan_val = ''
+            if target_row - 1 < len(all_vals) and len(all_vals[target_row-1]) > 14:
+                 current_jabatan_val = all_vals[target_row-1][14]
             
-            if sync_fields:
-                 _sync_geuchik_data_across_files(desa, sync_fields)
+            is_kepdes = current_jabatan_val and str(current_jabatan_val).strip().upper() in KEPALA_DESA_JABATAN
             
-            clear_cache()
-            return {'success': True}
+            row_updated = False
+            for field, val in item.items():
+                col = field_col_map.get(field)
+                if col and val is not None:
+                     if field in ['NO_HP', 'NIK']:
+                         val = normalize_number(val)
+                     row_updated = True
+                     if is_unchanged(current_row, field, val):
+                         continue
+                     
+                     cells_to_update.append((target_row, col, val))
+                     
+                     if is_kepdes and field in ['NO_DESA', 'NAMA_LENGKAP', 'JENIS_KELAMIN', 'JABATAN', 'NO_HP']:
+                         sync_payload[field] = val
             
-        return {'success': False, 'message': 'Desa not found in Geuchik_Detail'}
-    except Exception as e:
-        return {'success': False, 'error': str(e)}
+            if row_updated:
+                updated_count += 1
+
+    plan = merge_cell_updates({"Perangkat_Desa": cells_to_update}, _plan_geuchik_sync(snapshot, desa, sync_payload))
+    return plan, updated_count
+
+def plan_perangkat_desa_all(snapshot, desa, data_list):
+    """
+    Cells written by update_perangkat_desa_all.
+    Raises LookupError if none of the rows could be matched.
+    """
+    plan, updated_count = _plan_perangkat_rows(snapshot, desa, data_list)
+    if updated_count == 0 and data_list:
+        raise LookupError('Gagal mencocokkan data. Mohon validasi nama desa.')
+    return plan
 
 def update_perangkat_desa_all(desa, data_list):
     """Update multiple perangkat desa rows with robust matching (Merged Cells & Types)"""
     try:
-        ws = get_worksheet("Perangkat_Desa")
-        if not ws: return {'success': False, 'message': 'Sheet not found'}
-        
-        field_col_map = {
-            'NO_DESA': 7, 'NO_URUT': 11, 'NAMA_LENGKAP': 12, 
-            'NIK': 13, 'JENIS_KELAMIN': 14, 'JABATAN': 15, 'NO_HP': 16
-        }
-        
-        # 1. Fetch All Values to handle Merged Cells
-        all_vals = ws.get_all_values()
-        
-        target_desa = str(desa).strip().upper()
-        
-        # 2. Build map for this Desa: NO_URUT -> Row Index
-        row_map = {}
-        current_desa = None
-        
-        for i, row in enumerate(all_vals):
-            if len(row) > 7:
-                val_desa = str(row[7]).strip()
-                if val_desa:
-                    current_desa = val_desa
-                
-                # Check if we are in the target desa block
-                if current_desa and current_desa.upper() == target_desa:
-                    if len(row) > 10:
-                        val_urut = str(row[10]).strip()
-                        if val_urut.endswith(".0"): val_urut = val_urut[:-2]
-                        if val_urut:
-                            row_map[val_urut] = i + 1 # 1-based index
-                            
-        updated_count = 0
-        sync_payload = {}
-        cells_to_update = []
-        
-        for item in data_list:
-            target_no = str(item.get('NO_URUT')).strip()
-            if target_no.endswith(".0"): target_no = target_no[:-2]
-            
-            target_row = row_map.get(target_no)
-            
-            if target_row:
-                # Need to read JABATAN for sync check (Optimized: Get from all_vals to avoid API call)
-                # all_vals index is target_row - 1
-                current_jabatan_val = ''
-                if target_row - 1 < len(all_vals) and len(all_vals[target_row-1]) > 14:
-                     current_jabatan_val = all_vals[target_row-1][14]
-                
-                is_kepdes = current_jabatan_val and str(current_jabatan_val).strip().upper() in ['KEPALA DESA', 'PJ. KEPALA DESA']
-                
-                row_updated = False
-                for field, val in item.items():
-                    col = field_col_map.get(field)
-                    if col and val is not None:
-                         if field in ['NO_HP', 'NIK']:
-                             val = str(val)
-                             if val.endswith(".0"): val = val[:-2]
-                         
-                         # Batch: Add to list instead of immediate call
-                         cells_to_update.append(gspread.Cell(target_row, col, val))
-                         row_updated = True
-                         
-                         if is_kepdes and field in ['NO_DESA', 'NAMA_LENGKAP', 'JENIS_KELAMIN', 'JABATAN', 'NO_HP']:
-                             sync_payload[field] = val
-                
-                if row_updated:
-                    updated_count += 1
-        
-        # EXECUTE BATCH UPDATE
-        if cells_to_update:
-            ws.update_cells(cells_to_update, value_input_option='USER_ENTERED')
-        
-        if sync_payload:
-            _sync_geuchik_data_across_files(desa, sync_payload)
+        # EXECUTE BATCH UPDATE (edited rows + Kepala Desa sync in one call),
+        # confirmed from the batchUpdate response rather than by reading back
+        counts = {}
+        def plan(snapshot):
+            cells, counts['updated'] = _plan_perangkat_rows(snapshot, desa, data_list)
+            return cells
+        written = write_planned(plan, GEUCHIK_SYNC_SHEETS)
+        updated_count = counts['updated']
         
         if updated_count == 0 and data_list:
              return {'success': False, 'message': 'Gagal mencocokkan data. Mohon validasi nama desa.'}
-        
-        # VERIFICATION: Read back one value to ensure persistence
-        if row_map and updated_count > 0:
-            try:
-                # Pick the last item processed
-                last_item = data_list[-1]
-                target_no = str(last_item.get('NO_URUT')).strip()
-                if target_no.endswith(".0"): target_no = target_no[:-2]
-                res_row = row_map.get(target_no)
-                
-                if res_row:
-                    # Check a field that was updated
-                    check_field = 'NO_HP' if 'NO_HP' in last_item else ('NAMA_LENGKAP' if 'NAMA_LENGKAP' in last_item else None)
-                    
-                    if check_field:
-                         col_idx = field_col_map.get(check_field)
-                         expected_val = str(last_item[check_field])
-                         if expected_val.endswith(".0"): expected_val = expected_val[:-2]
-                         
-                         # Read back
-                         actual_val = str(ws.cell(res_row, col_idx).value).strip()
-                         if actual_val.endswith(".0"): actual_val = actual_val[:-2]
-                         
-                         print(f"VERIFY: Row {res_row} Col {col_idx} | Expected: '{expected_val}' | Actual: '{actual_val}'")
-            except Exception as e:
-                print(f"Verification Error: {e}")
-
-        clear_cache()
-        return {'success': True, 'updated': updated_count}
+
+        return {'success': True, 'updated': updated_count, 'cells': sum(len(cells) for cells in written.values())}
+    except WriteConflict as e:
+        return {'success': False, 'conflict': True, 'message': str(e)}
+    except LookupError as e:
+        return {'success': False, 'message': str(e)}
     except Exception as e:
         return {'success': False, 'error': str(e)}
 
+def plan_tuha_peuet_all(snapshot, gampong, data_list):
+    """Cells written by update_tuha_peuet_all (rows resolved on the snapshot's Tuha_Peuet grid)"""
+    # Rows of this Gampong (NO_ANGGOTA -> row) from the row index of the
+    # snapshot; the gampong name is merged over its block, and the secretary
+    # label and name below it in the same column do not start a new block
+    index = snapshot_index(snapshot, "Tuha_Peuet")
+    gampong_row_map = index.rows(gampong)
+    
+    # Current normalized rows, to send only changed fields; the gender is
+    # stored as a check mark in LAKI_LAKI or PEREMPUAN
+    current = current_values('tuha_peuet', 'GAMPONG', gampong, 'NO_ANGGOTA')
+    for row in current.values():
+        row['JENIS_KELAMIN'] = 'L' if row.get('LAKI_LAKI') else ('P' if row.get('PEREMPUAN') else '')
+                        
+    cells_to_update = []
+    
+    for item in data_list:
+        target_no = normalize_number(item.get('NO_ANGGOTA'))
+        target_row = gampong_row_map.get(target_no)
+        if not target_row and gampong_row_map and target_no and not pd.isna(item.get('NO_ANGGOTA')):
+            raise WriteConflict(f'Anggota nomor {target_no} di {gampong} tidak ditemukan lagi, kemungkinan telah diubah oleh pengguna lain.')
+        
+        if target_row:
+            current_row = current.get(target_no, {})
+            item = {field: value for field, value in item.items() if not is_unchanged(current_row, field, value)}
+            
+            if 'NAMA_ANGGOTA' in item:
+                cells_to_update.append((target_row, 8, item['NAMA_ANGGOTA']))
+            
+            jk = item.get('JENIS_KELAMIN')
+            if jk:
+                if jk == 'L':
+                    cells_to_update.append((target_row, 9, '✓'))
+                    cells_to_update.append((target_row, 10, ''))
+                elif jk == 'P':
+                    cells_to_update.append((target_row, 9, ''))
+                    cells_to_update.append((target_row, 10, '✓'))
+            
+            if 'KETERANGAN' in item:
+                cells_to_update.append((target_row, 11, item['KETERANGAN']))
+    
+    return {"Tuha_Peuet": cells_to_update}
+
 def update_tuha_peuet_all(gampong, data_list):
     """Update multiple anggota tuha peuet"""
     try:
-        ws = get_worksheet("Tuha_Peuet")
-        if not ws: return {'success': False, 'message': 'Sheet not found'}
-        
-        # Optimize: Read all once to avoid Read Quota issues
-        all_vals = ws.get_all_values()
-        
-        # Find rows for this Gampong (Column F / Index 5 for Gampong Name)
-        # Note: Merged cells might mean Gampong name is empty in subsequent rows if we trusted ffill logic elsewhere
-        # But here Tuha_Peuet usually has repeats or we rely on 'findall' logic which implies explicit values?
-        # The loader uses ffill so the raw sheet might have empty merged cells.
-        # Let's use the same ffill scan logic as Perangkat Desa to be safe.
-        
-        target_gampong = str(gampong).strip().upper()
-        gampong_row_map = {} # NO_ANGGOTA -> Row Index
-        
-        current_gampong = None
-        for i, row in enumerate(all_vals):
-            if len(row) > 5:
-                # Column 6 is Index 5
-                val_g = str(row[5]).strip()
-                if val_g: current_gampong = val_g
-                
-                if current_gampong and current_gampong.upper() == target_gampong:
-                    # Found a row for this gampong
-                    # NO_ANGGOTA is Column 7 / Index 6
-                    if len(row) > 6:
-                        no_anggota = str(row[6]).strip()
-                        if no_anggota:
-                            gampong_row_map[no_anggota] = i + 1 # 1-based index
-                            
-        cells_to_update = []
-        
-        for item in data_list:
-            target_no = str(item.get('NO_ANGGOTA')).strip()
-            target_row = gampong_row_map.get(target_no)
-            
-            if target_row:
-                if 'NAMA_ANGGOTA' in item:
-                    cells_to_update.append(gspread.Cell(target_row, 8, item['NAMA_ANGGOTA']))
-                
-                jk = item.get('JENIS_KELAMIN')
-                if jk:
-                    if jk == 'L':
-                        cells_to_update.append(gspread.Cell(target_row, 9, '✓'))
-                        cells_to_update.append(gspread.Cell(target_row, 10, ''))
-                    elif jk == 'P':
-                        cells_to_update.append(gspread.Cell(target_row, 9, ''))
-                        cells_to_update.append(gspread.Cell(target_row, 10, '✓'))
-                
-                if 'KETERANGAN' in item:
-                    cells_to_update.append(gspread.Cell(target_row, 11, item['KETERANGAN']))
-        
-        if cells_to_update:
-            ws.update_cells(cells_to_update, value_input_option='USER_ENTERED')
-        
-        clear_cache()
+        write_planned(lambda snapshot: plan_tuha_peuet_all(snapshot, gampong, data_list), ["Tuha_Peuet"])
         return {'success': True}
+    except WriteConflict as e:
+        return {'success': False, 'conflict': True, 'message': str(e)}
+    except LookupError as e:
+        return {'success': False, 'message': str(e)}
     except Exception as e:
         return {'success': False, 'error': str(e)}
 
@@ -542,36 +768,34 @@ def add_tuha_peuet(data):
         ws = get_worksheet("Tuha_Peuet")
         gampong = data.get('GAMPONG')
         
-        cells = ws.findall(gampong)
-        gampong_rows = [c.row for c in cells if c.col == 6]
-        
-        if not gampong_rows:
-            return {'success': False, 'message': 'Gampong block not found'}
-        
-        last_row = max(gampong_rows)
-        insert_idx = last_row + 1
-        
-        row_data = ws.row_values(last_row)
-        kec = row_data[1] if len(row_data) > 1 else ''
-        kem = row_data[3] if len(row_data) > 3 else ''
-        
-        new_row = [''] * 11
-        new_row[1] = kec 
-        new_row[3] = kem 
-        new_row[5] = gampong 
-        new_row[6] = data.get('NO_ANGGOTA') 
-        new_row[7] = data.get('NAMA_ANGGOTA') 
-        
-        jk = data.get('JENIS_KELAMIN')
-        if jk == 'L':
-            new_row[8] = '✓'
-        elif jk == 'P':
-            new_row[9] = '✓'
+        with _write_lock:
+            base_revision = probe_revision()
+            index, _ = get_row_index("Tuha_Peuet")
+            last_row = index.last_row(gampong) if index else None
+            if last_row is None:
+                return {'success': False, 'message': 'Gampong block not found'}
             
-        new_row[10] = data.get('KETERANGAN', '')
-        
-        ws.insert_row(new_row, index=insert_idx)
-        clear_cache()
+            # Appended below the last member; GAMPONG, KECAMATAN and KEMUKIMAN
+            # are merged over the block, so they stay empty on the new row
+            insert_idx = last_row + 1
+            new_row = [''] * 11
+            new_row[6] = data.get('NO_ANGGOTA') 
+            new_row[7] = data.get('NAMA_ANGGOTA') 
+            
+            jk = data.get('JENIS_KELAMIN')
+            if jk == 'L':
+                new_row[8] = '✓'
+            elif jk == 'P':
+                new_row[9] = '✓'
+                
+            new_row[10] = data.get('KETERANGAN', '')
+            
+            try:
+                ws.insert_row(new_row, index=insert_idx)
+            except Exception:
+                drop_row_index("Tuha_Peuet")
+                raise
+            write_through_rows("Tuha_Peuet", insert_idx, 1, new_row, gampong, data.get('NO_ANGGOTA'), base_revision)
         return {'success': True}
     except Exception as e:
         return {'success': False, 'error': str(e)}
@@ -580,14 +804,16 @@ def delete_tuha_peuet(gampong, no_anggota):
     """Delete anggota Tuha Peuet"""
     try:
         ws = get_worksheet("Tuha_Peuet")
-        cells = ws.findall(gampong)
-        gampong_rows = [c.row for c in cells if c.col == 6]
-        
-        for r in gampong_rows:
-            curr_no = str(ws.cell(r, 7).value).strip()
-            if curr_no == str(no_anggota).strip():
-                ws.delete_rows(r)
-                clear_cache()
+        with _write_lock:
+            base_revision = probe_revision()
+            row, _ = locate_member("Tuha_Peuet", gampong, no_anggota)
+            if row:
+                try:
+                    ws.delete_rows(row)
+                except Exception:
+                    drop_row_index("Tuha_Peuet")
+                    raise
+                write_through_rows("Tuha_Peuet", row, -1, base_revision=base_revision)
                 return {'success': True}
         return {'success': False, 'message': 'Anggota not found'}
     except Exception as e:
@@ -597,6 +823,7 @@ def update_sekretaris_tpg(gampong, no_anggota, new_nama, new_jabatan):
     """Update Secretary TPG info"""
     try:
         ws = get_worksheet("Tuha_Peuet")
+        base_revision = probe_revision()
         cells = ws.findall(gampong)
         target_row = None
         for cell in cells:
@@ -611,8 +838,159 @@ def update_sekretaris_tpg(gampong, no_anggota, new_nama, new_jabatan):
         if target_row:
             ws.update_cell(target_row + 2, 6, new_jabatan)
             ws.update_cell(target_row + 3, 6, new_nama)
-            clear_cache()
+            clear_cache("Tuha_Peuet", base_revision=base_revision)
             return {'success': True}
         return {'success': False, 'message': 'Gampong Header not found'}
     except Exception as e:
         return {'success': False, 'error': str(e)}
+
+
+def plan_geuchik_name(snapshot, gampong_name, new_name):
+    """Cells written by update_geuchik_name"""
+    return _plan_geuchik_sync(snapshot, gampong_name, {'NAMA_LENGKAP': new_name})
+
+# Sheets a staged edit may write to (the snapshot commit_edits plans on)
+EDIT_SHEETS = GEUCHIK_SYNC_SHEETS + ["Tuha_Peuet"]
+
+# Staged edit kind -> planner(snapshot, target, data) returning {sheet_name: cells}
+EDIT_PLANNERS = {
+    'geuchik_name': plan_geuchik_name,
+    'geuchik_detail': plan_geuchik_detail_all,
+    'perangkat_desa': plan_perangkat_desa_all,
+    'tuha_peuet': plan_tuha_peuet_all,
+}
+
+def commit_edits(edits):
+    """
+    Write staged edits [(kind, target, data, stamp), ...] as one transaction:
+    every edit is planned against the same cached snapshot and all cells go
+    out in a single batch write. Each edit is checked against the stamp of
+    the form it was made in (edit_stamp). If any edit cannot be planned, was
+    made on rows another session changed since, or the write fails, nothing
+    is written.
+    """
+    edits = [tuple(edit) + (None,) * (4 - len(edit)) for edit in edits]
+
+    def plan(snapshot):
+        plans = []
+        for kind, target, data, stamp in edits:
+            try:
+                edit_plan = EDIT_PLANNERS[kind](snapshot, target, data)
+            except WriteConflict:
+                raise
+            except LookupError as e:
+                raise LookupError(f"{target}: {e}") from e
+            check_base(edit_plan, snapshot, stamp)
+            plans.append(edit_plan)
+        return merge_cell_updates(*plans)
+
+    try:
+        # Only cells that differ from the snapshot are sent
+        written = write_planned(plan, EDIT_SHEETS)
+        return {
+            'success': True,
+            'edits': len(edits),
+            'sheets': list(written),
+            'cells': sum(len(cells) for cells in written.values()),
+        }
+    except WriteConflict as e:
+        return {'success': False, 'conflict': True, 'message': str(e)}
+    except LookupError as e:
+        return {'success': False, 'message': str(e)}
+    except Exception as e:
+        return {'success': False, 'error': str(e)}
+
+def preview_import(kind, blocks, delete_missing=False):
+    """Diff parsed import blocks against the current sheet (see diff_import)"""
+    sheet_name = IMPORT_LAYOUTS[kind]['sheet']
+    index, values = get_row_index(sheet_name)
+    if index is None:
+        raise LookupError('Sheet not found')
+    return diff_import(kind, blocks, values, index, delete_missing)
+
+def _plan_import_geuchik_sync(snapshot, diff):
+    """
+    Geuchik sync cells for the imported changes of Kepala Desa rows, like
+    update_perangkat_desa_all sends them: one plan per changed Kepala Desa
+    """
+    values = snapshot["Perangkat_Desa"]
+    sync_fields = ['NAMA_LENGKAP', 'JENIS_KELAMIN', 'JABATAN', 'NO_HP']
+    plans = []
+    for item in diff['changed']:
+        row = values[item['row'] - 1] if item['row'] <= len(values) else []
+        jabatan = str(row[14]).strip().upper() if len(row) > 14 else ''
+        if jabatan not in KEPALA_DESA_JABATAN:
+            continue
+        field_map = {field: new for field, (_, new) in item['changes'].items() if field in sync_fields}
+        if field_map:
+            # The DESA name as the sheet holds it (repeated on every row)
+            plans.append(_plan_geuchik_sync(snapshot, row[7], field_map))
+    return plans
+
+def _plan_import_rows(kind, diff, index):
+    """
+    Row changes [(row, delta, values, block, number), ...] for the deleted
+    and added members of a diff, ordered bottom-up: every row number refers
+    to the sheet before the batch, since changes below a row do not move it.
+    New members go below the last row of their block, in file order; a
+    deleted row is removed before a member is inserted above it.
+    """
+    ordered = []
+    for item in diff['deleted']:
+        ordered.append(((item['row'], 1, 0), (item['row'], -1, None, None, None)))
+    for seq, item in enumerate(diff['added']):
+        insert_idx = (index.last_row(item['block']) or index.anchor(item['block'])) + 1
+        new_row = new_member_row(kind, item['block'], item['number'], item['fields'])
+        ordered.append(((insert_idx, 0, seq), (insert_idx, 1, new_row, item['block'], item['number'])))
+    return [change for _, change in sorted(ordered, key=lambda o: o[0], reverse=True)]
+
+def apply_import(kind, blocks, delete_missing=False):
+    """
+    Apply an imported workbook: the changed cells of every row, plus the
+    Geuchik sync of changed Kepala Desa rows, go out in one batch write
+    (re-diffed on the snapshot, with the usual conflict checks). Then, with
+    delete_missing, members missing from the file are deleted and new
+    members are inserted below their block, all in one structural batch.
+    """
+    sheet_name = IMPORT_LAYOUTS[kind]['sheet']
+    counts = {}
+    try:
+        def plan(snapshot):
+            diff = preview_import(kind, blocks, delete_missing)
+            counts['changed'] = len(diff['changed'])
+            cells = import_cells(kind, diff)
+            if sheet_name == "Perangkat_Desa":
+                cells = merge_cell_updates(cells, *_plan_import_geuchik_sync(snapshot, diff))
+            return cells
+        sheet_names = GEUCHIK_SYNC_SHEETS if sheet_name == "Perangkat_Desa" else [sheet_name]
+        written = write_planned(plan, sheet_names)
+
+        with _write_lock:
+            base_revision = probe_revision()
+            index, values = get_row_index(sheet_name)
+            if index is None:
+                raise LookupError('Sheet not found')
+            diff = diff_import(kind, blocks, values, index, delete_missing)
+            changes = _plan_import_rows(kind, diff, index)
+            if changes:
+                try:
+                    get_storage_backend().batch_change_rows(
+                        sheet_name, [(row, delta, new_row) for row, delta, new_row, _, _ in changes])
+                except Exception:
+                    drop_row_index(sheet_name)
+                    raise
+                write_through_row_changes(sheet_name, changes, base_revision)
+
+        return {
+            'success': True,
+            'changed': counts['changed'],
+            'cells': sum(len(cells) for cells in written.values()),
+            'added': len(diff['added']),
+            'deleted': len(diff['deleted']),
+        }
+    except WriteConflict as e:
+        return {'success': False, 'conflict': True, 'message': str(e)}
+    except LookupError as e:
+        return {'success': False, 'message': str(e)}
+    except Exception as e:
+        return {'success': False, 'error': str(e)}
@@ -0,0 +1,194 @@
+"""
+Edit Session Module
+Sistem Manajemen Data Gampong - Dinas Pemberdayaan Kota Langsa
+
+Antrean perubahan per session (unit of work): edit dari form Geuchik,
+Perangkat Desa dan Tuha Peuet ditampung dulu dan ditampilkan sebagai
+perubahan tertunda, lalu disimpan dengan satu tombol "Simpan" sebagai satu
+penulisan batch lintas sheet (semua tersimpan atau tidak sama sekali).
+Penyimpanan berjalan di antrean tulis latar belakang (write_queue). Tiap
+edit membawa stempel data saat form dibuka, sehingga perubahan pengguna lain
+di antaranya ditolak sebagai konflik, bukan ditimpa.
+"""
+
+import hashlib
+import time
+import streamlit as st
+from utils.write_queue import submit_write, render_write_status
+
+_SESSION_KEY = "_edit_session"
+
+# (kind, target) -> (stamp, widget key prefix) of the edit forms of the session
+_STAMPS_KEY = "_edit_stamps"
+
+# Staged edit kind -> label shown in the pending list
+KIND_LABELS = {
+    'geuchik_name': "Nama Geuchik",
+    'geuchik_detail': "Detail Geuchik",
+    'perangkat_desa': "Perangkat Desa",
+    'tuha_peuet': "Tuha Peuet",
+}
+
+
+class EditSession:
+    """Staged edits of one session; a newer edit of the same (kind, target) replaces the older one"""
+
+    def __init__(self):
+        self._edits = {}  # (kind, target) -> (data, staged_at, stamp)
+
+    def stage(self, kind, target, data, stamp=None):
+        """Stage an edit; re-staging a target keeps the stamp of its first version"""
+        if kind not in KIND_LABELS:
+            raise ValueError(f"Unknown edit kind: {kind}")
+        previous = self._edits.pop((kind, target), None)
+        if previous is not None and previous[2] is not None:
+            stamp = previous[2]
+        self._edits[(kind, target)] = (data, time.time(), stamp)
+
+    def get(self, kind, target):
+        """Get the staged data of (kind, target), or None"""
+        entry = self._edits.get((kind, target))
+        return entry[0] if entry else None
+
+    def remove(self, kind, target):
+        self._edits.pop((kind, target), None)
+
+    def clear(self):
+        self._edits.clear()
+
+    def restore(self, items):
+        """Put back edits of a failed save, unless the target was staged again since"""
+        for kind, target, data, stamp in items:
+            if (kind, target) not in self._edits:
+                self._edits[(kind, target)] = (data, time.time(), stamp)
+
+    def items(self):
+        """Get the staged edits as [(kind, target, data, stamp), ...] in staging order"""
+        return [(kind, target, data, stamp) for (kind, target), (data, _, stamp) in self._edits.items()]
+
+    def __len__(self):
+        return len(self._edits)
+
+
+def get_edit_session():
+    """Get the edit queue of the current session"""
+    if _SESSION_KEY not in st.session_state:
+        st.session_state[_SESSION_KEY] = EditSession()
+    return st.session_state[_SESSION_KEY]
+
+
+def _form_stamps():
+    return st.session_state.setdefault(_STAMPS_KEY, {})
+
+
+def form_stamp(kind, target, key_prefix):
+    """
+    Call before rendering the edit form of (kind, target) whose widget keys
+    start with key_prefix. Widgets keep their values across reruns, so the
+    stamp of the data they were created with is kept until the widgets are
+    created anew (form not rendered in the previous run, or reset).
+    """
+    from utils.data_manager import edit_stamp
+
+    stamps = _form_stamps()
+    fresh = not any(str(key).startswith(f"{key_prefix}_") for key in st.session_state)
+    if fresh or (kind, target) not in stamps:
+        stamps[(kind, target)] = (edit_stamp(target), key_prefix)
+    return stamps[(kind, target)][0]
+
+
+def reset_forms(targets):
+    """Drop the stamps and widget values of the forms of [(kind, target), ...], so they reload current data"""
+    stamps = _form_stamps()
+    for kind, target in targets:
+        entry = stamps.pop((kind, target), None)
+        if entry is None:
+            continue
+        prefix = f"{entry[1]}_"
+        for key in [key for key in st.session_state if str(key).startswith(prefix)]:
+            del st.session_state[key]
+
+
+def stage_edit(kind, target, data):
+    """
+    Queue an edit (replacing a pending edit of the same target), stamped with
+    the data its form was rendered from (or the current data if none)
+    """
+    from utils.data_manager import edit_stamp
+
+    entry = _form_stamps().get((kind, target))
+    stamp = entry[0] if entry else edit_stamp(target)
+    get_edit_session().stage(kind, target, data, stamp)
+
+
+def staged_edit(kind, target):
+    """Get the pending data for a target, to prefill its form"""
+    return get_edit_session().get(kind, target)
+
+
+def commit_staged_edits():
+    """
+    Queue all pending edits as one batch write and return at once. The edits
+    leave the queue while they are saved and are put back if the save
+    fails, so a failed commit can be retried or edited. commit_edits only
+    sends cells that still differ, so the job is safe to retry.
+    """
+    from utils.data_manager import commit_edits
+
+    session = get_edit_session()
+    if not len(session):
+        return {'success': True, 'queued': False, 'edits': 0}
+    items = session.items()
+    key = hashlib.sha1(repr([item[:3] for item in items]).encode('utf-8')).hexdigest()
+    targets = [(kind, target) for kind, target, _, _ in items]
+    stamps = _form_stamps()
+
+    def saved():
+        # The forms now show our own write: stamp them again on next render
+        for target in targets:
+            stamps.pop(target, None)
+
+    job_id = submit_write(
+        f"{len(items)} perubahan", commit_edits, items,
+        key=key, idempotent=True, on_failure=lambda: session.restore(items), on_success=saved,
+    )
+    session.clear()
+    return {'success': True, 'queued': True, 'job': job_id, 'edits': len(items)}
+
+
+def _describe(kind, target, data):
+    if kind == 'geuchik_name':
+        return f"{KIND_LABELS[kind]} · {target} → {data}"
+    if isinstance(data, list):
+        return f"{KIND_LABELS[kind]} · {target} ({len(data)} baris)"
+    return f"{KIND_LABELS[kind]} · {target}"
+
+
+def render_edit_queue(role):
+    """Show pending edits with Simpan/Batalkan buttons in the sidebar (admin only)"""
+    from utils.auth import is_admin
+    if not is_admin(role):
+        return
+
+    render_write_status()
+    session = get_edit_session()
+    if not len(session):
+        return
+
+    with st.sidebar.expander(f"📝 Perubahan Tertunda ({len(session)})", expanded=True):
+        for i, (kind, target, data, _) in enumerate(session.items()):
+            col_label, col_remove = st.columns([5, 1])
+            col_label.caption(_describe(kind, target, data))
+            if col_remove.button("✖", key=f"_edit_remove_{i}_{kind}_{target}", help="Hapus dari antrean"):
+                session.remove(kind, target)
+                reset_forms([(kind, target)])
+                st.rerun()
+
+        col_save, col_discard = st.columns(2)
+        if col_save.button("💾 Simpan", type="primary", use_container_width=True, key="_edit_commit"):
+            commit_staged_edits()
+            st.rerun()
+        if col_discard.button("🗑️ Batalkan", use_container_width=True, key="_edit_discard"):
+            reset_forms([(kind, target) for kind, target, _, _ in session.items()])
+            session.clear()
+            st.rerun()
@@ -5,6 +5,11 @@ from openpyxl.utils.dataframe import dataframe_to_rows
 from io import BytesIO
 from pathlib import Path
 import shutil
+from utils.instrumentation import instrumented
+
+# Part of the export cache key: bump when the generated workbooks change
+# (templates, column mapping, formatting) so cached files are not reused
+EXPORTER_VERSION = 1
 
 class ExcelExporter:
     def __init__(self, base_path):
@@ -47,6 +52,7 @@ class ExcelExporter:
                         continue # Don't touch header-merged cells!
                     cell.value = None
 
+    @instrumented("export")
     def export_camat_mukim_geuchik(self, df):
         filename = "data_(camat,mukim,dan geuchik).xlsx"
         wb = self._load_template(filename)
@@ -77,6 +83,7 @@ class ExcelExporter:
         wb.save(output)
         return output.getvalue()
 
+    @instrumented("export")
     def export_geuchik_detail(self, df):
         filename = "data_(geuchik kota langsa).xlsx"
         wb = self._load_template(filename)
@@ -139,6 +146,7 @@ class ExcelExporter:
         return output.getvalue()
 
 
+    @instrumented("export")
     def export_perangkat_desa(self, df):
         # PROGRAMMATIC GENERATION (Replacing Template)
         # To ensure clean layout matching "Perangkat_Desa" Google Sheet structure
@@ -323,6 +331,7 @@ class ExcelExporter:
         wb.save(output)
         return output.getvalue()
 
+    @instrumented("export")
     def export_tuha_peuet(self, df):
         filename = "data_(tuha peuet gampong).xlsx"
         wb = self._load_template(filename)
@@ -0,0 +1,190 @@
+"""
+Excel Importer Module
+Sistem Manajemen Data Gampong - Dinas Pemberdayaan Kota Langsa
+
+Impor workbook Perangkat Desa dan Tuha Peuet yang dikirim kantor desa
+(format file asli maupun hasil ExcelExporter): baris dibaca secara streaming
+dengan openpyxl read-only, dibandingkan dengan data saat ini per blok
+DESA/GAMPONG dan nomor anggota, lalu ditampilkan sebagai pratinjau baris
+baru, berubah dan terhapus sebelum diterapkan sebagai penulisan batch.
+"""
+
+import openpyxl
+from utils.row_index import ROW_INDEX_SPECS, normalize_block, normalize_number
+
+VALID_KECAMATAN = ['LANGSA TIMUR', 'LANGSA BARAT', 'LANGSA KOTA', 'LANGSA BARO', 'LANGSA LAMA']
+
+# Layout shared by the original workbooks and the ExcelExporter output:
+# 1-based columns of the block name, its kecamatan (merged over all blocks
+# of the kecamatan) and the member fields that are imported
+IMPORT_LAYOUTS = {
+    'perangkat_desa': {
+        'sheet': "Perangkat_Desa",
+        'title': "Data Kepala Desa & Perangkat Desa",
+        'width': 16,
+        'kecamatan_col': 6,
+        'fields': {'NAMA_LENGKAP': 12, 'NIK': 13, 'JENIS_KELAMIN': 14, 'JABATAN': 15, 'NO_HP': 16},
+        'label_field': 'NAMA_LENGKAP',
+        'repeat_block': True,
+    },
+    'tuha_peuet': {
+        'sheet': "Tuha_Peuet",
+        'title': "Data Tuha Peuet Gampong",
+        'width': 11,
+        'kecamatan_col': 2,
+        'fields': {'NAMA_ANGGOTA': 8, 'LAKI_LAKI': 9, 'PEREMPUAN': 10, 'KETERANGAN': 11},
+        'label_field': 'NAMA_ANGGOTA',
+        'repeat_block': False,
+    },
+}
+
+
+def _text(value):
+    """Cell value as the text the sheets hold (numbers without '.0')"""
+    if value is None:
+        return ''
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value).strip()
+
+
+def same_value(current, uploaded):
+    """
+    True if an uploaded cell equals the current one. Numbers typed in Excel
+    lose their leading zeros (phone numbers, NIK), so those are compared
+    without them.
+    """
+    current, uploaded = normalize_number(current), normalize_number(uploaded)
+    if current == uploaded:
+        return True
+    return uploaded.isdigit() and current.isdigit() and current.lstrip('0') == uploaded.lstrip('0')
+
+
+def _is_numbering_row(row):
+    """The column-number row (1, 2, 3, ...) under a header, repeated inside the original workbooks"""
+    numbers = [_text(value) for value in row if _text(value)]
+    return bool(numbers) and numbers == [str(n) for n in range(1, len(numbers) + 1)]
+
+
+def _is_anchor(kind, row, kecamatan):
+    """
+    A row opening a DESA/GAMPONG block: a block name inside a valid kecamatan
+    (forward filled like the loaders do, so header rows never open a block)
+    """
+    spec = ROW_INDEX_SPECS[IMPORT_LAYOUTS[kind]['sheet']]
+    name = _text(row[spec['block_col'] - 1])
+    is_anchor = spec.get('is_anchor') or bool
+    return bool(name) and is_anchor(name) and kecamatan in VALID_KECAMATAN
+
+
+def parse_import_workbook(source, kind):
+    """
+    Parse an uploaded workbook (path or file-like) into
+    {block: {number: {field: text}}}, blocks and members in file order.
+    Rows are streamed in read-only mode; merged block names are carried down
+    to the rows below them. Raises ValueError if no member row is found.
+    """
+    layout = IMPORT_LAYOUTS[kind]
+    spec = ROW_INDEX_SPECS[layout['sheet']]
+    width = layout['width']
+
+    try:
+        wb = openpyxl.load_workbook(source, read_only=True, data_only=True)
+    except Exception as e:
+        raise ValueError(f"File bukan workbook Excel yang valid: {e}")
+
+    blocks = {}
+    try:
+        ws = wb.active
+        block = None
+        kecamatan = ''
+        for row in ws.iter_rows(values_only=True, max_col=width):
+            row = tuple(row) + (None,) * (width - len(row))
+            if _is_numbering_row(row):
+                continue
+            kecamatan = _text(row[layout['kecamatan_col'] - 1]).upper() or kecamatan
+            if _is_anchor(kind, row, kecamatan):
+                block = normalize_block(row[spec['block_col'] - 1])
+                blocks.setdefault(block, {})
+            if block is None:
+                continue
+            number = normalize_number(_text(row[spec['number_col'] - 1]))
+            if not number.isdigit():
+                continue
+            blocks[block][number] = {field: _text(row[col - 1]) for field, col in layout['fields'].items()}
+    finally:
+        wb.close()
+
+    blocks = {block: members for block, members in blocks.items() if members}
+    if not blocks:
+        raise ValueError(f"Tidak ada baris data dengan format {layout['title']} di file ini")
+    return blocks
+
+
+def diff_import(kind, blocks, values, index, delete_missing=False):
+    """
+    Compare parsed blocks with the current grid of the sheet and its row
+    index. Returns {'changed': [...], 'added': [...], 'deleted': [...],
+    'unknown_blocks': [...]}; changed rows carry their current row and
+    {field: (old, new)}. Members missing from an imported block are only
+    listed as deleted with delete_missing=True, and never the block's first
+    row (it holds the merged block name) or repeated header rows.
+    """
+    layout = IMPORT_LAYOUTS[kind]
+    label_field = layout['label_field']
+    result = {'changed': [], 'added': [], 'deleted': [], 'unknown_blocks': []}
+
+    def cell(row, col):
+        row_values = values[row - 1] if row <= len(values) else []
+        return row_values[col - 1] if len(row_values) >= col else ''
+
+    for block, members in blocks.items():
+        if index.anchor(block) is None:
+            result['unknown_blocks'].append(block)
+            continue
+        current_rows = index.rows(block)
+        for number, fields in members.items():
+            row = current_rows.get(number)
+            if row is None:
+                result['added'].append({'block': block, 'number': number, 'fields': fields})
+                continue
+            changes = {
+                field: (cell(row, col), fields[field])
+                for field, col in layout['fields'].items()
+                if not same_value(cell(row, col), fields[field])
+            }
+            if changes:
+                result['changed'].append({'block': block, 'number': number, 'row': row, 'changes': changes})
+        if delete_missing:
+            for number, row in current_rows.items():
+                if number.isdigit() and number not in members and row != index.anchor(block):
+                    label = cell(row, layout['fields'][label_field])
+                    result['deleted'].append({'block': block, 'number': number, 'row': row, 'label': label})
+    return result
+
+
+def import_cells(kind, diff):
+    """Cell updates {sheet_name: [(row, col, value), ...]} for the changed rows of a diff"""
+    layout = IMPORT_LAYOUTS[kind]
+    cells = [
+        (item['row'], layout['fields'][field], new)
+        for item in diff['changed']
+        for field, (_, new) in item['changes'].items()
+    ]
+    return {layout['sheet']: cells} if cells else {}
+
+
+def new_member_row(kind, block, number, fields):
+    """
+    Row values for an added member, like add_kadus/add_tuha_peuet write them:
+    Perangkat_Desa repeats the DESA name, the other merged columns stay empty
+    """
+    layout = IMPORT_LAYOUTS[kind]
+    spec = ROW_INDEX_SPECS[layout['sheet']]
+    row = [''] * layout['width']
+    if layout['repeat_block']:
+        row[spec['block_col'] - 1] = block
+    row[spec['number_col'] - 1] = int(number)
+    for field, col in layout['fields'].items():
+        row[col - 1] = fields.get(field, '')
+    return row
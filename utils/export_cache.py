@@ -0,0 +1,98 @@
+"""
+Export Cache Module
+Sistem Manajemen Data Gampong - Dinas Pemberdayaan Kota Langsa
+
+Cache bersama untuk file Excel/ZIP hasil export. File disimpan per isi
+sheet sumbernya dan versi exporter, dibatasi ukuran total (export_cache_mb)
+dan dibuang secara LRU, sehingga export yang sama dari beberapa session
+hanya dibuat sekali selama datanya tidak berubah.
+"""
+
+import threading
+from collections import OrderedDict
+import streamlit as st
+from utils.config import get_float_setting
+from utils.data_loader import STORE_TABLES, sheet_token
+from utils.excel_exporter import EXPORTER_VERSION
+
+
+class ExportCache:
+    """
+    Generated export files (bytes) keyed by (name, data token, exporter
+    version). Holds at most max_bytes, least recently used first out; a
+    newer version of a file replaces the older ones.
+    """
+
+    def __init__(self, max_bytes=64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._files = OrderedDict()  # (name, token, version) -> bytes
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        """Get the bytes stored under key, or None"""
+        with self._lock:
+            data = self._files.get(key)
+            if data is None:
+                self.misses += 1
+                return None
+            self._files.move_to_end(key)
+            self.hits += 1
+            return data
+
+    def put(self, key, data):
+        """Store bytes under key, evicting older versions of the file and the least recently used"""
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            for old in [k for k in self._files if k[0] == key[0] and k != key]:
+                self._bytes -= len(self._files.pop(old))
+            if key in self._files:
+                self._bytes -= len(self._files.pop(key))
+            self._files[key] = data
+            self._bytes += len(data)
+            while self._bytes > self.max_bytes:
+                _, evicted = self._files.popitem(last=False)
+                self._bytes -= len(evicted)
+                self.evictions += 1
+
+    def stats(self):
+        """Get hit/miss/eviction counters and the cached size"""
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'files': [key[0] for key in self._files],
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+            }
+
+
+@st.cache_resource
+def get_export_cache():
+    """Get the shared cache of generated export files (size cap: export_cache_mb)"""
+    return ExportCache(int(get_float_setting("export_cache_mb", 64) * 1024 * 1024))
+
+
+def cached_export(name, datasets, build):
+    """
+    Get the bytes of an export file built from datasets (keys of
+    STORE_TABLES), calling build() only if no file is cached for the
+    current generations of their source sheets and EXPORTER_VERSION.
+    """
+    tokens = tuple(sheet_token(STORE_TABLES[dataset][0]) for dataset in datasets)
+    if None in tokens:
+        return build()
+
+    cache = get_export_cache()
+    key = (name, tokens, EXPORTER_VERSION)
+    data = cache.get(key)
+    if data is None:
+        data = build()
+        if data:
+            cache.put(key, data)
+    return data
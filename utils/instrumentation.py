@@ -0,0 +1,247 @@
+"""
+Instrumentation Module
+Sistem Manajemen Data Gampong - Dinas Pemberdayaan Kota Langsa
+
+Pencatatan jumlah panggilan, ukuran data (bytes) dan waktu untuk setiap
+panggilan Google Sheets API, fungsi load_* dan ExcelExporter.export_*
+per Streamlit run. Hasilnya ditampilkan di panel sidebar khusus admin dan,
+bila metrics_log_path diisi, run yang memanggil API atau menyimpan workbook
+ditulis ke log JSON-lines.
+"""
+
+import functools
+import json
+import threading
+import time
+from pathlib import Path
+import streamlit as st
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+from utils.config import get_setting
+
+# JSON-lines sink, off unless metrics_log_path is set (e.g. logs/metrics.jsonl)
+DEFAULT_LOG_PATH = ""
+
+# Only runs that made calls of these categories are written to the log
+LOGGED_CATEGORIES = ('api', 'storage')
+
+_CURRENT_KEY = "_metrics_current_run"
+_PREVIOUS_KEY = "_metrics_previous_run"
+
+_sink_lock = threading.Lock()
+
+
+class RunMetrics:
+    """Counters for one Streamlit run: (category, name) -> count, bytes, seconds"""
+
+    def __init__(self, page, session_id=None):
+        self.page = page
+        self.session_id = session_id
+        self.started = time.time()
+        self._lock = threading.Lock()
+        self._ops = {}
+
+    def add(self, category, name, nbytes=0, seconds=0.0, error=False):
+        with self._lock:
+            op = self._ops.setdefault((category, name), {'count': 0, 'bytes': 0, 'seconds': 0.0, 'errors': 0})
+            op['count'] += 1
+            op['bytes'] += int(nbytes or 0)
+            op['seconds'] += seconds
+            op['errors'] += int(error)
+
+    def rows(self):
+        """Get one dict per (category, name), most expensive first"""
+        with self._lock:
+            rows = [dict(category=c, name=n, **op) for (c, n), op in self._ops.items()]
+        return sorted(rows, key=lambda r: r['seconds'], reverse=True)
+
+    def totals(self):
+        """Get count/bytes/seconds summed per category"""
+        totals = {}
+        for row in self.rows():
+            t = totals.setdefault(row['category'], {'count': 0, 'bytes': 0, 'seconds': 0.0})
+            t['count'] += row['count']
+            t['bytes'] += row['bytes']
+            t['seconds'] += row['seconds']
+        return totals
+
+    def to_record(self):
+        """Get a JSON-serializable summary of the run"""
+        return {
+            'ts': round(self.started, 3),
+            'duration': round(time.time() - self.started, 3),
+            'page': self.page,
+            'session': self.session_id,
+            'totals': {c: dict(t, seconds=round(t['seconds'], 4)) for c, t in self.totals().items()},
+            'ops': [dict(r, seconds=round(r['seconds'], 4)) for r in self.rows()],
+        }
+
+
+# Calls made outside a Streamlit script run (background threads)
+_background = RunMetrics("background")
+
+
+def _current_run():
+    """Get the metrics of the running script, or the background collector"""
+    ctx = get_script_run_ctx(suppress_warning=True)
+    if ctx is None:
+        return _background
+    try:
+        run = st.session_state.get(_CURRENT_KEY)
+        if run is None:
+            run = st.session_state[_CURRENT_KEY] = RunMetrics("?", ctx.session_id)
+        return run
+    except Exception:
+        return _background
+
+
+def background_metrics():
+    """Get per-category totals of calls made outside script runs"""
+    return _background.totals()
+
+
+def record(category, name, nbytes=0, seconds=0.0, error=False):
+    """Record one operation in the metrics of the current run"""
+    _current_run().add(category, name, nbytes, seconds, error)
+
+
+def log_event(event, **fields):
+    """Record an event (e.g. a failed write verification) and append it to the metrics log"""
+    record('event', event, error=True)
+    _write_record({'ts': round(time.time(), 3), 'event': event, **fields})
+
+
+def _size_of(result):
+    """Best-effort payload size in bytes"""
+    if result is None:
+        return 0
+    if isinstance(result, (bytes, bytearray)):
+        return len(result)
+    if hasattr(result, 'memory_usage'):
+        try:
+            return int(result.memory_usage(index=True, deep=True).sum())
+        except Exception:
+            return 0
+    if hasattr(result, 'content'):
+        return len(result.content or b'')
+    return 0
+
+
+def instrumented(category, name=None):
+    """Decorator recording count, result size and wall time of each call"""
+    def decorator(fn):
+        label = name or fn.__name__
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            result = None
+            failed = True
+            try:
+                result = fn(*args, **kwargs)
+                failed = False
+                return result
+            finally:
+                record(category, label, _size_of(result), time.perf_counter() - started, failed)
+        return wrapper
+    return decorator
+
+
+def _write_record(record_dict):
+    """Append one JSON line to the metrics log"""
+    path = get_setting("metrics_log_path", DEFAULT_LOG_PATH)
+    if not path:
+        return
+    try:
+        path = Path(path)
+        with _sink_lock:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            with open(path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record_dict, default=str) + "\n")
+    except Exception as e:
+        print(f"Error writing metrics log: {e}")
+
+
+def begin_run(page):
+    """
+    Start collecting metrics for this script run.
+    The previous run of the session is kept for the panel, so the cost of a
+    save that ended with st.rerun() stays visible, and written to the log if
+    it made API calls or saved a workbook.
+    """
+    ctx = get_script_run_ctx(suppress_warning=True)
+    if ctx is None:
+        return
+    previous = st.session_state.get(_CURRENT_KEY)
+    if previous is not None and previous.rows():
+        if any(category in LOGGED_CATEGORIES for category in previous.totals()):
+            _write_record(previous.to_record())
+        st.session_state[_PREVIOUS_KEY] = previous
+    st.session_state[_CURRENT_KEY] = RunMetrics(page, ctx.session_id)
+
+
+def get_runtime_stats():
+    """Get process-wide cache, quota and background counters (for the admin panel)"""
+    # Imported here: the modules reporting their counters import this one
+    from utils import data_loader as dl
+    from utils.export_cache import get_export_cache
+    from utils.login_limiter import get_login_limiter
+    from utils.storage import SheetsBackend
+    from utils.write_queue import get_write_executor, get_export_executor
+
+    backend = dl.get_storage_backend()
+    stats = {
+        'backend': backend.name,
+        'sheet_cache': dl.get_sheet_cache().stats(),
+        'frame_cache': dl.get_frame_cache().stats(),
+        'export_cache': get_export_cache().stats(),
+        'fetch_flights': dl.get_fetch_flights().stats(),
+        'write_checks': dl.get_write_checks().stats(),
+        'sqlite_store': dl.get_normalized_store().stats(),
+        'row_index': dl.get_row_indexes().stats(),
+        'write_queue': get_write_executor().stats(),
+        'export_queue': get_export_executor().stats(),
+        'login_limiter': get_login_limiter().stats(),
+        'background': background_metrics(),
+    }
+    if isinstance(backend, SheetsBackend):
+        stats['registry'] = dl.get_sheet_registry().stats()
+        stats['api_quota'] = dl.get_api_quota().stats()
+    return stats
+
+
+def _ops_table(run):
+    return [
+        {
+            'Kategori': r['category'],
+            'Operasi': r['name'],
+            'Jumlah': r['count'],
+            'KB': round(r['bytes'] / 1024, 1),
+            'ms': round(r['seconds'] * 1000, 1),
+            'Error': r['errors'],
+        }
+        for r in run.rows()
+    ]
+
+
+def render_metrics_panel(role):
+    """Show the metrics of this and the previous run in the sidebar (admin only)"""
+    from utils.auth import is_admin
+    if not is_admin(role):
+        return
+
+    current = st.session_state.get(_CURRENT_KEY)
+    previous = st.session_state.get(_PREVIOUS_KEY)
+
+    with st.sidebar.expander("📈 Instrumentasi", expanded=False):
+        for title, run in (("Run ini", current), ("Run sebelumnya", previous)):
+            if run is None or not run.rows():
+                continue
+            totals = run.totals()
+            summary = " · ".join(
+                f"{c}: {t['count']}x, {t['seconds'] * 1000:.0f} ms" for c, t in totals.items()
+            )
+            st.caption(f"**{title}** ({run.page}) — {summary}")
+            st.dataframe(_ops_table(run), use_container_width=True, hide_index=True)
+
+        st.caption("**Cache & kuota (proses)**")
+        st.json(get_runtime_stats(), expanded=False)
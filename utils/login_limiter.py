@@ -0,0 +1,171 @@
+"""
+Login Limiter Module
+Sistem Manajemen Data Gampong - Dinas Pemberdayaan Kota Langsa
+
+Pembatas percobaan login di dalam proses: penghitung sliding window per
+pasangan (username, klien) dan per klien (alamat IP), dengan jumlah kunci
+yang dibatasi dan dibuang secara LRU. Percobaan yang melewati batas ditolak
+sebelum ada panggilan ke backend, sehingga tebakan password tidak
+menghabiskan kuota Google Sheets pengguna lain. Batas username dihitung per
+klien, jadi percobaan dari klien lain tidak mengunci pemilik akun.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+import streamlit as st
+from utils.config import get_float_setting
+
+
+class SlidingWindowLimiter:
+    """
+    Sliding-window counter per key: the count of the previous fixed window,
+    weighted by how much of it still overlaps the sliding window, plus the
+    count of the current one. Each key holds three numbers; at most
+    max_keys keys are kept, the least recently used are evicted.
+    """
+
+    def __init__(self, limit, window=300.0, max_keys=10000):
+        self.limit = limit
+        self.window = window
+        self.max_keys = max_keys
+        self._lock = threading.Lock()
+        self._keys = OrderedDict()  # key -> [window index, previous count, current count]
+        self.evictions = 0
+
+    def _state(self, key, now):
+        """Counters of key rolled forward to the window of now"""
+        index = int(now // self.window)
+        state = self._keys.get(key)
+        if state is None:
+            state = self._keys[key] = [index, 0, 0]
+            if len(self._keys) > self.max_keys:
+                self._keys.popitem(last=False)
+                self.evictions += 1
+        elif state[0] != index:
+            previous = state[2] if state[0] == index - 1 else 0
+            state[:] = [index, previous, 0]
+        self._keys.move_to_end(key)
+        return state
+
+    def _estimate(self, state, now):
+        elapsed = (now % self.window) / self.window
+        return state[1] * (1.0 - elapsed) + state[2]
+
+    def retry_after(self, key, now=None):
+        """Seconds until key is below its limit again (0 if it is now)"""
+        now = time.time() if now is None else now
+        with self._lock:
+            state = self._keys.get(key)
+            if state is None:
+                return 0.0
+            state = self._state(key, now)
+            if self._estimate(state, now) < self.limit:
+                return 0.0
+            # The previous window's weight decays linearly; past the next
+            # boundary only the current count (then previous) is left
+            elapsed = now % self.window
+            if state[2] < self.limit and state[1]:
+                needed = (self._estimate(state, now) - self.limit + 1e-9) / state[1] * self.window
+                return min(needed, self.window - elapsed)
+            return self.window - elapsed
+
+    def hit(self, key, now=None):
+        """Count an attempt of key"""
+        now = time.time() if now is None else now
+        with self._lock:
+            self._state(key, now)[2] += 1
+
+    def reset(self, key):
+        """Forget key (e.g. after a successful login)"""
+        with self._lock:
+            self._keys.pop(key, None)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'limit': self.limit,
+                'window_seconds': self.window,
+                'tracked_keys': len(self._keys),
+                'max_keys': self.max_keys,
+                'evictions': self.evictions,
+            }
+
+
+class LoginLimiter:
+    """
+    Sliding-window limits on login attempts per (username, client) and per
+    client. Failures for a username only hold back the client making them,
+    so nobody can lock another user out by guessing their password.
+    """
+
+    def __init__(self, user_limit=5, client_limit=20, window=300.0, max_keys=10000):
+        self.limiters = {
+            'user': SlidingWindowLimiter(user_limit, window, max_keys),
+            'client': SlidingWindowLimiter(client_limit, window, max_keys),
+        }
+        self._lock = threading.Lock()
+        self.allowed = 0
+        self.rejected = {'user': 0, 'client': 0}
+
+    def _user_key(self, username, client):
+        return (str(username).strip().lower(), client or '')
+
+    def _keys(self, username, client):
+        keys = {'user': self._user_key(username, client)}
+        if client:
+            keys['client'] = client
+        return keys
+
+    def attempt(self, username, client=None):
+        """
+        Count a login attempt. Returns 0 if it may go ahead, else the seconds
+        to wait; rejected attempts are not counted.
+        """
+        now = time.time()
+        keys = self._keys(username, client)
+        for kind, key in keys.items():
+            wait = self.limiters[kind].retry_after(key, now)
+            if wait > 0:
+                with self._lock:
+                    self.rejected[kind] += 1
+                return wait
+        for kind, key in keys.items():
+            self.limiters[kind].hit(key, now)
+        with self._lock:
+            self.allowed += 1
+        return 0.0
+
+    def succeeded(self, username, client=None):
+        """A successful login clears the username's failures from client, not the client's own"""
+        self.limiters['user'].reset(self._user_key(username, client))
+
+    def stats(self):
+        """Get allowed/rejected counters and the state of both limiters"""
+        with self._lock:
+            stats = {'allowed': self.allowed, 'rejected': dict(self.rejected)}
+        for kind, limiter in self.limiters.items():
+            stats[kind] = limiter.stats()
+        return stats
+
+
+@st.cache_resource
+def get_login_limiter():
+    """Get the process-wide login limiter"""
+    return LoginLimiter(
+        user_limit=int(get_float_setting("login_max_attempts_user", 5)),
+        client_limit=int(get_float_setting("login_max_attempts_client", 20)),
+        window=get_float_setting("login_window_seconds", 300.0),
+        max_keys=int(get_float_setting("login_limiter_max_keys", 10000)),
+    )
+
+
+def current_client():
+    """
+    Client key of the current session: its IP address, or None if unknown.
+    The session id is not used, a new session would reset the limit.
+    """
+    try:
+        return st.context.ip_address or None
+    except Exception:
+        return None
@@ -0,0 +1,217 @@
+"""
+Row Index Module
+Sistem Manajemen Data Gampong - Dinas Pemberdayaan Kota Langsa
+
+Index lokasi baris untuk blok DESA/GAMPONG di worksheet Perangkat_Desa dan
+Tuha_Peuet: (DESA, NO_URUT) / (GAMPONG, NO_ANGGOTA) -> nomor baris absolut.
+Index dibangun dari grid mentah di SheetCache, digeser langsung saat baris
+disisipkan/dihapus, dan dibangun ulang bila generasi grid berubah atau isi
+baris tidak cocok lagi, sehingga penulisan tidak perlu membaca sheet dulu.
+"""
+
+import threading
+
+
+def normalize_block(value):
+    """Block key as compared by the editors: stripped, upper case"""
+    return str(value or '').strip().upper()
+
+
+def normalize_number(value):
+    """Member number as text, without the '.0' of numbers read as floats"""
+    text = str(value if value is not None else '').strip()
+    if text.endswith(".0"):
+        text = text[:-2]
+    return text
+
+
+def is_gampong_header(value):
+    """
+    Tuha_Peuet: a gampong name opens a block, the secretary label and name
+    written below it in the same column do not (same rule as load_tuha_peuet)
+    """
+    text = str(value or '').strip()
+    return text.isupper() and len(text) > 3 and "SEKRETARIS" not in text.upper()
+
+
+# Layout of the indexed worksheets (1-based columns, first data row)
+ROW_INDEX_SPECS = {
+    'Perangkat_Desa': {'block_col': 8, 'number_col': 11, 'first_row': 4},
+    'Tuha_Peuet': {'block_col': 6, 'number_col': 7, 'first_row': 8, 'is_anchor': is_gampong_header},
+}
+
+
+def block_at(sheet_name, values, row):
+    """Block (forward filled DESA/GAMPONG) a row belongs to, '' for sheets without blocks"""
+    spec = ROW_INDEX_SPECS.get(sheet_name)
+    if spec is None:
+        return ''
+    is_anchor = spec.get('is_anchor') or (lambda value: bool(str(value or '').strip()))
+    col = spec['block_col']
+    for r in range(min(row, len(values)), spec['first_row'] - 1, -1):
+        name = values[r - 1][col - 1] if len(values[r - 1]) >= col else ''
+        if is_anchor(name):
+            return normalize_block(name)
+    return ''
+
+
+class RowIndex:
+    """
+    (block, number) -> 1-based row of one worksheet. Blocks are merged cells:
+    the block name is only written on its first row and forward filled.
+    """
+
+    def __init__(self, values, block_col, number_col, first_row=1, is_anchor=None, generation=None):
+        self.block_col = block_col
+        self.number_col = number_col
+        self.first_row = first_row
+        self.is_anchor = is_anchor or (lambda value: bool(str(value or '').strip()))
+        self.generation = generation
+        self._build(values)
+
+    def _cell(self, row_values, col):
+        return row_values[col - 1] if len(row_values) >= col else ''
+
+    def _build(self, values):
+        self._rows = {}     # (block, number) -> row
+        self._anchors = {}  # block -> row holding the block name
+        self._members = {}  # block -> rows with a member number, ascending
+        block = None
+        for row in range(self.first_row, len(values) + 1):
+            row_values = values[row - 1]
+            name = self._cell(row_values, self.block_col)
+            if self.is_anchor(name):
+                block = normalize_block(name)
+                self._anchors.setdefault(block, row)
+            if block is None:
+                continue
+            number = normalize_number(self._cell(row_values, self.number_col))
+            if number:
+                self._rows[(block, number)] = row
+                self._members.setdefault(block, []).append(row)
+
+    def locate(self, block, number):
+        """Row of a member of a block, or None"""
+        return self._rows.get((normalize_block(block), normalize_number(number)))
+
+    def rows(self, block):
+        """{number: row} for every member of a block"""
+        block = normalize_block(block)
+        return {number: row for (b, number), row in self._rows.items() if b == block}
+
+    def anchor(self, block):
+        """Row holding the block name (the merged cell), or None"""
+        return self._anchors.get(normalize_block(block))
+
+    def last_row(self, block):
+        """Last row of a block that holds a member, or None"""
+        members = self._members.get(normalize_block(block))
+        return members[-1] if members else None
+
+    def max_number(self, block):
+        """Highest numeric member number of a block (0 if none)"""
+        numbers = [int(n) for n in self.rows(block) if n.isdigit()]
+        return max(numbers, default=0)
+
+    def matches(self, values, row, number):
+        """True if the grid still holds member number on row"""
+        if row < 1 or row > len(values):
+            return False
+        return normalize_number(self._cell(values[row - 1], self.number_col)) == normalize_number(number)
+
+    def shift(self, row, delta, block=None, number=None):
+        """
+        Follow a structural write: delta=+1 after inserting a row at row (the
+        new member given by block/number), delta=-1 after deleting row.
+        Returns False if the change cannot be followed incrementally (the
+        index must then be rebuilt).
+        """
+        if delta < 0 and row in self._anchors.values():
+            # Deleting a merged block name re-assigns the rows below it
+            return False
+
+        def moved(r):
+            if delta > 0:
+                return r + delta if r >= row else r
+            return r + delta if r > row else r
+
+        self._rows = {key: moved(r) for key, r in self._rows.items() if delta > 0 or r != row}
+        self._anchors = {b: moved(r) for b, r in self._anchors.items()}
+        self._members = {
+            b: [moved(r) for r in rows if delta > 0 or r != row]
+            for b, rows in self._members.items()
+        }
+        if delta > 0 and block is not None:
+            block = normalize_block(block)
+            if block not in self._anchors:
+                return False
+            if number is not None and normalize_number(number):
+                self._rows[(block, normalize_number(number))] = row
+            self._members.setdefault(block, []).append(row)
+            self._members[block].sort()
+        return True
+
+
+class RowIndexes:
+    """Thread-safe RowIndex per worksheet, kept for one grid generation"""
+
+    def __init__(self, specs=None):
+        self.specs = dict(specs or ROW_INDEX_SPECS)
+        self._lock = threading.Lock()
+        self._indexes = {}  # sheet name -> RowIndex
+        self.builds = 0
+        self.hits = 0
+        self.shifts = 0
+        self.invalidations = 0
+
+    def get(self, sheet_name, values, generation):
+        """Get the index of a sheet for the grid values of generation"""
+        with self._lock:
+            index = self._indexes.get(sheet_name)
+            if index is not None and index.generation == generation:
+                self.hits += 1
+                return index
+            index = RowIndex(values, generation=generation, **self.specs[sheet_name])
+            self._indexes[sheet_name] = index
+            self.builds += 1
+            return index
+
+    def shift(self, sheet_name, from_generation, to_generation, row, delta, block=None, number=None):
+        """
+        Shift the index of a sheet after a row insert/delete that took the
+        cached grid from from_generation to to_generation. An index built
+        for another generation, or a change it cannot follow, is dropped.
+        """
+        self.shift_rows(sheet_name, from_generation, to_generation, [(row, delta, block, number)])
+
+    def shift_rows(self, sheet_name, from_generation, to_generation, changes):
+        """Like shift for several changes [(row, delta, block, number), ...] applied in order"""
+        with self._lock:
+            index = self._indexes.get(sheet_name)
+            if index is None:
+                return
+            if index.generation == from_generation and all(index.shift(*change) for change in changes):
+                index.generation = to_generation
+                self.shifts += 1
+            else:
+                self._indexes.pop(sheet_name, None)
+                self.invalidations += 1
+
+    def invalidate(self, sheet_name=None):
+        """Drop the index of a sheet (or all), it is rebuilt on next use"""
+        with self._lock:
+            names = list(self._indexes) if sheet_name is None else [sheet_name]
+            for name in names:
+                if self._indexes.pop(name, None) is not None:
+                    self.invalidations += 1
+
+    def stats(self):
+        """Get build/hit/shift/invalidation counters"""
+        with self._lock:
+            return {
+                'builds': self.builds,
+                'hits': self.hits,
+                'shifts': self.shifts,
+                'invalidations': self.invalidations,
+                'indexed_sheets': sorted(self._indexes),
+            }
@@ -0,0 +1,315 @@
+"""
+Sheet Cache Module
+Sistem Manajemen Data Gampong - Dinas Pemberdayaan Kota Langsa
+
+Cache bersama untuk nilai mentah (get_all_values) tiap worksheet, sehingga
+beberapa sheet bisa diisi sekaligus dari satu permintaan batchGet.
+Nilai disimpan bersama revisi spreadsheet (Drive) saat diambil, dan hanya
+diunduh ulang jika revisi tersebut berubah; selama revisi belum diketahui
+(probe Drive gagal) nilai dipakai paling lama fallback_ttl detik.
+Hasil normalisasi (DataFrame dari fungsi load_*) disimpan di FrameCache
+per generasi grid mentahnya.
+"""
+
+import threading
+import time
+
+
+class SheetCache:
+    """Thread-safe, revision-checked store of raw worksheet grids"""
+
+    def __init__(self, revision_probe, probe_interval=5, fallback_ttl=60):
+        self._revision_probe = revision_probe
+        self.probe_interval = probe_interval
+        self.fallback_ttl = fallback_ttl
+        self._lock = threading.Lock()
+        self._probe_lock = threading.Lock()
+        self._entries = {}      # sheet name -> (values, revision, fetched_at)
+        self._generations = {}  # sheet name -> counter bumped on every content change
+        self._revision = None
+        self._probed_at = None
+        self.hits = 0
+        self.misses = 0
+        self.probes = 0
+        self.patches = 0
+        self.fallback_hits = 0
+
+    def current_revision(self, force=False):
+        """
+        Get the spreadsheet revision, probing the backend at most once per
+        probe_interval seconds (shared by all sheets and sessions), or right
+        now with force=True.
+        """
+        with self._probe_lock:
+            now = time.monotonic()
+            if not force and self._probed_at is not None and now - self._probed_at < self.probe_interval:
+                return self._revision
+
+            try:
+                self.probes += 1
+                revision = self._revision_probe()
+            except Exception as e:
+                # Keep serving the last known revision rather than refetching blindly
+                print(f"Error probing sheet revision: {e}")
+                revision = self._revision
+            self._revision = revision
+            self._probed_at = now
+            return revision
+
+    def _current(self, entry, revision):
+        """
+        True if entry is current at revision. While the revision is unknown
+        (the probe failed) entries younger than fallback_ttl seconds are
+        served, like the time-based cache this one replaced.
+        """
+        if entry is None:
+            return False
+        if revision is None:
+            if time.monotonic() - entry[2] < self.fallback_ttl:
+                self.fallback_hits += 1
+                return True
+            return False
+        return entry[1] == revision
+
+    def get(self, sheet_name):
+        """Get cached values for a sheet, or None if missing/outdated"""
+        revision = self.current_revision()
+        with self._lock:
+            entry = self._entries.get(sheet_name)
+            if not self._current(entry, revision):
+                self.misses += 1
+                return None
+            self.hits += 1
+            return entry[0]
+
+    def snapshot(self, sheet_name):
+        """Get (values, generation) of a current cached sheet, or None"""
+        revision = self.current_revision()
+        with self._lock:
+            entry = self._entries.get(sheet_name)
+            if not self._current(entry, revision):
+                self.misses += 1
+                return None
+            self.hits += 1
+            return entry[0], self._generations.get(sheet_name, 0)
+
+    def revision_of(self, sheet_name):
+        """Get the revision a cached sheet is labelled with, or None"""
+        with self._lock:
+            entry = self._entries.get(sheet_name)
+            return entry[1] if entry is not None else None
+
+    def generation(self, sheet_name):
+        """Get the content generation of a sheet (changes on every put/patch)"""
+        with self._lock:
+            return self._generations.get(sheet_name, 0)
+
+    def put(self, sheet_name, values, revision, if_generation=None):
+        """
+        Store fetched values for a sheet.
+        revision must be the one read *before* fetching, so a change that lands
+        during the fetch is picked up by the next probe. With if_generation the
+        values are only stored if nothing touched the sheet since then.
+        Returns True if the values were stored.
+        """
+        with self._lock:
+            if if_generation is not None and self._generations.get(sheet_name, 0) != if_generation:
+                return False
+            self._entries[sheet_name] = (values, revision, time.monotonic())
+            self._bump(sheet_name)
+            return True
+
+    def _bump(self, sheet_name):
+        self._generations[sheet_name] = self._generations.get(sheet_name, 0) + 1
+
+    def missing(self, sheet_names):
+        """Return the sheets (in order) that need to be fetched"""
+        return [name for name in sheet_names if self.get(name) is None]
+
+    def invalidate(self, sheet_names=None):
+        """Drop cached values for the given sheets, or for all sheets"""
+        with self._lock:
+            names = list(self._entries.keys()) if sheet_names is None else sheet_names
+            for name in names:
+                self._entries.pop(name, None)
+                self._bump(name)
+
+    def begin_write(self):
+        """
+        Probe the revision right before a local write; the result is the
+        base_revision to pass to apply_write/apply_row_change afterwards.
+        """
+        return self.current_revision(force=True)
+
+    def apply_write(self, cell_updates=None, invalidated=(), base_revision=None):
+        """
+        Bring the cache in line with a local write.
+        cell_updates: {sheet_name: [(row, col, value), ...]} (1-based, in the
+        order they were sent) is applied to the cached grids (write-through);
+        sheets in invalidated are dropped. With base_revision (from
+        begin_write) the cached sheets that were current at that revision are
+        carried over to the revision the write produced, so one edit does not
+        force a refetch of every sheet in the spreadsheet.
+        Returns the names of the sheets that were patched.
+        """
+        cell_updates = cell_updates or {}
+        self._expire_revision()
+
+        patched = []
+        with self._lock:
+            for sheet_name, cells in cell_updates.items():
+                entry = self._entries.get(sheet_name)
+                if entry is None:
+                    continue
+                values = _patch_grid(entry[0], cells)
+                self._entries[sheet_name] = (values,) + entry[1:]
+                self._bump(sheet_name)
+                self.patches += 1
+                patched.append(sheet_name)
+        self.invalidate([name for name in invalidated if name not in cell_updates])
+        self._carry_revision(base_revision)
+        return patched
+
+    def apply_row_change(self, sheet_name, row, delta, values=None, base_revision=None):
+        """
+        Bring the cached grid in line with a local row insert (delta=+1, the
+        new row's values) or delete (delta=-1) at 1-based row; base_revision
+        as for apply_write.
+        Returns (generation before, generation after), or None if the sheet
+        was not cached.
+        """
+        return self.apply_row_changes(sheet_name, [(row, delta, values)], base_revision)
+
+    def apply_row_changes(self, sheet_name, changes, base_revision=None):
+        """
+        Like apply_row_change for several changes [(row, delta, values), ...]
+        applied in order, patching the grid (one new generation) once.
+        """
+        self._expire_revision()
+        with self._lock:
+            entry = self._entries.get(sheet_name)
+            if entry is None:
+                result = None
+            else:
+                before = self._generations.get(sheet_name, 0)
+                grid = _shift_grid(entry[0], changes)
+                self._entries[sheet_name] = (grid,) + entry[1:]
+                self._bump(sheet_name)
+                self.patches += 1
+                result = (before, self._generations[sheet_name])
+        self._carry_revision(base_revision)
+        return result
+
+    def _expire_revision(self):
+        """Force a fresh probe after a write"""
+        with self._probe_lock:
+            self._probed_at = None
+
+    def _carry_revision(self, base_revision):
+        """
+        Move cached sheets that were current right before a local write to
+        the revision it produced. Sheets cached at an older revision (an
+        external change landed before the write) are left to be refetched;
+        without a base revision nothing is carried.
+        """
+        new_revision = self.current_revision()
+        if base_revision is None or new_revision is None or new_revision == base_revision:
+            return
+        with self._lock:
+            for name, (values, revision, fetched_at) in list(self._entries.items()):
+                if revision == base_revision:
+                    self._entries[name] = (values, new_revision, fetched_at)
+
+    def invalidate_after_write(self, sheet_names, base_revision=None):
+        """Drop the sheets touched by a local write, keeping the others valid"""
+        self.apply_write(invalidated=sheet_names, base_revision=base_revision)
+
+    def stats(self):
+        """Get cache hit/miss/probe counters"""
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'probes': self.probes,
+                'patches': self.patches,
+                'fallback_hits': self.fallback_hits,
+                'revision': self._revision,
+                'cached_sheets': sorted(self._entries.keys()),
+            }
+
+
+class FrameCache:
+    """Memoized normalized DataFrames, keyed by the raw grid they were built from"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._frames = {}   # loader name -> (token, DataFrame)
+        self._timings = {}  # loader name -> seconds spent normalizing (total)
+        self.hits = 0
+        self.misses = 0
+        self.normalize_seconds = 0.0
+
+    def get(self, name, token):
+        """Get a copy of the cached frame if it was built from token, else None"""
+        with self._lock:
+            entry = self._frames.get(name)
+            if entry is None or entry[0] != token:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return entry[1].copy()
+
+    def put(self, name, token, frame, seconds=0.0):
+        """Store a normalized frame built from token, with its build time"""
+        with self._lock:
+            self._frames[name] = (token, frame.copy())
+            self._timings[name] = self._timings.get(name, 0.0) + seconds
+            self.normalize_seconds += seconds
+
+    def stats(self):
+        """Get hit/miss counters and normalization time per loader"""
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'normalize_seconds': round(self.normalize_seconds, 4),
+                'per_loader': {name: round(t, 4) for name, t in self._timings.items()},
+            }
+
+
+def _patch_grid(values, cells):
+    """Return a copy of values with (row, col, value) cells applied in order"""
+    grid = [list(row) for row in values]
+    width = max((len(row) for row in grid), default=0)
+    for row, col, value in cells:
+        while len(grid) < row:
+            grid.append([''] * width)
+        if col > width:
+            for r in grid:
+                r.extend([''] * (col - width))
+            width = col
+        grid[row - 1][col - 1] = '' if value is None else str(value)
+    return grid
+
+
+def _shift_grid(values, changes):
+    """
+    Return a copy of values with the row changes [(row, delta, new_values), ...]
+    applied in order: a row inserted (delta=+1) or deleted (delta=-1)
+    """
+    grid = [list(r) for r in values]
+    width = max((len(r) for r in grid), default=0)
+    for row, delta, new_values in changes:
+        if delta > 0:
+            new_row = ['' if v is None else str(v) for v in (new_values or [])]
+            new_row += [''] * (width - len(new_row))
+            if len(new_row) > width:
+                for r in grid:
+                    r.extend([''] * (len(new_row) - len(r)))
+                width = len(new_row)
+            while len(grid) < row - 1:
+                grid.append([''] * width)
+            grid.insert(row - 1, new_row)
+        elif 0 < row <= len(grid):
+            del grid[row - 1]
+    return grid
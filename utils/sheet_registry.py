@@ -0,0 +1,127 @@
+"""
+Sheet Registry Module
+Sistem Manajemen Data Gampong - Dinas Pemberdayaan Kota Langsa
+
+Registry handle Spreadsheet dan Worksheet yang dipakai bersama oleh semua
+session, supaya client.open() dan sh.worksheet() tidak dipanggil ulang
+pada setiap akses data.
+"""
+
+import threading
+import gspread
+
+# HTTP codes that mean the cached worksheet title no longer resolves
+# (renamed or deleted), as opposed to quota or server errors.
+STALE_HANDLE_CODES = (400, 404)
+
+
+class SheetRegistry:
+    """Process-wide cache of opened Spreadsheet and Worksheet handles"""
+
+    def __init__(self, client_factory, spreadsheet_name):
+        self._client_factory = client_factory
+        self._spreadsheet_name = spreadsheet_name
+        self._lock = threading.RLock()
+        self._spreadsheet = None
+        self._worksheets = {}     # requested name -> Worksheet handle
+        self._worksheet_ids = {}  # requested name -> sheetId (survives renames)
+        self._listing = None      # (by_title, by_id) from the last metadata fetch
+        self.hits = 0
+        self.misses = 0
+        self.refreshes = 0
+
+    def spreadsheet(self):
+        """Get the Spreadsheet handle, opening it only on first use"""
+        with self._lock:
+            if self._spreadsheet is None:
+                client = self._client_factory()
+                if not client:
+                    return None
+                self._spreadsheet = client.open(self._spreadsheet_name)
+            return self._spreadsheet
+
+    def worksheet(self, name):
+        """
+        Get a Worksheet handle by name.
+        Resolves all worksheets with one metadata call on a miss and follows
+        the stored sheetId when a worksheet has been renamed.
+        """
+        with self._lock:
+            ws = self._worksheets.get(name)
+            if ws is not None:
+                self.hits += 1
+                return ws
+
+            self.misses += 1
+            sh = self.spreadsheet()
+            if sh is None:
+                return None
+
+            ws = self._resolve(name) if self._listing else None
+            if ws is None:
+                self._fetch_worksheets(sh)
+                ws = self._resolve(name)
+            if ws is None:
+                self._worksheet_ids.pop(name, None)
+                raise gspread.exceptions.WorksheetNotFound(name)
+
+            self._worksheets[name] = ws
+            self._worksheet_ids[name] = ws.id
+            return ws
+
+    def _resolve(self, name):
+        by_title, by_id = self._listing
+        ws = by_title.get(name)
+        if ws is None and name in self._worksheet_ids:
+            # Renamed in Google Sheets: the id is stable, the title is not
+            ws = by_id.get(self._worksheet_ids[name])
+        return ws
+
+    def _fetch_worksheets(self, sh):
+        self.refreshes += 1
+        worksheets = sh.worksheets()
+        self._listing = (
+            {ws.title: ws for ws in worksheets},
+            {ws.id: ws for ws in worksheets},
+        )
+
+    def invalidate(self, name=None):
+        """
+        Drop cached handles so they are resolved again on next access.
+        Stored sheetIds are kept so renamed worksheets can still be found.
+        """
+        with self._lock:
+            self._listing = None
+            if name is None:
+                self._spreadsheet = None
+                self._worksheets.clear()
+            else:
+                self._worksheets.pop(name, None)
+
+    def run(self, name, operation):
+        """
+        Run operation(ws) on a cached worksheet handle.
+        If the handle went stale (worksheet renamed/deleted), refresh it once
+        and retry.
+        """
+        ws = self.worksheet(name)
+        if ws is None:
+            return None
+        try:
+            return operation(ws)
+        except gspread.exceptions.APIError as e:
+            if e.code not in STALE_HANDLE_CODES:
+                raise
+            self.invalidate(name)
+            ws = self.worksheet(name)
+            return operation(ws) if ws is not None else None
+
+    def stats(self):
+        """Get registry hit/miss counters"""
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'refreshes': self.refreshes,
+                'cached_worksheets': sorted(self._worksheets.keys()),
+            }
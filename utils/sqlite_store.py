@@ -0,0 +1,140 @@
+"""
+SQLite Store Module
+Sistem Manajemen Data Gampong - Dinas Pemberdayaan Kota Langsa
+
+Penyimpanan tabel hasil normalisasi (perangkat desa, tuha peuet, geuchik)
+di SQLite embedded dengan index pada kolom yang sering difilter, sehingga
+filter halaman, lookup dan statistik tidak perlu menyaring seluruh
+DataFrame pada setiap rerun.
+"""
+
+import sqlite3
+import threading
+import pandas as pd
+
+# Column holding the original DataFrame position, so query results keep sheet order
+ROW_COLUMN = "_ROW"
+
+# Indexed columns per table; a tuple is a composite index
+TABLE_INDEXES = {
+    'camat_mukim_geuchik': [('KECAMATAN',), ('GAMPONG',)],
+    'geuchik_detail': [('KECAMATAN',), ('NO_DESA',), ('DESA',)],
+    'perangkat_desa': [('DESA', 'NO_URUT'), ('KECAMATAN',), ('NO_DESA',)],
+    'tuha_peuet': [('GAMPONG', 'NO_ANGGOTA'), ('KECAMATAN',)],
+}
+
+
+def _quote(name):
+    """Quote an SQL identifier (column names may contain spaces)"""
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+def _escape_like(text):
+    return text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+class NormalizedStore:
+    """Thread-safe SQLite copy of the normalized data tables"""
+
+    def __init__(self, path=":memory:"):
+        self._conn = sqlite3.connect(str(path), check_same_thread=False)
+        self._lock = threading.Lock()
+        self._tokens = {}   # table -> token of the data it was imported from
+        self._columns = {}  # table -> column names in DataFrame order
+        self.imports = 0
+        self.queries = 0
+
+    def token(self, table):
+        """Get the source token the table was last imported with (None if never)"""
+        with self._lock:
+            return self._tokens.get(table)
+
+    def replace_table(self, table, df, token):
+        """Replace the contents of a table with df and create its indexes"""
+        with self._lock:
+            self._conn.execute(f"DROP TABLE IF EXISTS {_quote(table)}")
+            if df is not None and len(df.columns) > 0:
+                df.to_sql(table, self._conn, index=True, index_label=ROW_COLUMN)
+                for columns in TABLE_INDEXES.get(table, []):
+                    if not all(col in df.columns for col in columns):
+                        continue
+                    index_name = _quote(f"idx_{table}_{'_'.join(columns)}")
+                    column_sql = ", ".join(_quote(col) for col in columns)
+                    self._conn.execute(f"CREATE INDEX {index_name} ON {_quote(table)} ({column_sql})")
+                self._columns[table] = [str(col) for col in df.columns]
+            else:
+                self._columns.pop(table, None)
+            self._conn.commit()
+            self._tokens[table] = token
+            self.imports += 1
+
+    def _where(self, filters=None, search=None, search_columns=()):
+        clauses, params = [], []
+        for col, value in (filters or {}).items():
+            if value is None:
+                continue
+            clauses.append(f"{_quote(col)} = ?")
+            params.append(value)
+        if search and search_columns:
+            pattern = f"%{_escape_like(search)}%"
+            clauses.append("(" + " OR ".join(f"{_quote(col)} LIKE ? ESCAPE '\\'" for col in search_columns) + ")")
+            params.extend([pattern] * len(search_columns))
+        sql = (" WHERE " + " AND ".join(clauses)) if clauses else ""
+        return sql, params
+
+    def query(self, table, filters=None, search=None, search_columns=()):
+        """
+        Get rows of a table in their original order.
+        filters: {column: value} equality filters (None values are ignored);
+        search: case-insensitive substring matched against search_columns.
+        """
+        with self._lock:
+            columns = self._columns.get(table)
+            if columns is None:
+                return pd.DataFrame()
+            where, params = self._where(filters, search, search_columns)
+            self.queries += 1
+            df = pd.read_sql_query(
+                f"SELECT * FROM {_quote(table)}{where} ORDER BY {_quote(ROW_COLUMN)}",
+                self._conn, params=params
+            )
+        return df.drop(columns=[ROW_COLUMN]).reset_index(drop=True)
+
+    def distinct(self, table, column, filters=None):
+        """Get the sorted non-empty distinct values of a column as strings"""
+        with self._lock:
+            if column not in self._columns.get(table, []):
+                return []
+            where, params = self._where(filters)
+            where = (where + " AND " if where else " WHERE ") + f"{_quote(column)} IS NOT NULL"
+            self.queries += 1
+            rows = self._conn.execute(
+                f"SELECT DISTINCT {_quote(column)} FROM {_quote(table)}{where}", params
+            ).fetchall()
+        return sorted(str(row[0]) for row in rows)
+
+    def summary(self, table, distinct_columns=(), filters=None):
+        """Get {'rows': count, column: distinct count, ...} for a table"""
+        with self._lock:
+            existing = self._columns.get(table, [])
+            result = {'rows': 0}
+            result.update({col: 0 for col in distinct_columns})
+            if not existing:
+                return result
+            counted = [col for col in distinct_columns if col in existing]
+            select = ", ".join(["COUNT(*)"] + [f"COUNT(DISTINCT {_quote(col)})" for col in counted])
+            where, params = self._where(filters)
+            self.queries += 1
+            row = self._conn.execute(f"SELECT {select} FROM {_quote(table)}{where}", params).fetchone()
+        result['rows'] = row[0]
+        result.update(dict(zip(counted, row[1:])))
+        return result
+
+    def stats(self):
+        """Get import/query counters"""
+        with self._lock:
+            return {
+                'imports': self.imports,
+                'queries': self.queries,
+                'tables': {table: token for table, token in self._tokens.items()},
+            }
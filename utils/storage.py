@@ -0,0 +1,561 @@
+"""
+Storage Backend Module
+Sistem Manajemen Data Gampong - Dinas Pemberdayaan Kota Langsa
+
+Abstraksi penyimpanan data. Tersedia dua backend:
+- SheetsBackend : Google Sheets melalui gspread (default, produksi)
+- ExcelBackend  : file .xlsx lokal (offline, uji beban, benchmark), disalin dari
+                  workbook bawaan repo ke folder data terpisah saat pertama dipakai
+
+Kedua backend menyediakan handle worksheet dengan subset API gspread.Worksheet
+yang dipakai oleh data_manager dan auth (get_all_values, find/findall, cell,
+update_cell, update_cells, insert_row, append_row, delete_rows, ...), serta
+batch_get / batch_update untuk membaca dan menulis beberapa sheet sekaligus,
+dan batch_change_rows untuk menyisipkan/menghapus banyak baris dalam satu
+permintaan.
+"""
+
+import json
+import os
+import shutil
+import tempfile
+import threading
+from datetime import date, datetime
+from pathlib import Path
+
+import gspread
+import openpyxl
+from gspread.urls import DRIVE_FILES_API_V3_URL
+from gspread.utils import absolute_range_name, fill_gaps, rowcol_to_a1
+
+from utils.sheet_registry import STALE_HANDLE_CODES
+from utils.instrumentation import instrumented
+
+# Worksheet name -> local workbook used by ExcelBackend
+LOCAL_WORKBOOKS = {
+    "Camat_Mukim_Geuchik": "data_(camat,mukim,dan geuchik).xlsx",
+    "Geuchik_Detail": "data_(geuchik kota langsa).xlsx",
+    "Perangkat_Desa": "data_(kepala desa & perangkat desa).xlsx",
+    "Tuha_Peuet": "data_(tuha peuet gampong).xlsx",
+    "Users": "users.xlsx",
+}
+
+USERS_HEADER = ['username', 'password', 'role']
+
+
+class SheetsBackend:
+    """Google Sheets backend (gspread), using the shared handle registry"""
+
+    name = "gsheets"
+
+    def __init__(self, registry):
+        self.registry = registry
+
+    def available(self):
+        return self.registry.spreadsheet() is not None
+
+    def worksheet(self, sheet_name):
+        return self.registry.worksheet(sheet_name)
+
+    def get_all_values(self, sheet_name):
+        """Fetch all values of one worksheet (one values.get call)"""
+        return self.registry.run(sheet_name, lambda ws: ws.get_all_values())
+
+    def _title(self, sheet_name):
+        """Title of a worksheet to write to; WorksheetNotFound if it is missing"""
+        worksheet = self.registry.worksheet(sheet_name)
+        if worksheet is None:
+            raise gspread.exceptions.WorksheetNotFound(sheet_name)
+        return worksheet.title
+
+    def _run_spreadsheet(self, operation):
+        """Run operation(spreadsheet), refreshing stale handles once on 400/404"""
+        try:
+            return operation(self.registry.spreadsheet())
+        except gspread.exceptions.APIError as e:
+            if e.code not in STALE_HANDLE_CODES:
+                raise
+            self.registry.invalidate()
+            return operation(self.registry.spreadsheet())
+
+    def batch_get(self, sheet_names):
+        """
+        Fetch all values of several worksheets with a single values:batchGet call.
+        Returns {sheet_name: values} padded like get_all_values(); missing
+        worksheets are None, as get_all_values() returns for them.
+        """
+        registry = self.registry
+        found = {}
+
+        def batch_get(sh):
+            found.clear()
+            for name in sheet_names:
+                try:
+                    worksheet = registry.worksheet(name)
+                except gspread.exceptions.WorksheetNotFound:
+                    continue
+                if worksheet is not None:
+                    found[name] = worksheet.title
+            if not found:
+                return []
+            ranges = [absolute_range_name(title) for title in found.values()]
+            return sh.values_batch_get(ranges).get('valueRanges', [])
+
+        value_ranges = self._run_spreadsheet(batch_get)
+        results = dict.fromkeys(sheet_names)
+        for name, value_range in zip(found, value_ranges):
+            results[name] = fill_gaps(value_range.get('values', []))
+        missing = [name for name in sheet_names if name not in found]
+        if missing:
+            print(f"Error batch loading sheets: worksheets not found {missing}")
+        return results
+
+    def batch_update(self, cell_updates, value_input_option='USER_ENTERED'):
+        """
+        Write cells of several worksheets with a single values:batchUpdate call.
+        cell_updates: {sheet_name: [(row, col, value), ...]} (1-based).
+        Returns the API response (totalUpdatedCells, responses, ...).
+        """
+        def batch_update(sh):
+            data = []
+            for name, cells in cell_updates.items():
+                title = self._title(name)
+                for row, col, value in cells:
+                    data.append({
+                        'range': absolute_range_name(title, rowcol_to_a1(row, col)),
+                        'values': [['' if value is None else value]],
+                    })
+            return sh.values_batch_update(body={'valueInputOption': value_input_option, 'data': data})
+
+        return self._run_spreadsheet(batch_update)
+
+    def batch_change_rows(self, sheet_name, changes):
+        """
+        Insert and delete rows of one worksheet with a single
+        spreadsheets:batchUpdate call (applied atomically, in order).
+        changes: [(row, delta, values), ...] with 1-based row; delta=+1
+        inserts a row holding values (RAW, like insert_row), delta=-1 deletes
+        the row. Callers order them bottom-up so each row number refers to
+        the sheet as it was before the batch.
+        """
+        registry = self.registry
+
+        def batch_update(sh):
+            worksheet = registry.worksheet(sheet_name)
+            if worksheet is None:
+                raise gspread.exceptions.WorksheetNotFound(sheet_name)
+            requests = []
+            for row, delta, values in changes:
+                rows = {'sheetId': worksheet.id, 'dimension': 'ROWS', 'startIndex': row - 1, 'endIndex': row}
+                if delta < 0:
+                    requests.append({'deleteDimension': {'range': rows}})
+                    continue
+                requests.append({'insertDimension': {'range': rows, 'inheritFromBefore': False}})
+                requests.append({'updateCells': {
+                    'start': {'sheetId': worksheet.id, 'rowIndex': row - 1, 'columnIndex': 0},
+                    'rows': [{'values': [_cell_data(value) for value in values]}],
+                    'fields': 'userEnteredValue',
+                }})
+            return sh.batch_update({'requests': requests})
+
+        return self._run_spreadsheet(batch_update)
+
+    def revision(self):
+        """
+        Fetch the spreadsheet revision from Drive (version + modifiedTime).
+        A single small metadata request, much cheaper than downloading values.
+        """
+        sh = self.registry.spreadsheet()
+        if sh is None:
+            return None
+        params = {'fields': 'version,modifiedTime', 'supportsAllDrives': True}
+        res = sh.client.request('get', f"{DRIVE_FILES_API_V3_URL}/{sh.id}", params=params)
+        meta = res.json()
+        return f"{meta.get('version')}:{meta.get('modifiedTime')}"
+
+    def stats(self):
+        return self.registry.stats()
+
+
+class ExcelBackend:
+    """
+    Local .xlsx backend implementing the same interface with openpyxl.
+    Workbooks missing from base_path are copied there from seed_path (the
+    workbooks shipped with the app) on start, so writes never touch the
+    seed files.
+    """
+
+    name = "excel"
+
+    def __init__(self, base_path, workbooks=None, seed_path=None):
+        self.base_path = Path(base_path)
+        self.seed_path = Path(seed_path) if seed_path is not None else None
+        self.workbooks = dict(workbooks or LOCAL_WORKBOOKS)
+        self._lock = threading.RLock()
+        self._loaded = {}  # sheet name -> (workbook, mtime_ns)
+        self.reads = 0
+        self.writes = 0
+        self._seed()
+
+    def _seed(self):
+        """Copy the seed workbooks (and users.json) that base_path does not have yet"""
+        if self.seed_path is None or self.seed_path.resolve() == self.base_path.resolve():
+            return
+        self.base_path.mkdir(parents=True, exist_ok=True)
+        for filename in [*self.workbooks.values(), "users.json"]:
+            source, target = self.seed_path / filename, self.base_path / filename
+            if source.exists() and not target.exists():
+                shutil.copy2(source, target)
+
+    def available(self):
+        return True
+
+    def path(self, sheet_name):
+        filename = self.workbooks.get(sheet_name)
+        if not filename:
+            raise gspread.exceptions.WorksheetNotFound(sheet_name)
+        return self.base_path / filename
+
+    def worksheet(self, sheet_name):
+        self.path(sheet_name)  # raise WorksheetNotFound for unknown sheets
+        return ExcelWorksheet(self, sheet_name)
+
+    def get_all_values(self, sheet_name):
+        with self._lock:
+            ws = self._sheet(sheet_name)
+            return _sheet_values(ws)
+
+    def batch_get(self, sheet_names):
+        return {name: self.get_all_values(name) for name in sheet_names}
+
+    def batch_update(self, cell_updates, value_input_option=None):
+        """
+        Write {sheet_name: [(row, col, value), ...]}, saving each workbook once.
+        All-or-nothing: every workbook is saved to a temp file before any is
+        renamed into place, and a failure discards the in-memory edits.
+        """
+        total = 0
+        with self._lock:
+            staged = []
+            try:
+                for name, cells in cell_updates.items():
+                    ws = self._sheet(name)
+                    for row, col, value in cells:
+                        ws.cell(row=row, column=col).value = _from_input(value)
+                    total += len(cells)
+                for name in cell_updates:
+                    staged.append((name, self._save_temp(name)))
+            except Exception:
+                for _, tmp_path in staged:
+                    os.remove(tmp_path)
+                for name in cell_updates:
+                    self._loaded.pop(name, None)
+                raise
+            for name, tmp_path in staged:
+                self._replace(name, tmp_path)
+        return {'totalUpdatedSheets': len(cell_updates), 'totalUpdatedCells': total}
+
+    def batch_change_rows(self, sheet_name, changes):
+        """Insert/delete rows like SheetsBackend.batch_change_rows, saving the workbook once"""
+        with self._lock:
+            try:
+                ws = self._sheet(sheet_name)
+                for row, delta, values in changes:
+                    _change_rows(ws, row, delta)
+                    if delta > 0:
+                        for col, value in enumerate(values, start=1):
+                            ws.cell(row=row, column=col).value = _from_input(value)
+                self._save(sheet_name)
+            except Exception:
+                self._loaded.pop(sheet_name, None)
+                raise
+        return {'replies': [{} for _ in changes]}
+
+    def revision(self):
+        """Revision = newest modification time of the local workbooks"""
+        mtimes = []
+        for filename in self.workbooks.values():
+            file_path = self.base_path / filename
+            if file_path.exists():
+                mtimes.append(file_path.stat().st_mtime_ns)
+        return str(max(mtimes)) if mtimes else None
+
+    def stats(self):
+        return {'reads': self.reads, 'writes': self.writes, 'loaded': sorted(self._loaded.keys())}
+
+    # --- workbook access (callers hold self._lock) ---
+
+    def _workbook(self, sheet_name):
+        file_path = self.path(sheet_name)
+        if not file_path.exists():
+            if sheet_name != "Users":
+                raise gspread.exceptions.WorksheetNotFound(sheet_name)
+            self._create_users_workbook(file_path)
+
+        mtime = file_path.stat().st_mtime_ns
+        loaded = self._loaded.get(sheet_name)
+        if loaded is None or loaded[1] != mtime:
+            self.reads += 1
+            wb = openpyxl.load_workbook(file_path)
+            self._loaded[sheet_name] = (wb, mtime)
+            return wb
+        return loaded[0]
+
+    def _sheet(self, sheet_name):
+        return self._workbook(sheet_name).active
+
+    def _save(self, sheet_name):
+        """Save a workbook atomically (write to temp file, then rename)"""
+        self._replace(sheet_name, self._save_temp(sheet_name))
+
+    @instrumented('storage', 'save_workbook')
+    def _save_temp(self, sheet_name):
+        """Save a loaded workbook next to its file; returns the temp path"""
+        wb, _ = self._loaded[sheet_name]
+        file_path = self.path(sheet_name)
+        fd, tmp_path = tempfile.mkstemp(dir=file_path.parent, suffix='.xlsx.tmp')
+        os.close(fd)
+        try:
+            wb.save(tmp_path)
+        except Exception:
+            os.remove(tmp_path)
+            raise
+        return tmp_path
+
+    def _replace(self, sheet_name, tmp_path):
+        """Move a saved temp file over the workbook file"""
+        wb, _ = self._loaded[sheet_name]
+        file_path = self.path(sheet_name)
+        try:
+            os.replace(tmp_path, file_path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        self.writes += 1
+        self._loaded[sheet_name] = (wb, file_path.stat().st_mtime_ns)
+
+    def _create_users_workbook(self, file_path):
+        """Create the local Users workbook, seeded from users.json if present"""
+        wb = openpyxl.Workbook()
+        ws = wb.active
+        ws.title = "Users"
+        ws.append(USERS_HEADER)
+
+        users_json = self.base_path / "users.json"
+        if users_json.exists():
+            with open(users_json, encoding='utf-8') as f:
+                for username, info in json.load(f).items():
+                    ws.append([username, info.get('password', ''), info.get('role', 'viewer')])
+        wb.save(file_path)
+
+
+class ExcelWorksheet:
+    """Worksheet handle over a local workbook, mirroring gspread.Worksheet"""
+
+    def __init__(self, backend, title):
+        self._backend = backend
+        self.title = title
+        self.id = list(backend.workbooks).index(title)
+
+    def _read(self):
+        return self._backend.get_all_values(self.title)
+
+    # --- reads ---
+
+    def get_all_values(self, **kwargs):
+        return self._read()
+
+    def get_all_records(self, **kwargs):
+        values = self._read()
+        if not values:
+            return []
+        header = values[0]
+        return [dict(zip(header, row)) for row in values[1:]]
+
+    def row_values(self, row, **kwargs):
+        values = self._read()
+        if row > len(values):
+            return []
+        return _trim(values[row - 1])
+
+    def col_values(self, col, **kwargs):
+        column = [row[col - 1] if col <= len(row) else '' for row in self._read()]
+        return _trim(column)
+
+    def cell(self, row, col, **kwargs):
+        values = self._read()
+        value = ''
+        if row <= len(values) and col <= len(values[row - 1]):
+            value = values[row - 1][col - 1]
+        return gspread.Cell(row, col, value)
+
+    def findall(self, query, in_row=None, in_column=None, case_sensitive=True):
+        cells = []
+        for r, row in enumerate(self._read(), start=1):
+            if in_row and r != in_row:
+                continue
+            for c, value in enumerate(row, start=1):
+                if in_column and c != in_column:
+                    continue
+                if _matches(value, query, case_sensitive):
+                    cells.append(gspread.Cell(r, c, value))
+        return cells
+
+    def find(self, query, in_row=None, in_column=None, case_sensitive=True):
+        cells = self.findall(query, in_row, in_column, case_sensitive)
+        return cells[0] if cells else None
+
+    # --- writes ---
+
+    def update_cell(self, row, col, value):
+        return self.update_cells([gspread.Cell(row, col, value)])
+
+    def update_cells(self, cell_list, value_input_option=None):
+        backend = self._backend
+        with backend._lock:
+            ws = backend._sheet(self.title)
+            for c in cell_list:
+                ws.cell(row=c.row, column=c.col).value = _from_input(c.value)
+            backend._save(self.title)
+        rows = {c.row for c in cell_list}
+        cols = {c.col for c in cell_list}
+        return {
+            'updatedRange': self.title,
+            'updatedRows': len(rows),
+            'updatedColumns': len(cols),
+            'updatedCells': len(cell_list),
+        }
+
+    def insert_row(self, values, index=1, value_input_option=None, inherit_from_before=False):
+        backend = self._backend
+        with backend._lock:
+            ws = backend._sheet(self.title)
+            _change_rows(ws, index, 1)
+            for col, value in enumerate(values, start=1):
+                ws.cell(row=index, column=col).value = _from_input(value)
+            backend._save(self.title)
+        return {'updates': {'updatedRows': 1}}
+
+    def append_row(self, values, value_input_option=None, **kwargs):
+        return self.insert_row(values, index=len(self._read()) + 1)
+
+    def delete_rows(self, start_index, end_index=None):
+        end_index = end_index or start_index
+        count = end_index - start_index + 1
+        backend = self._backend
+        with backend._lock:
+            ws = backend._sheet(self.title)
+            _change_rows(ws, start_index, -count)
+            backend._save(self.title)
+        return {}
+
+
+def _to_text(value):
+    """Render an openpyxl value the way Sheets FORMATTED_VALUE would"""
+    if value is None:
+        return ''
+    if isinstance(value, bool):
+        return 'TRUE' if value else 'FALSE'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    if isinstance(value, datetime):
+        return value.strftime('%d/%m/%Y')
+    if isinstance(value, date):
+        return value.strftime('%d/%m/%Y')
+    return str(value)
+
+
+def _cell_data(value):
+    """CellData of a RAW value for an updateCells request"""
+    if value is None or value == '':
+        return {}
+    if isinstance(value, bool):
+        return {'userEnteredValue': {'boolValue': value}}
+    if isinstance(value, (int, float)):
+        return {'userEnteredValue': {'numberValue': value}}
+    return {'userEnteredValue': {'stringValue': str(value)}}
+
+
+def _from_input(value):
+    """Store empty strings as empty cells, like Google Sheets does"""
+    if value is None or value == '':
+        return None
+    return value
+
+
+def _sheet_values(ws):
+    """get_all_values() equivalent: trailing empty rows trimmed, rows padded"""
+    rows = [[_to_text(v) for v in row] for row in ws.iter_rows(values_only=True)]
+    while rows and not any(rows[-1]):
+        rows.pop()
+    width = max((len(_trim(row)) for row in rows), default=0)
+    return fill_gaps([row[:width] for row in rows], cols=width)
+
+
+def _trim(values):
+    values = list(values)
+    while values and values[-1] == '':
+        values.pop()
+    return values
+
+
+def _matches(value, query, case_sensitive):
+    query = str(query)
+    if case_sensitive:
+        return value == query
+    return value.lower() == query.lower()
+
+
+def _change_rows(ws, index, delta):
+    """
+    Insert (delta > 0) or delete (delta < 0) rows at index, keeping merged
+    ranges aligned the way Google Sheets does (ranges spanning the change grow
+    or shrink). openpyxl does not move merged ranges by itself.
+    """
+    affected = [m for m in ws.merged_cells.ranges if m.max_row >= index]
+    spans = []
+    for merged in list(affected):
+        spans.append((merged.min_row, merged.min_col, merged.max_row, merged.max_col))
+        ws.unmerge_cells(merged.coord)
+
+    if delta > 0:
+        ws.insert_rows(index, delta)
+    else:
+        ws.delete_rows(index, -delta)
+
+    for min_row, min_col, max_row, max_col in spans:
+        rows = _shift_row_span(min_row, max_row, index, delta)
+        if rows is None:
+            continue
+        min_row, max_row = rows
+        if max_row > min_row or max_col > min_col:
+            ws.merge_cells(start_row=min_row, start_column=min_col,
+                           end_row=max_row, end_column=max_col)
+
+
+def _shift_row_span(min_row, max_row, index, delta):
+    """New (min_row, max_row) of a range after a row change, or None if deleted"""
+    if delta > 0:
+        if min_row >= index:
+            min_row += delta
+        if max_row >= index:
+            max_row += delta
+        return min_row, max_row
+
+    end = index - delta - 1  # last deleted row
+    if min_row > end:
+        new_min = min_row + delta
+    elif min_row >= index:
+        new_min = index
+    else:
+        new_min = min_row
+
+    if max_row > end:
+        new_max = max_row + delta
+    elif max_row >= index:
+        new_max = index - 1
+    else:
+        new_max = max_row
+
+    return (new_min, new_max) if new_max >= new_min else None
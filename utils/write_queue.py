@@ -0,0 +1,299 @@
+"""
+Write Queue Module
+Sistem Manajemen Data Gampong - Dinas Pemberdayaan Kota Langsa
+
+Penulisan ke Google Sheets dijalankan di thread pekerja latar belakang:
+halaman hanya memasukkan job ke antrean lalu langsung kembali, status job
+(menunggu/berjalan/selesai/gagal) disimpan di status store bersama dan
+dilaporkan kembali ke session pemiliknya. Job idempoten dicoba ulang bila
+gagal karena error sementara di luar panggilan API; error API sudah dicoba
+ulang oleh QuotaHTTPClient dan tidak diulang lagi per job. Executor terpisah dengan mekanisme yang sama
+membuat file export sesuai permintaan, dengan laporan progres per job.
+"""
+
+import contextvars
+import itertools
+import queue
+import threading
+import time
+import streamlit as st
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+from utils.api_quota import background_requests, track_api_failures
+from utils.config import get_float_setting
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+# Job ids of the current session, reported and dropped once finished
+_SESSION_KEY = "_write_jobs"
+
+# Job run by the current worker thread, for report_progress()
+_current_job = contextvars.ContextVar("write_job", default=None)
+
+
+class WriteJob:
+    """One queued write: fn(*args, **kwargs) returning a {'success': ...} dict"""
+
+    def __init__(self, job_id, label, fn, args, kwargs, session_id=None, key=None,
+                 idempotent=False, on_failure=None, on_success=None):
+        self.id = job_id
+        self.label = label
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.session_id = session_id
+        self.key = key
+        self.idempotent = idempotent
+        self.on_failure = on_failure
+        self.on_success = on_success
+        self.status = PENDING
+        self.result = None
+        self.attempts = 0
+        self.progress = 0.0
+        self.progress_text = ''
+        self.submitted = time.time()
+        self.finished = None
+
+    @property
+    def done(self):
+        return self.status in (DONE, FAILED)
+
+    def message(self):
+        """Error text of a failed job"""
+        result = self.result or {}
+        return result.get('error', result.get('message', ''))
+
+
+class WriteExecutor:
+    """
+    Worker threads consuming a FIFO queue of write jobs.
+    One worker (the default) keeps the writes in submission order. A job
+    submitted with the key of a job that is still queued or running is not
+    queued twice (double clicks, reruns). Idempotent jobs, such as the
+    diff-based commit_edits that only sends cells still differing, are
+    retried with backoff on errors; rejected writes ('message'/'conflict'
+    results) are never retried. Finished jobs of a session stay in the
+    status store until the session collects them (forget), or for
+    unclaimed_ttl seconds if it never comes back.
+    """
+
+    def __init__(self, workers=1, max_attempts=3, retry_delay=2.0, keep=200, unclaimed_ttl=86400.0):
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.keep = keep
+        self.unclaimed_ttl = unclaimed_ttl
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._jobs = {}    # job id -> WriteJob, in submission order
+        self._active = {}  # key -> id of the queued/running job
+        self._ids = itertools.count(1)
+        self.retries = 0
+        for i in range(max(1, workers)):
+            threading.Thread(target=self._work, name=f"write-worker-{i}", daemon=True).start()
+
+    def submit(self, label, fn, *args, session_id=None, key=None, idempotent=False,
+               on_failure=None, on_success=None, **kwargs):
+        """Queue fn(*args, **kwargs) and return the job id"""
+        with self._lock:
+            if key is not None and key in self._active:
+                return self._active[key]
+            job = WriteJob(next(self._ids), label, fn, args, kwargs, session_id, key,
+                           idempotent, on_failure, on_success)
+            self._jobs[job.id] = job
+            if key is not None:
+                self._active[key] = job.id
+            self._prune()
+        self._queue.put(job)
+        return job.id
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def forget(self, job_id):
+        """Drop a finished job from the status store"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None and job.done:
+                del self._jobs[job_id]
+
+    def _prune(self):
+        """
+        Drop the oldest finished jobs beyond keep that nobody will report:
+        jobs without a session, and session jobs older than unclaimed_ttl.
+        A failed job must reach its session, which puts its edits back.
+        """
+        excess = len(self._jobs) - self.keep
+        if excess <= 0:
+            return
+        now = time.time()
+        for job_id, job in list(self._jobs.items()):
+            if excess <= 0:
+                break
+            if job.done and (job.session_id is None or now - job.finished > self.unclaimed_ttl):
+                del self._jobs[job_id]
+                excess -= 1
+
+    def _work(self):
+        while True:
+            job = self._queue.get()
+            try:
+                self._run(job)
+            finally:
+                self._queue.task_done()
+
+    def _run(self, job):
+        job.status = RUNNING
+        token = _current_job.set(job)
+        try:
+            result = self._attempts(job)
+        finally:
+            _current_job.reset(token)
+
+        with self._lock:
+            job.result = result
+            job.status = DONE if result.get('success') else FAILED
+            job.finished = time.time()
+            if job.key is not None and self._active.get(job.key) == job.id:
+                del self._active[job.key]
+
+    def _attempts(self, job):
+        while True:
+            job.attempts += 1
+            # The user already got the page back; interactive reads go first
+            with background_requests(), track_api_failures() as api_failures:
+                try:
+                    result = job.fn(*job.args, **job.kwargs)
+                except Exception as e:
+                    result = {'success': False, 'error': str(e)}
+            if not isinstance(result, dict):
+                result = {'success': bool(result)}
+
+            # Failed API requests already went through the client's retry
+            # loop; re-running the job would multiply those attempts
+            retry = (not result.get('success') and 'error' in result and not result.get('conflict')
+                     and not api_failures and job.idempotent and job.attempts < self.max_attempts)
+            if not retry:
+                return result
+            with self._lock:
+                self.retries += 1
+            print(f"Write job '{job.label}' failed ({result['error']}), retrying")
+            time.sleep(self.retry_delay * (2 ** (job.attempts - 1)))
+
+    def stats(self):
+        """Get job counts per status and the retry counter"""
+        with self._lock:
+            counts = {PENDING: 0, RUNNING: 0, DONE: 0, FAILED: 0}
+            for job in self._jobs.values():
+                counts[job.status] += 1
+            return {'jobs': counts, 'queued': self._queue.qsize(), 'retries': self.retries}
+
+
+@st.cache_resource
+def get_write_executor():
+    """Get the process-wide write executor"""
+    return WriteExecutor(
+        workers=int(get_float_setting("write_workers", 1)),
+        max_attempts=int(get_float_setting("write_max_attempts", 3)),
+    )
+
+
+@st.cache_resource
+def get_export_executor():
+    """Get the process-wide executor generating export files on request"""
+    # Uncollected exports hold whole files: not kept long past a closed tab
+    return WriteExecutor(
+        workers=int(get_float_setting("export_workers", 1)),
+        unclaimed_ttl=get_float_setting("export_unclaimed_seconds", 900.0),
+    )
+
+
+def report_progress(fraction, text=''):
+    """Report the progress (0..1) of the job running in this thread; no-op outside a job"""
+    job = _current_job.get()
+    if job is not None:
+        job.progress = min(max(float(fraction), 0.0), 1.0)
+        job.progress_text = text
+
+
+def submit_session_job(executor, label, fn, *args, key=None, **kwargs):
+    """Queue fn on executor for the current session (key deduplicated per session)"""
+    ctx = get_script_run_ctx(suppress_warning=True)
+    session_id = ctx.session_id if ctx else None
+    return executor.submit(
+        label, fn, *args, session_id=session_id,
+        key=(session_id, key) if key is not None else None, **kwargs,
+    )
+
+
+def submit_write(label, fn, *args, key=None, idempotent=False, on_failure=None, on_success=None, **kwargs):
+    """
+    Queue a write for the current session and return its job id at once.
+    on_failure() / on_success() are called from the session's script run when
+    the outcome is reported (e.g. to put staged edits back).
+    """
+    job_id = submit_session_job(
+        get_write_executor(), label, fn, *args, key=key,
+        idempotent=idempotent, on_failure=on_failure, on_success=on_success, **kwargs,
+    )
+    job_ids = st.session_state.setdefault(_SESSION_KEY, [])
+    if job_id not in job_ids:
+        job_ids.append(job_id)
+    return job_id
+
+
+def session_jobs():
+    """Get the jobs of the current session that were not reported yet"""
+    executor = get_write_executor()
+    jobs = [executor.get(job_id) for job_id in st.session_state.get(_SESSION_KEY, [])]
+    return [job for job in jobs if job is not None]
+
+
+def pending_jobs():
+    """Get the queued/running jobs of the current session"""
+    return [job for job in session_jobs() if not job.done]
+
+
+def collect_finished():
+    """Take the finished jobs of the current session out of the status store"""
+    executor = get_write_executor()
+    finished = [job for job in session_jobs() if job.done]
+    if finished:
+        done_ids = {job.id for job in finished}
+        st.session_state[_SESSION_KEY] = [
+            job_id for job_id in st.session_state.get(_SESSION_KEY, [])
+            if job_id not in done_ids and executor.get(job_id) is not None
+        ]
+        for job in finished:
+            executor.forget(job.id)
+    return finished
+
+
+@st.fragment(run_every=1.0)
+def _pending_badge():
+    """Polls the status store while jobs are pending; reruns the page once they finish"""
+    pending = pending_jobs()
+    if len(pending) < len(session_jobs()):
+        st.rerun(scope="app")
+    if pending:
+        labels = ", ".join(job.label for job in pending)
+        st.info(f"⏳ Menyimpan ({len(pending)}): {labels}")
+
+
+def render_write_status():
+    """Report finished writes of the session and show a pending badge in the sidebar"""
+    for job in collect_finished():
+        if job.status == DONE:
+            if job.on_success is not None:
+                job.on_success()
+            st.toast(f"✅ {job.label} tersimpan")
+        else:
+            if job.on_failure is not None:
+                job.on_failure()
+            st.sidebar.error(f"❌ {job.label} gagal: {job.message()}")
+
+    if pending_jobs():
+        with st.sidebar:
+            _pending_badge()